@@ -0,0 +1,319 @@
+"""
+Offline, resumable batch analysis of a conversation corpus.
+
+    python batch_process.py corpus/ --output results.jsonl --workers 8
+    python batch_process.py conversations.jsonl --output results.jsonl
+    cat conversations.jsonl | python batch_process.py - --output results.jsonl
+    python batch_process.py corpus/ --output results/ --format parquet
+
+Documents are sharded across worker processes that each build one pipeline.
+Every finished document is appended to the output JSONL as
+{"document_id", "status", "processing_time", "results" | "error"}; the output
+doubles as the checkpoint, so re-running the same command after an
+interruption skips documents that already completed and retries failures.
+With --format parquet/arrow the output is a directory of columnar tables
+(see medical_nlp_columnar.py) and failures are only logged. When the input is
+a single .jsonl file or a --separator text file, entities also carry
+file_start / file_end byte offsets into that file.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import replace
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from medical_nlp_concurrency import ConcurrencyPlan, apply_concurrency, available_cpus, plan_concurrency
+from medical_nlp_corpus import MappedCorpus, iter_jsonl_documents, iter_path_documents
+
+logger = logging.getLogger("batch_process")
+
+_worker_pipeline = None
+
+
+def _init_worker(plan: ConcurrencyPlan):
+    """Build the pipeline once per worker process"""
+    global _worker_pipeline
+    # Ctrl-C is handled by the parent, which lets in-progress documents finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    apply_concurrency(plan)
+    from medical_nlp_pipeline import MedicalTranscriptionPipeline
+
+    # Per-document stage logs would drown out the throughput reports
+    for name in ("medical_nlp_pipeline", "medical_nlp_scheduler"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    _worker_pipeline = MedicalTranscriptionPipeline(stage_workers=1)
+
+
+def _analyze_document(document: Tuple[str, str]) -> Dict[str, Any]:
+    document_id, text = document
+    start = time.perf_counter()
+    try:
+        if not text.strip():
+            raise ValueError("Empty document")
+        results = _worker_pipeline.process_conversation(text)
+        return {"document_id": document_id, "status": "completed",
+                "processing_time": time.perf_counter() - start, "results": results}
+    except Exception as e:
+        return {"document_id": document_id, "status": "failed",
+                "processing_time": time.perf_counter() - start, "error": str(e)}
+
+
+class JsonlSink:
+    """Appends one JSON record per document; the file is its own checkpoint"""
+
+    # A checkpoint is only an fsync
+    default_checkpoint_every = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed = self._load_checkpoint()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load_checkpoint(self) -> Set[str]:
+        """Ids of documents already completed in the output
+
+        A line cut short by an interrupted run is truncated away so appends
+        start on a clean line.
+        """
+        completed: Set[str] = set()
+        if not os.path.exists(self.path):
+            return completed
+
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                valid_bytes += len(line)
+                if record.get("status") == "completed":
+                    completed.add(record["document_id"])
+
+        if valid_bytes < os.path.getsize(self.path):
+            logger.warning(f"Discarding incomplete trailing record in {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return completed
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+
+    def checkpoint(self):
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.checkpoint()
+        self._file.close()
+
+
+class ColumnarSink:
+    """Writes completed documents as columnar tables; each checkpoint seals a part file
+
+    Checkpoints are far apart by default so each part holds many full row
+    groups; checkpointing every few hundred documents would leave thousands
+    of tiny files with one short row group each.
+    """
+
+    default_checkpoint_every = 20000
+
+    def __init__(self, directory: str, format: str):
+        from medical_nlp_columnar import ColumnarResultWriter, read_completed_ids
+
+        self.completed = read_completed_ids(directory)
+        self._writer = ColumnarResultWriter(directory, format=format)
+
+    def write(self, record: Dict[str, Any]):
+        if record["status"] == "completed":
+            self._writer.write(record["document_id"], record["results"])
+        else:
+            logger.warning(f"{record['document_id']} failed: {record['error']}")
+
+    def checkpoint(self):
+        self._writer.rotate()
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(output: str, format: str):
+    if format == "jsonl":
+        return JsonlSink(output)
+    return ColumnarSink(output, format)
+
+
+# Maps a document's entity dicts to copies carrying file_start / file_end
+EntityLocator = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+def open_mapped_corpus(source: str, separator: Optional[str] = None) -> Optional[MappedCorpus]:
+    """Memory-map a single .jsonl or --separator text file; None for directories, other files and stdin"""
+    if source == "-" or not os.path.isfile(source):
+        return None
+    if separator is None and not source.lower().endswith(".jsonl"):
+        return None
+    text_separator = separator.encode().decode("unicode_escape").encode() if separator else b"\f"
+    return MappedCorpus(source, format=None if separator is None else "text", separator=text_separator)
+
+
+def iter_input(source: str, corpus: Optional[MappedCorpus] = None) -> Iterator[Tuple[str, str, Optional[EntityLocator]]]:
+    """(document_id, text, locator) triples; the locator is only set when reading a memory-mapped `corpus`
+
+    Locators read the mapping, so the caller keeps `corpus` open until every
+    located document has been drained.
+    """
+    if corpus is not None:
+        # Large single-file corpora are memory-mapped and read through their offset index
+        for document in corpus:
+            yield document.document_id, document.text, partial(corpus.file_offsets, document)
+    elif source == "-":
+        for document_id, text in iter_jsonl_documents(sys.stdin):
+            yield document_id, text, None
+    else:
+        for document_id, text in iter_path_documents(source):
+            yield document_id, text, None
+
+
+class ThroughputMeter:
+    """Documents per second overall and since the last report"""
+
+    def __init__(self, report_every: float):
+        self.report_every = report_every
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.failed = 0
+        self._last_report = (self.started, 0)
+
+    def record(self, status: str):
+        self.processed += 1
+        if status != "completed":
+            self.failed += 1
+        now = time.perf_counter()
+        last_time, last_count = self._last_report
+        if now - last_time >= self.report_every:
+            recent = (self.processed - last_count) / (now - last_time)
+            logger.info(f"{self.processed} documents ({self.failed} failed), "
+                        f"{self.docs_per_sec:.1f} docs/s overall, {recent:.1f} docs/s recent")
+            self._last_report = (now, self.processed)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+def run_batch(args) -> Dict[str, Any]:
+    sink = open_sink(args.output, args.format)
+    completed = sink.completed
+    if completed:
+        logger.info(f"Resuming: {len(completed)} documents already completed in {args.output}")
+
+    checkpoint_every = args.checkpoint_every or sink.default_checkpoint_every
+    workers = args.workers or available_cpus()
+    # Worker processes already use every core, so stages within a document run in sequence
+    plan = replace(plan_concurrency(api_workers=workers), stage_workers=1)
+    max_in_flight = workers * args.prefetch
+    meter = ThroughputMeter(args.report_every)
+    skipped = 0
+    interrupted = False
+
+    # Opened before the executor and closed after it, so locators of documents still in flight can read the mapping
+    with open_mapped_corpus(args.input, args.separator) or nullcontext() as corpus, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(plan,)) as executor:
+        in_flight = set()
+        locators: Dict[Any, EntityLocator] = {}
+        since_checkpoint = 0
+
+        def drain(return_when):
+            nonlocal in_flight, since_checkpoint
+            done, in_flight = wait(in_flight, return_when=return_when)
+            for future in done:
+                record = future.result()
+                locator = locators.pop(future, None)
+                if locator is not None and record["status"] == "completed":
+                    results = record["results"]
+                    results["entities"] = locator(results.get("entities") or [])
+                sink.write(record)
+                meter.record(record["status"])
+                since_checkpoint += 1
+            if since_checkpoint >= checkpoint_every:
+                sink.checkpoint()
+                since_checkpoint = 0
+
+        try:
+            # Reading the next documents overlaps with the workers analyzing
+            # the up to `max_in_flight` already submitted
+            for document_id, text, locator in iter_input(args.input, corpus):
+                if document_id in completed:
+                    skipped += 1
+                    continue
+                if len(in_flight) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+                future = executor.submit(_analyze_document, (document_id, text))
+                in_flight.add(future)
+                if locator is not None:
+                    locators[future] = locator
+            while in_flight:
+                drain(FIRST_COMPLETED)
+        except KeyboardInterrupt:
+            interrupted = True
+            logger.warning("Interrupted; finishing documents in progress")
+            for future in in_flight:
+                future.cancel()
+            in_flight = {future for future in in_flight if not future.cancelled()}
+            drain(ALL_COMPLETED)
+        finally:
+            sink.close()
+
+    return {
+        "processed": meter.processed,
+        "failed": meter.failed,
+        "skipped": skipped,
+        "workers": workers,
+        "threads_per_worker": plan.intra_op_threads,
+        "elapsed": round(meter.elapsed, 3),
+        "docs_per_sec": round(meter.docs_per_sec, 2),
+        "interrupted": interrupted
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Analyze a corpus of conversations across worker processes")
+    parser.add_argument("input", help="Directory of .txt/.json/.jsonl files, a corpus file, or - for JSONL on stdin")
+    parser.add_argument("--output", required=True,
+                        help="Results JSONL, or a directory for columnar formats; also the resume checkpoint")
+    parser.add_argument("--format", choices=["jsonl", "parquet", "arrow"], default="jsonl")
+    parser.add_argument("--separator", default=None,
+                        help="Treat a single text file as many transcripts split on this string, e.g. '\\f'")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: available cores)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Documents queued per worker")
+    parser.add_argument("--checkpoint-every", type=int, default=None,
+                        help="Make the output durable every N documents (default: 100 for JSONL, "
+                             "20000 for columnar formats, where each checkpoint seals a part file)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between throughput reports")
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = build_parser().parse_args()
+    summary = run_batch(args)
+    print(json.dumps(summary, indent=2))
+    if summary["interrupted"]:
+        print(f"Interrupted; run the same command again to resume from {args.output}")
+        sys.exit(130)
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,113 @@
+"""
+Throughput and latency of concurrent entity / sentiment requests with and without micro-batching.
+
+    python benchmark_batching.py                         # NER, 512 requests, 64 concurrent clients
+    python benchmark_batching.py --component sentiment --use-model
+    python benchmark_batching.py --batch-sizes 8 32 64 --wait-ms 2 5
+
+Each configuration replays the same utterances from `--concurrency` client
+coroutines: "unbatched" runs one model call per request on the thread pool
+(what the endpoints did before), every other row goes through a MicroBatcher.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from medical_nlp_batching import MicroBatcher
+
+UTTERANCES = [
+    "I had a car accident on September 1st and my neck and back hurt a lot.",
+    "The pain was really bad the first four weeks, I had trouble sleeping.",
+    "I went through ten physiotherapy sessions and took painkillers regularly.",
+    "I'm doing better, but I still have some discomfort in my lower back.",
+    "Doctor said it was a whiplash injury and I should expect a full recovery.",
+    "I'm worried the stiffness will come back when I go back to work.",
+    "My headaches stopped after the second week but the backache is occasional.",
+    "Ms. Jones, your range of motion looks good and there is no tenderness.",
+]
+
+
+async def run_clients(call: Callable[[str], Any], texts: List[str], concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    queue = list(texts)
+
+    async def client():
+        while queue:
+            text = queue.pop()
+            start = time.perf_counter()
+            await call(text)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests_per_sec": round(len(texts) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2)
+    }
+
+
+def build_component(args):
+    if args.component == "ner":
+        from medical_nlp_pipeline import MedicalNERExtractor
+        extractor = MedicalNERExtractor()
+        return extractor.extract_entities, extractor.extract_entities_batch
+    from medical_nlp_pipeline import MedicalSentimentAnalyzer
+    analyzer = MedicalSentimentAnalyzer(use_model=args.use_model)
+    return analyzer.analyze, analyzer.analyze_batch
+
+
+async def benchmark(args) -> List[Dict[str, Any]]:
+    single, batch = build_component(args)
+    rng = random.Random(args.seed)
+    texts = [rng.choice(UTTERANCES) for _ in range(args.requests)]
+    # Warm up lazy model initialisation outside the timings
+    batch(texts[:8])
+
+    rows = [{"mode": "unbatched",
+             **await run_clients(lambda text: run_in_threadpool(single, text), texts, args.concurrency)}]
+    for batch_size in args.batch_sizes:
+        for wait_ms in args.wait_ms:
+            batcher = MicroBatcher(batch, max_batch_size=batch_size, max_wait_ms=wait_ms)
+            result = await run_clients(batcher.submit, texts, args.concurrency)
+            stats = batcher.stats()
+            rows.append({"mode": f"batch={batch_size} wait={wait_ms}ms", **result,
+                         "mean_batch_size": stats["mean_batch_size"]})
+    return rows
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched entity / sentiment requests")
+    parser.add_argument("--component", choices=["ner", "sentiment"], default="ner")
+    parser.add_argument("--use-model", action="store_true", help="Use the transformer for sentiment")
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[2.0, 5.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    rows = asyncio.run(benchmark(args))
+    print(f"{'mode':<24} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for row in rows:
+        print(f"{row['mode']:<24} {row['requests_per_sec']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row.get('mean_batch_size', 1):>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    sys.exit(0)
@@ -0,0 +1,144 @@
+"""
+Find the worker / thread split that gives the best throughput on this box.
+
+    python benchmark_concurrency.py                       # try every split of the available cores
+    python benchmark_concurrency.py --documents 400 --max-p95-ms 250
+    python benchmark_concurrency.py --workers 1 2 4 --threads 1 2
+
+Each candidate runs `workers` processes, configured with
+medical_nlp_concurrency for `threads` intra-op / BLAS threads each, that
+analyze the same synthetic transcripts with the full pipeline (utterance
+cache disabled). An "untuned" row gives every worker all cores, which is
+what happens without a plan. The recommendation is the highest-throughput
+candidate whose p95 document latency stays within --max-p95-ms, printed as
+the environment variables to deploy.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from medical_nlp_concurrency import ConcurrencyPlan, apply_concurrency, available_cpus, plan_concurrency
+from medical_nlp_warmup import SYNTHETIC_TRANSCRIPT
+
+_worker_pipeline = None
+
+
+def _init_worker(plan: ConcurrencyPlan):
+    global _worker_pipeline
+    os.environ["MEDICAL_NLP_UTTERANCE_CACHE_SIZE"] = "0"
+    apply_concurrency(plan)
+    import logging
+    from medical_nlp_pipeline import MedicalTranscriptionPipeline
+    for name in ("medical_nlp_pipeline", "medical_nlp_scheduler", "medical_nlp_concurrency"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    _worker_pipeline = MedicalTranscriptionPipeline()
+    _worker_pipeline.process_conversation(SYNTHETIC_TRANSCRIPT)
+
+
+def _analyze(text: str) -> float:
+    start = time.perf_counter()
+    _worker_pipeline.process_conversation(text)
+    return time.perf_counter() - start
+
+
+def synthetic_documents(count: int, seed: int) -> List[str]:
+    """Shuffled, resized variants of the synthetic transcript so documents differ in length"""
+    rng = random.Random(seed)
+    lines = SYNTHETIC_TRANSCRIPT.splitlines()
+    documents = []
+    for _ in range(count):
+        documents.append("\n".join(rng.choice(lines) for _ in range(rng.randint(len(lines), 4 * len(lines)))))
+    return documents
+
+
+def run_candidate(plan: ConcurrencyPlan, documents: List[str]) -> Dict[str, Any]:
+    with ProcessPoolExecutor(plan.api_workers, initializer=_init_worker, initargs=(plan,)) as executor:
+        # Wait for every worker to finish loading before timing
+        list(executor.map(_analyze, documents[:plan.api_workers]))
+        start = time.perf_counter()
+        latencies = np.array(list(executor.map(_analyze, documents))) * 1000
+        elapsed = time.perf_counter() - start
+    return {
+        "docs_per_sec": round(len(documents) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1)
+    }
+
+
+def candidate_plans(cpus: int, workers: Optional[List[int]], threads: Optional[List[int]]) -> List[ConcurrencyPlan]:
+    powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cpus]
+    plans = []
+    for worker_count in workers or sorted(set(powers + [cpus])):
+        for thread_count in threads or powers:
+            if threads is None and worker_count * thread_count > cpus:
+                continue
+            plan = plan_concurrency(cpus, api_workers=worker_count)
+            plans.append(replace(plan, intra_op_threads=thread_count, blas_threads=thread_count,
+                                 stage_workers=min(plan.stage_workers, thread_count)))
+    return plans
+
+
+def tune(args) -> Dict[str, Any]:
+    cpus = args.cpus or available_cpus()
+    documents = synthetic_documents(args.documents, args.seed)
+    rows = []
+
+    for plan in candidate_plans(cpus, args.workers, args.threads):
+        result = run_candidate(plan, documents)
+        rows.append({"workers": plan.api_workers, "threads": plan.intra_op_threads, **result, "plan": plan})
+        print(f"workers={plan.api_workers:<3} threads={plan.intra_op_threads:<3} "
+              f"{result['docs_per_sec']:>8} docs/s  p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms")
+
+    if args.untuned and cpus > 1:
+        worker_count = max(row["workers"] for row in rows)
+        untuned = replace(plan_concurrency(cpus, api_workers=worker_count), intra_op_threads=cpus, blas_threads=cpus)
+        result = run_candidate(untuned, documents)
+        print(f"untuned: workers={worker_count} threads={cpus} {result['docs_per_sec']} docs/s  "
+              f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms")
+
+    eligible = [row for row in rows if args.max_p95_ms is None or row["p95_ms"] <= args.max_p95_ms]
+    best = max(eligible or rows, key=lambda row: row["docs_per_sec"])
+    return {
+        "cpus": cpus,
+        "candidates": [{key: value for key, value in row.items() if key != "plan"} for row in rows],
+        "recommended": asdict(best["plan"]),
+        "environment": best["plan"].as_env(),
+        "within_latency_target": bool(eligible)
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark worker / thread splits and recommend a concurrency plan")
+    parser.add_argument("--cpus", type=int, default=None, help="Cores to plan for (default: available cores)")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Worker counts to try")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Threads per worker to try")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Only recommend plans within this p95")
+    parser.add_argument("--no-untuned", dest="untuned", action="store_false",
+                        help="Skip the all-cores-per-worker baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = tune(args)
+    print("\nRecommended settings:")
+    for name, value in report["environment"].items():
+        print(f"  {name}={value}")
+    if not report["within_latency_target"]:
+        print(f"No candidate met --max-p95-ms {args.max_p95_ms}; showing the fastest")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0)
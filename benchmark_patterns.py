@@ -0,0 +1,245 @@
+"""
+Fuzz and latency benchmark for the rule-based NER, diagnosis and prognosis patterns.
+
+    python benchmark_patterns.py                      # linearity check on adversarial inputs
+    python benchmark_patterns.py --legacy             # include the old unbounded patterns
+    python benchmark_patterns.py fuzz --cases 2000    # old in-sentence matches are preserved
+    python benchmark_patterns.py summary-scan         # summarizer scans vs one combined alternation
+
+Each pattern is timed on adversarial inputs of doubling size. Linear patterns
+take ~2x as long when the input doubles; the check fails if any pattern grows
+by more than --max-growth per doubling.
+
+summary-scan times SummaryFeatureExtractor.extract() against walking a
+single alternation of every summarizer signal (cues, diagnosis and
+prognosis captures, dates, titles) once with finditer over the lower-cased
+transcript. Python's re only skips ahead to a literal prefix when the
+pattern starts with one, so the combined alternation tries every position
+and loses to the separate scans.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+from medical_nlp_lexicon import load_source_tables
+from medical_nlp_pipeline import (DIAGNOSIS_PATTERNS, MAX_PHRASE_CHARS, MONTHS, PAIN_SCALE_PATTERN,
+                                  PROGNOSIS_PATTERNS, SEVERITY_CUES, STATUS_CUES, SummaryFeatureExtractor)
+
+MEDICAL_PATTERNS = load_source_tables()["medical_patterns"]
+
+LEGACY_PATTERNS = {
+    "symptom_span": r"\b(difficulty|trouble|unable to)\b.*\b(sleep|move|walk)\b",
+    "diagnosed_with": r"diagnosed with (.+?)(?:\.|,|and)",
+    "it_was_a": r"it was a (.+?)(?:\.|,|and)",
+    "expect": r"expect(?:ed)? (?:to|you) (.+?)(?:\.|,)",
+    "recovery": r"recovery (.+?)(?:\.|,)",
+    "pain_scale": r"(\d+)\s*(?:out of|/)?\s*10",
+}
+
+CURRENT_PATTERNS = {
+    "symptom_span": MEDICAL_PATTERNS["SYMPTOM"][2],
+    "diagnosed_with": DIAGNOSIS_PATTERNS[0],
+    "it_was_a": DIAGNOSIS_PATTERNS[1],
+    "expect": PROGNOSIS_PATTERNS[0],
+    "recovery": PROGNOSIS_PATTERNS[1],
+    "pain_scale": PAIN_SCALE_PATTERN,
+}
+
+# Inputs that make a pattern start many matches which never find their terminator
+ADVERSARIAL_INPUTS: Dict[str, Callable[[int], str]] = {
+    "symptom_span": lambda n: ("trouble " * (n // 8 + 1))[:n],
+    "diagnosed_with": lambda n: ("diagnosed with " * (n // 15 + 1))[:n],
+    "it_was_a": lambda n: ("it was a " * (n // 9 + 1))[:n],
+    "expect": lambda n: ("expect to " * (n // 10 + 1))[:n],
+    "recovery": lambda n: ("recovery " * (n // 9 + 1))[:n],
+    "pain_scale": lambda n: "1" + " " * (n - 1),
+}
+
+FUZZ_VOCABULARY = [
+    "trouble", "difficulty", "unable to", "sleep", "move", "walk", "diagnosed with", "it was a",
+    "said it was", "expect to", "expected you", "recovery", "prognosis is", "and", "pain",
+    "whiplash", "injury", "full", "within", "six", "months", "7", "out of", "10", "/",
+    ".", ",", "!", "\n", "the", "neck", "back",
+]
+
+
+def time_pattern(pattern: str, text: str, repeats: int) -> float:
+    compiled = re.compile(pattern, re.IGNORECASE)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in compiled.finditer(text):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def linearity_report(patterns: Dict[str, str], sizes: List[int], repeats: int) -> Dict[str, Dict]:
+    report = {}
+    for name, pattern in patterns.items():
+        timings = [time_pattern(pattern, ADVERSARIAL_INPUTS[name](size), repeats) for size in sizes]
+        growth = [later / earlier if earlier else 0.0 for earlier, later in zip(timings, timings[1:])]
+        report[name] = {
+            "timings_ms": [t * 1000 for t in timings],
+            "growth_per_doubling": growth,
+            "max_growth": max(growth) if growth else 0.0,
+            "us_per_kchar": timings[-1] * 1e6 / (sizes[-1] / 1000),
+        }
+    return report
+
+
+def print_report(title: str, report: Dict[str, Dict], sizes: List[int]):
+    print(f"\n{title}")
+    header = f"{'pattern':<16}" + "".join(f"{size:>11}" for size in sizes) + f"{'growth':>9}"
+    print(header)
+    for name, row in report.items():
+        cells = "".join(f"{ms:>9.2f}ms" for ms in row["timings_ms"])
+        print(f"{name:<16}{cells}{row['max_growth']:>8.2f}x")
+
+
+def cmd_linearity(args):
+    sizes = [args.start_size * 2 ** i for i in range(args.doublings + 1)]
+    report = {"current": linearity_report(CURRENT_PATTERNS, sizes, args.repeats)}
+    print_report("Current patterns (ms per pass, adversarial input)", report["current"], sizes)
+
+    if args.legacy:
+        legacy_sizes = [size for size in sizes if size <= args.legacy_max_size]
+        report["legacy"] = linearity_report(LEGACY_PATTERNS, legacy_sizes, 1)
+        print_report("Legacy patterns", report["legacy"], legacy_sizes)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"sizes": sizes, **report}, f, indent=2)
+
+    failures = [name for name, row in report["current"].items() if row["max_growth"] > args.max_growth]
+    if failures:
+        print(f"\nSuper-linear growth (> {args.max_growth}x per doubling): {', '.join(failures)}")
+        return 1
+    print(f"\nAll patterns within {args.max_growth}x per doubling")
+    return 0
+
+
+def random_text(rng: random.Random, max_words: int) -> str:
+    return " ".join(rng.choice(FUZZ_VOCABULARY) for _ in range(rng.randint(1, max_words)))
+
+
+def cmd_fuzz(args):
+    """Every old match that stays within one sentence must still be found, unchanged
+
+    Old lazy captures could start with a comma ("it was a , ..."); those are
+    artifacts of the unbounded patterns and are not expected to match.
+    """
+    rng = random.Random(args.seed)
+    mismatches = 0
+    for case in range(args.cases):
+        text = random_text(rng, args.max_words)
+        for name, pattern in CURRENT_PATTERNS.items():
+            current = {m.span() for m in re.finditer(pattern, text, re.IGNORECASE)}
+            expected = {
+                m.span() for m in re.finditer(LEGACY_PATTERNS[name], text, re.IGNORECASE)
+                if len(m.group()) <= MAX_PHRASE_CHARS
+                and not re.search(r"[.!?\n]", m.group()[:-1]) and "," not in m.group(1)
+            }
+            missing = expected - current
+            if missing:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"[{name}] case {case}: {text!r} missing {sorted(missing)}")
+    print(f"{args.cases} fuzz cases, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+def combined_summary_pattern(lookahead: bool) -> re.Pattern:
+    """Every summarizer signal as one alternation of named groups, for the lower-cased transcript
+
+    With `lookahead` the alternation is zero-width, so overlapping signals
+    (a cue inside a diagnosis phrase) are all reported as the separate scans do.
+    """
+    phrase = "[^.,!?\n]{1,%d}?" % MAX_PHRASE_CHARS
+    cues = sorted(SEVERITY_CUES + STATUS_CUES, key=len, reverse=True)
+    alternatives = ["(?P<cue>" + "|".join(re.escape(cue) for cue in cues) + ")"]
+    for prefix, patterns in (("diagnosis", DIAGNOSIS_PATTERNS), ("prognosis", PROGNOSIS_PATTERNS)):
+        for i, pattern in enumerate(patterns):
+            alternatives.append(re.sub(r"\(\[\^[^)]*\)", f"(?P<{prefix}{i}>{phrase})", pattern, count=1))
+    alternatives.append(r"(?P<date>(?:" + "|".join(month.lower() for month in MONTHS) + r")\s+\d{1,2})")
+    alternatives.append(r"(?P<title>mrs?\.|ms\.)\s+\w")
+    combined = "|".join(alternatives)
+    return re.compile(f"(?={combined})" if lookahead else combined)
+
+
+def cmd_summary_scan(args):
+    from medical_nlp_warmup import SYNTHETIC_TRANSCRIPT
+
+    extractor = SummaryFeatureExtractor()
+    variants = {
+        "combined": combined_summary_pattern(lookahead=False),
+        "combined_lookahead": combined_summary_pattern(lookahead=True),
+    }
+    rows = []
+    print(f"{'chars':>9} {'extract() ms':>13}" + "".join(f"{name + ' ms':>22}" for name in variants))
+    for copies in args.copies:
+        text = "\n".join([SYNTHETIC_TRANSCRIPT] * copies)
+        row = {"chars": len(text), "extract_ms": _best_ms(lambda: extractor.extract(text, []), args.repeats)}
+        for name, pattern in variants.items():
+            row[f"{name}_ms"] = _best_ms(lambda: [m.lastgroup for m in pattern.finditer(text.lower())], args.repeats)
+        rows.append(row)
+        print(f"{row['chars']:>9} {row['extract_ms']:>13.3f}"
+              + "".join(f"{row[name + '_ms']:>22.3f}" for name in variants))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+def _best_ms(func: Callable[[], object], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark NER/summarizer regex worst-case behaviour")
+    parser.set_defaults(func=cmd_linearity, start_size=20000, doublings=4, repeats=3,
+                        max_growth=3.0, legacy=False, legacy_max_size=40000, json=None)
+    sub = parser.add_subparsers(dest="command")
+
+    linearity = sub.add_parser("linearity", help="Time patterns on adversarial inputs of doubling size")
+    linearity.add_argument("--start-size", type=int, default=20000)
+    linearity.add_argument("--doublings", type=int, default=4)
+    linearity.add_argument("--repeats", type=int, default=3)
+    linearity.add_argument("--max-growth", type=float, default=3.0)
+    linearity.add_argument("--legacy", action="store_true", help="Also time the old unbounded patterns")
+    linearity.add_argument("--legacy-max-size", type=int, default=40000)
+    linearity.add_argument("--json", help="Write the report to this file")
+    linearity.set_defaults(func=cmd_linearity)
+
+    fuzz = sub.add_parser("fuzz", help="Compare matches with the old patterns on random inputs")
+    fuzz.add_argument("--cases", type=int, default=2000)
+    fuzz.add_argument("--max-words", type=int, default=40)
+    fuzz.add_argument("--seed", type=int, default=7)
+    fuzz.set_defaults(func=cmd_fuzz)
+
+    summary = sub.add_parser("summary-scan", help="Time summarizer feature extraction against one combined scan")
+    summary.add_argument("--copies", type=int, nargs="+", default=[1, 50, 200],
+                         help="Transcript sizes, in copies of the synthetic transcript")
+    summary.add_argument("--repeats", type=int, default=20)
+    summary.add_argument("--json", help="Write the report to this file")
+    summary.set_defaults(func=cmd_summary_scan)
+
+    return parser
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if argv and argv[0].startswith("--") and argv[0] not in ("-h", "--help"):
+        argv = ["linearity"] + argv
+    args = build_parser().parse_args(argv)
+    sys.exit(args.func(args))
@@ -0,0 +1,180 @@
+"""
+Offline tooling for the sentiment classifier inference backends.
+
+    python export_sentiment_model.py export --output models/sentiment-onnx
+    python export_sentiment_model.py validate --onnx-path models/sentiment-onnx
+    python export_sentiment_model.py benchmark --backends torch torch-int8 onnx
+
+Export saves the torch weights next to the ONNX graph. Validation and the
+benchmark load every backend from that saved checkpoint, so they compare
+one classifier across runtimes; loading the base model again would give
+each backend its own randomly initialised head.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from medical_nlp_backends import (DEFAULT_ONNX_PATH, SENTIMENT_BACKENDS, TorchBackend,
+                                  create_sentiment_backend, default_sentiment_model,
+                                  export_onnx, exported_checkpoint)
+
+SAMPLE_UTTERANCES = [
+    "Good morning, doctor. I'm doing better, but I still have some discomfort now and then.",
+    "Yes, I always do.",
+    "At first, I was just shocked. But then I realized I had hit my head on the steering wheel, "
+    "and I could feel pain in my neck and back almost right away.",
+    "The first four weeks were rough. My neck and back pain were really bad—I had trouble "
+    "sleeping and had to take painkillers regularly.",
+    "It's not constant, but I do get occasional backaches. It's nothing like before, though.",
+    "No, nothing like that. I don't feel nervous driving, and I haven't had any emotional issues.",
+    "That's a relief!",
+    "That's great to hear. So, I don't need to worry about this affecting me in the future?",
+    "Thank you, doctor. I appreciate it.",
+    "I'm worried the pain in my lower back is getting worse at night.",
+]
+
+
+def compare_to_reference(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Accuracy drift of candidate logits against the fp32 reference"""
+    return {
+        "label_agreement": float((reference.argmax(axis=1) == candidate.argmax(axis=1)).mean()),
+        "max_abs_logit_diff": float(np.abs(reference - candidate).max()),
+        "mean_abs_logit_diff": float(np.abs(reference - candidate).mean()),
+    }
+
+
+def measure_latency(backend, texts: List[str], batch_size: int, rounds: int) -> Dict[str, float]:
+    """Per-utterance latency and batched throughput for one backend"""
+    backend.predict_logits(texts[:1])
+
+    latencies = []
+    for _ in range(rounds):
+        for text in texts:
+            start = time.perf_counter()
+            backend.predict_logits([text])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    processed = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i in range(0, len(texts), batch_size):
+            backend.predict_logits(texts[i:i + batch_size])
+            processed += len(texts[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "latency_p50_ms": statistics.median(latencies),
+        "latency_p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "throughput_per_s": processed / elapsed if elapsed else 0.0,
+    }
+
+
+def cmd_export(args):
+    files = export_onnx(
+        args.output, model_name=args.model, num_labels=args.num_labels,
+        opset=args.opset, quantize=not args.no_quantize
+    )
+    for path in files:
+        print(f"Wrote {path}")
+    if not args.skip_validation:
+        args.onnx_path = args.output
+        return cmd_validate(args)
+    return 0
+
+
+def cmd_validate(args):
+    checkpoint = exported_checkpoint(args.onnx_path)
+    reference = TorchBackend(model_name=checkpoint, num_labels=args.num_labels)
+    expected = reference.predict_logits(SAMPLE_UTTERANCES)
+
+    candidate = create_sentiment_backend(
+        "onnx", model_name=checkpoint, num_labels=args.num_labels, onnx_path=args.onnx_path
+    )
+    report = compare_to_reference(expected, candidate.predict_logits(SAMPLE_UTTERANCES))
+    report["model_file"] = candidate.model_file
+    print(json.dumps(report, indent=2))
+
+    if report["label_agreement"] < args.min_agreement:
+        print(f"Validation failed: label agreement below {args.min_agreement:.2%}")
+        return 1
+    return 0
+
+
+def cmd_benchmark(args):
+    texts = SAMPLE_UTTERANCES * args.repeat
+    checkpoint = exported_checkpoint(args.onnx_path)
+    reference = TorchBackend(model_name=checkpoint, num_labels=args.num_labels)
+    reference_logits = reference.predict_logits(SAMPLE_UTTERANCES)
+    results = {}
+
+    for name in args.backends:
+        if name == TorchBackend.name:
+            backend = reference
+        else:
+            kwargs = {"model_name": checkpoint, "num_labels": args.num_labels}
+            if name == "onnx":
+                kwargs["onnx_path"] = args.onnx_path
+            backend = create_sentiment_backend(name, **kwargs)
+
+        report = measure_latency(backend, texts, args.batch_size, args.rounds)
+        report.update(compare_to_reference(reference_logits, backend.predict_logits(SAMPLE_UTTERANCES)))
+        results[name] = report
+
+    print(f"{'backend':<12}{'p50 ms':>10}{'p95 ms':>10}{'texts/s':>12}{'agree':>8}{'max diff':>10}")
+    for name, report in results.items():
+        print(
+            f"{name:<12}{report['latency_p50_ms']:>10.2f}{report['latency_p95_ms']:>10.2f}"
+            f"{report['throughput_per_s']:>12.1f}{report['label_agreement']:>8.2%}"
+            f"{report['max_abs_logit_diff']:>10.4f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Export, validate and benchmark sentiment backends")
+    parser.add_argument("--model", default=default_sentiment_model(),
+                        help="Checkpoint to export (validate and benchmark load the exported copy)")
+    parser.add_argument("--num-labels", type=int, default=5)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export the fp32 model to ONNX (+ int8 copy)")
+    export.add_argument("--output", default=DEFAULT_ONNX_PATH)
+    export.add_argument("--opset", type=int, default=14)
+    export.add_argument("--no-quantize", action="store_true")
+    export.add_argument("--skip-validation", action="store_true")
+    export.add_argument("--min-agreement", type=float, default=0.9)
+    export.set_defaults(func=cmd_export)
+
+    validate = sub.add_parser("validate", help="Compare an exported ONNX model against fp32")
+    validate.add_argument("--onnx-path", default=DEFAULT_ONNX_PATH)
+    validate.add_argument("--min-agreement", type=float, default=0.9)
+    validate.set_defaults(func=cmd_validate)
+
+    benchmark = sub.add_parser("benchmark", help="Latency, throughput and drift against fp32")
+    benchmark.add_argument("--backends", nargs="+", default=list(SENTIMENT_BACKENDS),
+                           choices=list(SENTIMENT_BACKENDS))
+    benchmark.add_argument("--onnx-path", default=DEFAULT_ONNX_PATH,
+                           help="Export directory; every backend loads the checkpoint saved there")
+    benchmark.add_argument("--batch-size", type=int, default=8)
+    benchmark.add_argument("--rounds", type=int, default=5)
+    benchmark.add_argument("--repeat", type=int, default=4)
+    benchmark.add_argument("--json", help="Write the report to this file")
+    benchmark.set_defaults(func=cmd_benchmark)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    sys.exit(args.func(args))
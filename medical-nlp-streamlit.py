@@ -5,9 +5,18 @@ import plotly.graph_objects as go
 from datetime import datetime
 import json
 import time
-from typing import Dict, List, Any
+import hashlib
+import html
+from dataclasses import asdict
+import bisect
+import itertools
+import zipfile
+from collections import deque
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from websocket import WebSocketApp
+from medical_nlp_corpus import parse_corpus_file
 import threading
 import streamlit as st
 import os
@@ -116,10 +125,16 @@ def main():
     
     with st.sidebar:
         st.header("⚙️ Settings")
+        execution_mode = st.radio(
+            "Execution Mode",
+            [HTTP_MODE, LOCAL_MODE],
+            help="Local Pipeline runs the NLP pipeline inside this Streamlit process, skipping the HTTP hop"
+        )
         endpoint = st.selectbox(
             "Select API Endpoint",
             [
                 "Full Analysis (/api/v1/analyze)",
+                "Streaming Analysis (/api/v1/analyze/stream)",
                 "Entity Extraction (/api/v1/entities/extract)",
                 "Sentiment Analysis (/api/v1/sentiment/analyze)",
                 "SOAP Note (/api/v1/soap/generate)",
@@ -153,7 +168,7 @@ def main():
         st.header("Medical Conversation Input")
         input_method = st.radio(
             "Choose input method:",
-            ["Use Example", "Paste Text", "Upload File"]
+            ["Use Example", "Paste Text", "Upload File", CORPUS_INPUT]
         )
         
         if input_method == "Use Example":
@@ -168,7 +183,7 @@ def main():
                 placeholder="Doctor: How are you feeling today?\nPatient: I have been experiencing...",
                 height=400
             )
-        else:
+        elif input_method == "Upload File":
             uploaded_file = st.file_uploader(
                 "Upload conversation file",
                 type=["txt", "json"]
@@ -177,6 +192,20 @@ def main():
             if uploaded_file:
                 conversation_text = uploaded_file.read().decode("utf-8")
                 st.text_area("Uploaded content:", value=conversation_text, height=400)
+        else:
+            conversation_text = ""
+            uploaded_files = st.file_uploader(
+                "Upload conversation files or a zip archive",
+                type=["txt", "json", "jsonl", "zip"],
+                accept_multiple_files=True
+            )
+            if uploaded_files and st.button("🚀 Analyze Corpus", type="primary"):
+                try:
+                    st.session_state.corpus_rows = run_corpus(uploaded_files, execution_mode)
+                except (requests.exceptions.RequestException, ValueError, zipfile.BadZipFile) as e:
+                    st.error(f"Failed to process corpus: {str(e)}")
+            if st.session_state.get("corpus_rows"):
+                display_corpus_dashboard(st.session_state.corpus_rows)
         
         st.subheader("Real-Time Transcription")
         if st.button("Start Live Transcription", key="main_start_live"):
@@ -205,134 +234,62 @@ def main():
         if st.session_state.get("live_results"):
             st.write("Live Entities:", st.session_state.live_results)
         
-        if st.button("🚀 Analyze Conversation", type="primary"):
+        if input_method != CORPUS_INPUT and st.button("🚀 Analyze Conversation", type="primary"):
             if conversation_text:
+                request_settings = {
+                    "extract_icd_codes": include_icd_codes,
+                    "include_cpt_codes": include_cpt_codes
+                }
                 with st.spinner("Processing medical conversation..."):
                     try:
-                        endpoint_map = {
-                            "Full Analysis (/api/v1/analyze)": {
-                                "url": f"{API_BASE_URL}/api/v1/analyze",
-                                "payload": {
-                                    "conversation_text": conversation_text,
-                                    "patient_id": "PAT-" + str(int(time.time()))
-                                }
-                            },
-                            "Entity Extraction (/api/v1/entities/extract)": {
-                                "url": f"{API_BASE_URL}/api/v1/entities/extract,
-                                "payload": {"text": conversation_text}
-                            },
-                            "Sentiment Analysis (/api/v1/sentiment/analyze)": {
-                                "url": f"{API_BASE_URL}/api/v1/sentiment/analyze",
-                                "payload": {"text": conversation_text}
-                            },
-                            "SOAP Note (/api/v1/soap/generate)": {
-                                "url": f"{API_BASE_URL}/api/v1/soap/generate",
-                                "payload": {
-                                    "conversation_text": conversation_text,
-                                    "patient_id": "PAT-" + str(int(time.time()))
-                                }
-                            },
-                            "Async Analysis (/api/v1/analyze/async)": {
-                                "url": f"{API_BASE_URL}/api/v1/analyze/async",
-                                "payload": {
-                                    "conversation_text": conversation_text,
-                                    "patient_id": "PAT-" + str(int(time.time()))
-                                }
-                            }
-                        }
-                        
-                        selected = endpoint_map[endpoint]
-                        response = requests.post(
-                            selected["url"],
-                            json=selected["payload"],
-                            timeout=30
-                        )
-                        response.raise_for_status()
-                        results = response.json()
-                        st.write("**API Response**:", results)  
-                        
-                        if endpoint == "Entity Extraction (/api/v1/entities/extract)":
-                            results = {
-                                "entities": results.get("entities", []),
-                                "summary": {},
-                                "sentiment_analysis": [],
-                                "soap_note": {},
-                                "quality_metrics": {"entity_coverage": 0.8, "overall_confidence": 0.8}
-                            }
-                        elif endpoint == "Sentiment Analysis (/api/v1/sentiment/analyze)":
-                            results = {
-                                "entities": [],
-                                "summary": {},
-                                "sentiment_analysis": [{"text": conversation_text, "sentiment": results}],
-                                "soap_note": {},
-                                "quality_metrics": {"overall_confidence": results.get("confidence", 0.8)}
-                            }
-                        elif endpoint == "SOAP Note (/api/v1/soap/generate)":
-                            results = {
-                                "entities": [],
-                                "summary": {},
-                                "sentiment_analysis": [],
-                                "soap_note": results,
-                                "quality_metrics": {"soap_completeness": 0.8, "overall_confidence": 0.8}
-                            }
-                        elif endpoint == "Async Analysis (/api/v1/analyze/async)":
-                            job_id = results["job_id"]
-                            with st.spinner("Waiting for async job to complete..."):
-                                for _ in range(10):
-                                    time.sleep(2)
-                                    job_response = requests.get(
-                                        f"http://localhost:8000/api/v1/jobs/{job_id}",
-                                        timeout=10
-                                    )
-                                    job_response.raise_for_status()
-                                    job_result = job_response.json()
-                                    if job_result["status"] == "completed":
-                                        results = job_result["result"]
-                                        break
-                                else:
-                                    st.error("Async job did not complete in time")
-                                    return
-                        
-                        normalized_results = {
-                            "entities": results.get("entities", []),
-                            "summary": results.get("summary", {}),
-                            "sentiment_analysis": results.get("sentiment_analysis", []),
-                            "soap_note": results.get("soap_note", {}),
-                            "quality_metrics": results.get("quality_metrics", {
-                                "entity_coverage": 0.8,
-                                "summary_completeness": 0.8,
-                                "soap_completeness": 0.8,
-                                "overall_confidence": 0.8
-                            })
-                        }
+                        if endpoint == STREAMING_ENDPOINT:
+                            if execution_mode == LOCAL_MODE:
+                                stages = iter_local_stages(conversation_text)
+                            else:
+                                url, payload = build_endpoint_request(endpoint, conversation_text, request_settings)
+                                stages = iter_http_stages(url, payload)
+                            results = normalize_results(
+                                endpoint,
+                                stream_analysis(stages, tab2, conversation_text),
+                                conversation_text
+                            )
+                        else:
+                            cache_key = (
+                                endpoint,
+                                text_digest(conversation_text),
+                                json.dumps(request_settings, sort_keys=True)
+                            )
+                            if execution_mode == LOCAL_MODE:
+                                results = run_local_analysis(
+                                    *cache_key, get_local_pipeline().lexicon.version, conversation_text
+                                )
+                            else:
+                                results = fetch_analysis(*cache_key, conversation_text)
                         
-                        if not extract_entities:
-                            normalized_results["entities"] = []
-                        if not generate_summary:
-                            normalized_results["summary"] = {}
-                        if not analyze_sentiment:
-                            normalized_results["sentiment_analysis"] = []
-                        if not generate_soap:
-                            normalized_results["soap_note"] = {}
-                        if extract_entities and normalized_results.get("entities"):
-                            normalized_results["entities"] = [
-                                e for e in normalized_results["entities"] if e["confidence"] >= confidence_threshold
-                            ]
-                        
-                        st.session_state.results = normalized_results
+                        st.session_state.results = results
+                        st.session_state.analyzed_text = conversation_text
                         st.session_state.processed = True
                         st.success("✅ Analysis complete!")
+                    except AnalysisError as e:
+                        st.error(str(e))
                     except requests.exceptions.RequestException as e:
                         st.error(f"Failed to process conversation: {str(e)}")
-                        st.error(f"API Error Details: {e.response.text if e.response else 'Unknown'}")
+                        st.error(f"API Error Details: {e.response.text if e.response is not None else 'Unknown'}")
             else:
                 st.error("Please provide conversation text")
     
     if hasattr(st.session_state, 'processed') and st.session_state.processed:
-        results = st.session_state.results
+        results = apply_display_options(st.session_state.results, {
+            "extract_entities": extract_entities,
+            "generate_summary": generate_summary,
+            "analyze_sentiment": analyze_sentiment,
+            "generate_soap": generate_soap,
+            "confidence_threshold": confidence_threshold
+        })
+        analyzed_text = st.session_state.get("analyzed_text", conversation_text)
         with tab2:
             st.write("Entities Data:", results["entities"])  
-            display_entities(results["entities"], conversation_text)
+            display_entities(results["entities"], analyzed_text)
         with tab3:
             st.write("Analysis Data:", results)  
             display_analysis(results)
@@ -344,6 +301,486 @@ def main():
             display_metrics(results["quality_metrics"])
 
 
+HTTP_MODE = "HTTP API"
+LOCAL_MODE = "Local Pipeline"
+STREAMING_ENDPOINT = "Streaming Analysis (/api/v1/analyze/stream)"
+ASYNC_ENDPOINT = "Async Analysis (/api/v1/analyze/async)"
+
+
+class AnalysisError(Exception):
+    """Raised when the API accepted a request but could not produce results"""
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled keep-alive HTTP session shared by every rerun and user session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_endpoint_request(endpoint: str, conversation_text: str, settings: Dict) -> Tuple[str, Dict]:
+    """Return the URL and JSON payload for the selected endpoint"""
+    conversation_payload = {
+        "conversation_text": conversation_text,
+        "patient_id": "PAT-" + str(int(time.time())),
+        "settings": settings
+    }
+    endpoint_map = {
+        "Full Analysis (/api/v1/analyze)": (f"{API_BASE_URL}/api/v1/analyze", conversation_payload),
+        STREAMING_ENDPOINT: (f"{API_BASE_URL}/api/v1/analyze/stream", conversation_payload),
+        "Entity Extraction (/api/v1/entities/extract)": (
+            f"{API_BASE_URL}/api/v1/entities/extract", {"text": conversation_text}
+        ),
+        "Sentiment Analysis (/api/v1/sentiment/analyze)": (
+            f"{API_BASE_URL}/api/v1/sentiment/analyze", {"text": conversation_text}
+        ),
+        "SOAP Note (/api/v1/soap/generate)": (f"{API_BASE_URL}/api/v1/soap/generate", conversation_payload),
+        ASYNC_ENDPOINT: (f"{API_BASE_URL}/api/v1/analyze/async", conversation_payload)
+    }
+    return endpoint_map[endpoint]
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def fetch_analysis(endpoint: str, text_hash: str, settings_key: str, _conversation_text: str) -> Dict:
+    """Call the API once per (endpoint, text hash, settings) and memoize the normalized result"""
+    url, payload = build_endpoint_request(endpoint, _conversation_text, json.loads(settings_key))
+    response = get_http_session().post(url, json=payload, timeout=30)
+    response.raise_for_status()
+    results = response.json()
+    
+    if endpoint == ASYNC_ENDPOINT:
+        job_result = wait_for_job(results["job_id"])
+        if job_result["status"] != "completed":
+            raise AnalysisError(
+                f"Async job did not complete: {job_result['status']}"
+                + (f" ({job_result['error']})" if job_result.get("error") else "")
+            )
+        results = job_result["result"]
+    
+    return normalize_results(endpoint, results, _conversation_text)
+
+
+@st.cache_resource(show_spinner="Loading NLP pipeline...")
+def get_local_pipeline():
+    """Build the in-process pipeline once and share it across reruns and sessions"""
+    from medical_nlp_pipeline import MedicalTranscriptionPipeline
+    local_pipeline = MedicalTranscriptionPipeline()
+    local_pipeline.lexicon.start_watching()
+    return local_pipeline
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def run_local_analysis(endpoint: str, text_hash: str, settings_key: str, lexicon_version: str,
+                       _conversation_text: str) -> Dict:
+    """Local-mode counterpart of fetch_analysis, calling the pipeline directly
+    
+    The lexicon version is part of the cache key so a reloaded bundle is not
+    served results computed with the previous one.
+    """
+    local_pipeline = get_local_pipeline()
+    
+    if endpoint == "Entity Extraction (/api/v1/entities/extract)":
+        entities = local_pipeline.ner_extractor.extract_entities(_conversation_text)
+        results = {"entities": [asdict(e) for e in entities]}
+    elif endpoint == "Sentiment Analysis (/api/v1/sentiment/analyze)":
+        sentiment = local_pipeline.sentiment_analyzer.analyze(_conversation_text)
+        results = {"text": _conversation_text, **asdict(sentiment)}
+    elif endpoint == "SOAP Note (/api/v1/soap/generate)":
+        results = asdict(local_pipeline.soap_generator.generate_soap_note(_conversation_text))
+    else:
+        results = local_pipeline.process_conversation(_conversation_text)
+    
+    return normalize_results(endpoint, results, _conversation_text)
+
+
+def normalize_results(endpoint: str, results: Dict, conversation_text: str) -> Dict:
+    """Map any endpoint's response onto the full-analysis result shape"""
+    if endpoint == "Entity Extraction (/api/v1/entities/extract)":
+        results = {
+            "entities": results.get("entities", []),
+            "summary": {},
+            "sentiment_analysis": [],
+            "soap_note": {},
+            "quality_metrics": {"entity_coverage": 0.8, "overall_confidence": 0.8}
+        }
+    elif endpoint == "Sentiment Analysis (/api/v1/sentiment/analyze)":
+        results = {
+            "entities": [],
+            "summary": {},
+            "sentiment_analysis": [{"text": conversation_text, "sentiment": results}],
+            "soap_note": {},
+            "quality_metrics": {"overall_confidence": results.get("confidence", 0.8)}
+        }
+    elif endpoint == "SOAP Note (/api/v1/soap/generate)":
+        results = {
+            "entities": [],
+            "summary": {},
+            "sentiment_analysis": [],
+            "soap_note": results,
+            "quality_metrics": {"soap_completeness": 0.8, "overall_confidence": 0.8}
+        }
+    
+    return {
+        "entities": results.get("entities", []),
+        "summary": results.get("summary", {}),
+        "sentiment_analysis": results.get("sentiment_analysis", []),
+        "soap_note": results.get("soap_note", {}),
+        "quality_metrics": {
+            "entity_coverage": 0.8,
+            "summary_completeness": 0.8,
+            "soap_completeness": 0.8,
+            "overall_confidence": 0.8,
+            **results.get("quality_metrics", {})
+        }
+    }
+
+
+def apply_display_options(results: Dict, options: Dict) -> Dict:
+    """Apply the sidebar processing options to cached results without another API call"""
+    filtered = dict(results)
+    if not options["extract_entities"]:
+        filtered["entities"] = []
+    if not options["generate_summary"]:
+        filtered["summary"] = {}
+    if not options["analyze_sentiment"]:
+        filtered["sentiment_analysis"] = []
+    if not options["generate_soap"]:
+        filtered["soap_note"] = {}
+    if options["extract_entities"] and filtered.get("entities"):
+        filtered["entities"] = [
+            e for e in filtered["entities"] if e["confidence"] >= options["confidence_threshold"]
+        ]
+    return filtered
+
+
+JOB_WAIT_TIMEOUT = 120
+JOB_FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+def wait_for_job(job_id: str, timeout: float = JOB_WAIT_TIMEOUT) -> Dict:
+    """Long-poll the job status endpoint until the job finishes or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        job_response = get_http_session().get(
+            f"{API_BASE_URL}/api/v1/jobs/{job_id}",
+            params={"wait": max(0.0, min(30.0, remaining))},
+            timeout=40
+        )
+        job_response.raise_for_status()
+        job_result = job_response.json()
+        if job_result["status"] in JOB_FINISHED_STATUSES or remaining <= 0:
+            return job_result
+
+
+STREAM_STAGES = ["entities", "sentiment_analysis", "summary", "soap_note", "quality_metrics"]
+
+
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a Server-Sent Events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def iter_http_stages(url: str, payload: Dict):
+    """Yield (stage, result, elapsed) from the streaming analysis endpoint"""
+    with get_http_session().post(url, json=payload, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        for event, data in iter_sse_events(response):
+            if event == "stage":
+                yield data["stage"], data["data"], data["elapsed"]
+            elif event == "error":
+                raise requests.exceptions.RequestException(data["detail"])
+
+
+def iter_local_stages(conversation_text: str):
+    """Yield (stage, result, elapsed) from the in-process pipeline"""
+    start_time = time.perf_counter()
+    for stage, result in get_local_pipeline().iter_stages(conversation_text):
+        yield stage, result, time.perf_counter() - start_time
+
+
+def stream_analysis(stages, entity_tab, conversation_text: str) -> Dict:
+    """Collect streamed stage results, previewing entities as soon as they arrive"""
+    results = {}
+    with entity_tab:
+        entity_preview = st.empty()
+    progress = st.progress(0.0, text="Waiting for first stage...")
+    
+    for stage, data, elapsed in stages:
+        results[stage] = data
+        progress.progress(
+            len(results) / len(STREAM_STAGES),
+            text=f"{stage.replace('_', ' ').title()} ready ({elapsed:.2f}s)"
+        )
+        if stage == "entities":
+            with entity_preview.container():
+                st.markdown(f"**{len(data)} entities** (remaining stages still running)")
+                display_annotated_text(conversation_text, data, key="annotated_text_page_preview")
+    
+    entity_preview.empty()
+    progress.empty()
+    return results
+
+
+CORPUS_INPUT = "Corpus (Batch)"
+CORPUS_CHUNK_SIZE = 50
+CORPUS_MAX_IN_FLIGHT = 200
+CORPUS_MIN_LENGTH = 50
+
+
+def iter_corpus_documents(uploaded_files, on_file=None) -> Iterator[Tuple[str, str]]:
+    """Lazily yield documents from uploaded files, expanding zip archives member by member"""
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(uploaded) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir():
+                        if on_file:
+                            on_file()
+                        yield from parse_corpus_file(member.filename, archive.read(member))
+        else:
+            if on_file:
+                on_file()
+            yield from parse_corpus_file(uploaded.name, uploaded.getvalue())
+
+
+def count_corpus_files(uploaded_files) -> int:
+    """Files in the upload, counting zip members from the archive directory without reading them"""
+    count = 0
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(uploaded) as archive:
+                count += sum(1 for member in archive.infolist() if not member.is_dir())
+        else:
+            count += 1
+    return count
+
+
+def corpus_row(document_id: str, results: Dict, processing_time: Optional[float], status: str = "completed") -> Dict:
+    """Reduce one analysis to the compact record kept for corpus aggregates"""
+    summary = results.get("summary") or {}
+    return {
+        "document_id": document_id,
+        "status": status,
+        "severity_score": summary.get("severity_score"),
+        "symptoms": summary.get("symptoms", []),
+        "entity_count": len(results.get("entities", [])),
+        "processing_time": processing_time
+    }
+
+
+def run_corpus(uploaded_files, execution_mode: str) -> List[Dict]:
+    """Analyze every uploaded document, keeping only compact per-document rows
+
+    Progress is reported per file: counting documents up front would mean
+    parsing every upload twice.
+    """
+    total_files = count_corpus_files(uploaded_files)
+    progress = st.progress(0.0, text=f"0 documents (file 0 / {total_files})")
+    rows = []
+    files_started = 0
+    
+    def on_file():
+        nonlocal files_started
+        files_started += 1
+    
+    def on_row(row):
+        rows.append(row)
+        progress.progress(min(files_started / max(total_files, 1), 1.0),
+                          text=f"{len(rows)} documents (file {files_started} / {total_files})")
+    
+    def analyzable_documents():
+        for document_id, text in iter_corpus_documents(uploaded_files, on_file):
+            if len(text) < CORPUS_MIN_LENGTH:
+                on_row(corpus_row(document_id, {}, None, status="skipped"))
+            else:
+                yield document_id, text
+    
+    if execution_mode == LOCAL_MODE:
+        run_corpus_local(analyzable_documents(), on_row)
+    else:
+        run_corpus_http(analyzable_documents(), on_row)
+    
+    progress.empty()
+    return rows
+
+
+def run_corpus_local(documents, on_row):
+    """Stream the corpus through the in-process pipeline's batch API"""
+    pending_ids = deque()
+    
+    def texts():
+        for document_id, text in documents:
+            pending_ids.append(document_id)
+            yield text
+    
+    start_time = time.perf_counter()
+    for results in get_local_pipeline().process_batch(texts()):
+        finished_at = time.perf_counter()
+        on_row(corpus_row(pending_ids.popleft(), results, finished_at - start_time))
+        start_time = finished_at
+
+
+def run_corpus_http(documents, on_row):
+    """Submit the corpus as one backfill batch, keeping a bounded number of jobs in flight"""
+    session = get_http_session()
+    documents = iter(documents)
+    batch_id, cursor = None, 0
+    in_flight: Dict[str, str] = {}
+    chunk = []
+    exhausted = False
+    
+    while not exhausted or in_flight:
+        rejected = False
+        while not exhausted and len(in_flight) < CORPUS_MAX_IN_FLIGHT:
+            chunk = chunk or list(itertools.islice(documents, CORPUS_CHUNK_SIZE))
+            if not chunk:
+                exhausted = True
+                break
+            response = session.post(
+                f"{API_BASE_URL}/api/v1/analyze/batch",
+                json={
+                    "documents": [
+                        {"document_id": document_id, "conversation_text": text}
+                        for document_id, text in chunk
+                    ],
+                    "batch_id": batch_id,
+                    "priority": "backfill"
+                },
+                timeout=30
+            )
+            if response.status_code == 503:
+                # Server queue is full; drain finished jobs and retry this chunk
+                rejected = True
+                break
+            response.raise_for_status()
+            submitted = response.json()
+            batch_id = submitted["batch_id"]
+            for job_id, (document_id, _) in zip(submitted["job_ids"], chunk):
+                in_flight[job_id] = document_id
+            chunk = []
+        
+        if not in_flight:
+            if rejected:
+                time.sleep(0.5)
+            continue
+        
+        status_response = session.get(
+            f"{API_BASE_URL}/api/v1/batches/{batch_id}", params={"cursor": cursor}, timeout=30
+        )
+        if status_response.status_code == 404:
+            # Every job of the batch finished and was pruned before we saw it
+            for document_id in in_flight.values():
+                on_row(corpus_row(document_id, {}, None, status="expired"))
+            in_flight.clear()
+            batch_id, cursor = None, 0
+            continue
+        status_response.raise_for_status()
+        status = status_response.json()
+        cursor = status["cursor"]
+        
+        for job_id in status["expired"]:
+            document_id = in_flight.pop(job_id, None)
+            if document_id is not None:
+                on_row(corpus_row(document_id, {}, None, status="expired"))
+        for job in status["finished"]:
+            in_flight.pop(job["job_id"], None)
+            if job["status"] == "completed":
+                job_response = session.get(f"{API_BASE_URL}/api/v1/jobs/{job['job_id']}", timeout=30)
+                if job_response.status_code == 404:
+                    on_row(corpus_row(job["document_id"], {}, job["processing_time"], status="expired"))
+                    continue
+                job_response.raise_for_status()
+                on_row(corpus_row(job["document_id"], job_response.json()["result"], job["processing_time"]))
+            else:
+                on_row(corpus_row(job["document_id"], {}, job["processing_time"], status=job["status"]))
+        
+        if rejected or (in_flight and not status["finished"] and not status["expired"]):
+            time.sleep(0.5)
+
+
+SEVERITY_BINS = [0.0, 0.3, 0.6, 0.8, float("inf")]
+SEVERITY_LABELS = ["Mild", "Moderate", "Moderate to Severe", "Severe"]
+
+
+def display_corpus_dashboard(rows: List[Dict]):
+    """Corpus-level aggregates over the compact per-document rows"""
+    st.header("📚 Corpus Dashboard")
+    corpus_df = pd.DataFrame(rows)
+    completed = corpus_df[corpus_df["status"] == "completed"]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Documents", len(corpus_df))
+    with col2:
+        st.metric("Completed", len(completed))
+    with col3:
+        st.metric("Failed / Skipped", len(corpus_df) - len(completed))
+    with col4:
+        mean_severity = completed["severity_score"].mean() if not completed.empty else 0.0
+        st.metric("Mean Severity", f"{mean_severity:.2f}")
+    
+    if completed.empty:
+        st.warning("No documents completed successfully.")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Symptom Frequencies")
+        symptom_counts = completed["symptoms"].explode().dropna().str.lower().value_counts().head(20)
+        fig = px.bar(
+            x=symptom_counts.values,
+            y=symptom_counts.index,
+            orientation="h",
+            labels={"x": "Documents mentioning", "y": "Symptom"}
+        )
+        fig.update_layout(yaxis={"categoryorder": "total ascending"})
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        st.subheader("Severity Distribution")
+        severity_counts = pd.cut(
+            completed["severity_score"], bins=SEVERITY_BINS, labels=SEVERITY_LABELS,
+            right=False
+        ).value_counts(sort=False)
+        fig = px.bar(x=severity_counts.index.astype(str), y=severity_counts.values,
+                     labels={"x": "Severity", "y": "Documents"})
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.subheader("Latency Percentiles")
+    latency = completed["processing_time"].dropna().quantile([0.5, 0.9, 0.95, 0.99])
+    cols = st.columns(len(latency))
+    for col, (quantile, seconds) in zip(cols, latency.items()):
+        with col:
+            st.metric(f"p{int(quantile * 100)}", f"{seconds * 1000:.0f} ms")
+    
+    st.subheader("Documents")
+    display_df = corpus_df.assign(symptoms=corpus_df["symptoms"].str.join(", "))
+    st.dataframe(display_df, use_container_width=True)
+    st.download_button(
+        label="💾 Download CSV",
+        data=display_df.to_csv(index=False),
+        file_name=f"corpus_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv",
+        key="download_corpus_csv"
+    )
+
 
 def get_example_conversation():
     """Return example medical conversation"""
@@ -439,78 +876,136 @@ def display_entities(entities: List[Dict], original_text: str):
     st.dataframe(styled_df, use_container_width=True)
     
     st.subheader("Annotated Text")
-    highlighted_text = highlight_entities_in_text(original_text, entities)
-    st.markdown(highlighted_text, unsafe_allow_html=True)
+    display_annotated_text(original_text, entities)
+
 
+ANNOTATED_PAGE_CHARS = 20000
 
-def highlight_entities_in_text(text: str, entities: List[Dict]) -> str:
-    """Highlight entities in the original text"""
-    sorted_entities = sorted(entities, key=lambda x: x["start"], reverse=True)
+
+def display_annotated_text(text: str, entities: List[Dict], key: str = "annotated_text_page"):
+    """Render the annotated transcript, one page at a time for large transcripts"""
+    spans = sorted(
+        (e for e in entities if e.get("start") is not None and e.get("end") is not None),
+        key=lambda x: x["start"]
+    )
+    
+    if len(text) <= ANNOTATED_PAGE_CHARS:
+        st.markdown(highlight_entities_in_text(text, spans), unsafe_allow_html=True)
+        return
     
-    highlighted = text
-    for entity in sorted_entities:
+    pages = compute_page_bounds(text, spans, ANNOTATED_PAGE_CHARS)
+    page = st.number_input(
+        f"Page (1-{len(pages)})", min_value=1, max_value=len(pages), value=1, step=1,
+        key=key
+    )
+    page_start, page_end = pages[page - 1]
+    starts = [e["start"] for e in spans]
+    page_spans = spans[bisect.bisect_left(starts, page_start):bisect.bisect_left(starts, page_end)]
+    
+    st.caption(f"Characters {page_start:,}-{page_end:,} of {len(text):,} · {len(page_spans)} entities on this page")
+    st.markdown(highlight_entities_in_text(text, page_spans, page_start, page_end), unsafe_allow_html=True)
+
+
+def compute_page_bounds(text: str, spans: List[Dict], page_size: int) -> List[Tuple[int, int]]:
+    """Split text into pages of ~page_size chars, ending on line breaks and never inside an entity"""
+    bounds = []
+    start = 0
+    j = 0
+    while start < len(text):
+        end = min(len(text), start + page_size)
+        if end < len(text):
+            newline = text.find("\n", end, end + page_size)
+            if newline != -1:
+                end = newline + 1
+        while j < len(spans) and spans[j]["start"] < end:
+            end = max(end, spans[j]["end"])
+            j += 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def highlight_entities_in_text(text: str, entities: List[Dict], start: int = 0, end: Optional[int] = None) -> str:
+    """Highlight entities by their character offsets in one pass over text[start:end].
+
+    `entities` must be sorted by start offset; spans overlapping an earlier
+    span or falling outside the window are skipped.
+    """
+    end = len(text) if end is None else end
+    parts = []
+    cursor = start
+    for entity in entities:
+        entity_start, entity_end = entity["start"], entity["end"]
+        if entity_start < cursor or entity_end > end:
+            continue
         entity_class = entity["label"].lower().replace("_", "-")
-        replacement = f'<span class="entity-highlight {entity_class}">{entity["text"]}</span>'
-        
-        highlighted = highlighted.replace(entity["text"], replacement, 1)
+        parts.append(html.escape(text[cursor:entity_start]))
+        parts.append(
+            f'<span class="entity-highlight {entity_class}">{html.escape(text[entity_start:entity_end])}</span>'
+        )
+        cursor = entity_end
+    parts.append(html.escape(text[cursor:end]))
     
     return (
        f'<div class="annotated-text" '
-       f'style="line-height: 1.8; padding: 10px; border-radius: 5px;">'
-       f'{highlighted}</div>'
+       f'style="line-height: 1.8; padding: 10px; border-radius: 5px; white-space: pre-wrap;">'
+       f'{"".join(parts)}</div>'
    )
 
 def display_analysis(results: Dict):
     """Display analysis results including summary and sentiment"""
     st.header("📊 Medical Analysis")
     
-    col1, col2 = st.columns([2, 1])
+    summary = results["summary"]
+    if not summary:
+        st.warning("No summary generated.")
+    else:
+        col1, col2 = st.columns([2, 1])
     
-    with col1:
-        st.subheader("📋 Medical Summary")
-        summary = results["summary"]
-        
-        st.markdown("**Patient Information**")
-        st.write(f"- Name: {summary['patient_name']}")
-        st.write(f"- Current Status: {summary['current_status']}")
-        st.write(f"- Severity Score: {summary['severity_score']:.2f}/1.0")
+        with col1:
+            st.subheader("📋 Medical Summary")
+            st.markdown("**Patient Information**")
+            st.write(f"- Name: {summary['patient_name']}")
+            st.write(f"- Current Status: {summary['current_status']}")
+            st.write(f"- Severity Score: {summary['severity_score']:.2f}/1.0")
         
-        st.markdown("**Medical Details**")
-        st.write(f"- Symptoms: {', '.join(summary['symptoms'])}")
-        st.write(f"- Diagnosis: {', '.join(summary['diagnosis'])}")
-        st.write(f"- Treatment: {', '.join(summary['treatment'])}")
-        st.write(f"- Prognosis: {summary['prognosis']}")
+            st.markdown("**Medical Details**")
+            st.write(f"- Symptoms: {', '.join(summary['symptoms'])}")
+            st.write(f"- Diagnosis: {', '.join(summary['diagnosis'])}")
+            st.write(f"- Treatment: {', '.join(summary['treatment'])}")
+            st.write(f"- Prognosis: {summary['prognosis']}")
         
-        if summary['timeline']:
-            st.markdown("**Timeline**")
-            for event, date in summary['timeline'].items():
-                st.write(f"- {event.replace('_', ' ').title()}: {date}")
+            if summary['timeline']:
+                st.markdown("**Timeline**")
+                for event, date in summary['timeline'].items():
+                    st.write(f"- {event.replace('_', ' ').title()}: {date}")
     
-    with col2:
-        st.subheader("Severity Assessment")
-        fig = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=summary['severity_score'],
-            domain={'x': [0, 1], 'y': [0, 1]},
-            title={'text': "Severity Score"},
-            gauge={
-                'axis': {'range': [None, 1]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, 0.3], 'color': "lightgreen"},
-                    {'range': [0.3, 0.6], 'color': "yellow"},
-                    {'range': [0.6, 0.8], 'color': "orange"},
-                    {'range': [0.8, 1], 'color': "red"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': 0.9
+        with col2:
+            st.subheader("Severity Assessment")
+            fig = go.Figure(go.Indicator(
+                mode="gauge+number",
+                value=summary['severity_score'],
+                domain={'x': [0, 1], 'y': [0, 1]},
+                title={'text': "Severity Score"},
+                gauge={
+                    'axis': {'range': [None, 1]},
+                    'bar': {'color': "darkblue"},
+                    'steps': [
+                        {'range': [0, 0.3], 'color': "lightgreen"},
+                        {'range': [0.3, 0.6], 'color': "yellow"},
+                        {'range': [0.6, 0.8], 'color': "orange"},
+                        {'range': [0.8, 1], 'color': "red"}
+                    ],
+                    'threshold': {
+                        'line': {'color': "red", 'width': 4},
+                        'thickness': 0.75,
+                        'value': 0.9
+                    }
                 }
-            }
-        ))
-        fig.update_layout(height=250)
-        st.plotly_chart(fig, use_container_width=True)
+            ))
+            fig.update_layout(height=250)
+            st.plotly_chart(fig, use_container_width=True)
+    
     
     st.subheader("😊 Sentiment Analysis")
     
@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, ValidationError, validator
 from typing import Dict, List, Optional, Any
 from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
 import uuid
 import asyncio
 from enum import Enum
+from dataclasses import asdict
 import logging
 from pydantic import field_validator
 from fastapi import FastAPI, HTTPException
 from typing import List, Any, Dict, Optional
-from medical_nlp_pipeline import MedicalTranscriptionPipeline
+from medical_nlp_pipeline import MedicalTranscriptionPipeline, apply_text_edits
+from medical_nlp_jobs import JobPriority, JobQueue, ProcessingStatus, QueueFullError
+from medical_nlp_store import PatientStore
+from medical_nlp_index import EntityIndex
+from medical_nlp_similarity import SimilarityIndex
+from medical_nlp_lexicon import LexiconError, default_registry
+from medical_nlp_ratelimit import RateLimitMiddleware, create_rate_limiter
+from medical_nlp_websocket import StreamConnectionManager
+from medical_nlp_batching import create_micro_batcher
+from medical_nlp_warmup import WarmupTracker, SYNTHETIC_TRANSCRIPT, synthetic_utterances
+from medical_nlp_concurrency import apply_concurrency, plan_concurrency, set_threadpool_size
 from fastapi.openapi.utils import get_openapi
 import uvicorn
 
@@ -41,6 +59,7 @@ class TranscriptionRequest(BaseModel):
     patient_id: Optional[str] = Field(None, description="Patient identifier")
     encounter_date: Optional[datetime] = Field(None, description="Date of medical encounter")
     settings: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Processing settings")
+    priority: JobPriority = Field(JobPriority.INTERACTIVE, description="Queue lane for async analysis")
     
     @field_validator('conversation_text')  
     @classmethod
@@ -116,14 +135,79 @@ class AnalysisResponse(BaseModel):
     soap_note: SOAPResponse
     quality_metrics: Dict[str, float]
     processing_time: float
+    duplicate_of: Optional[str] = None
+    near_duplicates: List[Dict[str, Any]] = []
 
 
-class ProcessingStatus(str, Enum):
-    """Processing status enum"""
-    PENDING = "pending"
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    FAILED = "failed"
+class BatchDocument(BaseModel):
+    """One transcript in a batch submission"""
+    document_id: Optional[str] = Field(None, description="Client-side document identifier")
+    conversation_text: str = Field(..., min_length=50, description="Medical conversation text")
+    patient_id: Optional[str] = Field(None, description="Patient identifier")
+    encounter_date: Optional[datetime] = Field(None, description="Date of medical encounter")
+
+
+class BatchRequest(BaseModel):
+    """Request model for batch analysis"""
+    documents: List[BatchDocument] = Field(..., min_length=1, max_length=500)
+    batch_id: Optional[str] = Field(None, description="Append to an existing batch")
+    priority: JobPriority = Field(JobPriority.BACKFILL, description="Queue lane for the batch")
+
+
+class BatchResponse(BaseModel):
+    """Response for batch submission"""
+    batch_id: str
+    job_ids: List[str]
+    status_url: str
+
+
+class TextEdit(BaseModel):
+    """Replace previous_state text[start:end] with `text`"""
+    start: int = Field(..., ge=0)
+    end: int = Field(..., ge=0)
+    text: str = ""
+
+
+class IncrementalEntity(BaseModel):
+    """Entity of one utterance in an incremental state, offsets relative to the utterance"""
+    text: str
+    label: str
+    start: int = Field(..., ge=0)
+    end: int = Field(..., ge=0)
+    confidence: float
+    normalized_form: Optional[str] = None
+    umls_code: Optional[str] = None
+
+
+class IncrementalSentiment(BaseModel):
+    sentiment: str
+    confidence: float
+    intent: str
+    intent_confidence: float
+    emotional_indicators: List[str]
+
+
+class IncrementalUtterance(BaseModel):
+    """Per-utterance results an incremental state carries between revisions"""
+    key: str
+    entities: List[IncrementalEntity]
+    sentiment: Optional[IncrementalSentiment] = None
+    section: str
+
+
+class IncrementalState(BaseModel):
+    """`state` returned by /analyze/incremental"""
+    version: int
+    lexicon_version: Optional[str] = None
+    text: str
+    utterances: List[IncrementalUtterance] = Field(default_factory=list)
+
+
+class IncrementalRequest(BaseModel):
+    """Request model for incremental re-analysis of a revised transcript"""
+    conversation_text: Optional[str] = Field(None, description="Full revised conversation text")
+    previous_state: Optional[Dict[str, Any]] = Field(None, description="`state` from the previous response")
+    edits: List[TextEdit] = Field(default_factory=list, description="Edits against previous_state text")
 
 
 class AsyncJobResponse(BaseModel):
@@ -134,76 +218,75 @@ class AsyncJobResponse(BaseModel):
     result_url: str
 
 
-job_storage = {}
+# Sized before any component so torch, BLAS, the stage scheduler and the job queue share this worker's cores
+concurrency_plan = apply_concurrency(plan_concurrency())
 
+patient_store = PatientStore()
+entity_index = EntityIndex()
+similarity_index = SimilarityIndex()
+lexicon_registry = default_registry()
+rate_limiter = create_rate_limiter()
 
-class MedicalTranscriptionPipeline:
-    """Mock pipeline for demonstration"""
-    def process_conversation(self, text: str) -> Dict[str, Any]:
-        return {
-            "entities": [
-                {"text": "neck pain", "label": "SYMPTOM", "start": 10, "end": 19, "confidence": 0.95},
-                {"text": "physiotherapy", "label": "TREATMENT", "start": 50, "end": 63, "confidence": 0.90}
-            ],
-            "summary": {
-                "patient_name": "Jones",
-                "symptoms": ["neck pain", "back pain"],
-                "diagnosis": ["whiplash injury"],
-                "treatment": ["physiotherapy", "painkillers"],
-                "current_status": "Improving",
-                "prognosis": "Full recovery expected",
-                "timeline": {"accident_date": "September 1st"},
-                "severity_score": 0.4
-            },
-            "sentiment_analysis": [
-                {
-                    "text": "I'm doing better, but I still have some discomfort",
-                    "sentiment": {
-                        "sentiment": "hopeful",
-                        "confidence": 0.75,
-                        "intent": "reporting_symptoms",
-                        "intent_confidence": 0.80,
-                        "emotional_indicators": ["hopeful:better"]
-                    }
-                }
-            ],
-            "soap_note": {
-                "subjective": {
-                    "chief_complaint": "Neck and back pain following MVA",
-                    "symptoms": ["neck pain", "back pain"]
-                },
-                "objective": {
-                    "physical_exam": "Full range of motion, no tenderness"
-                },
-                "assessment": {
-                    "diagnosis": ["Whiplash injury"],
-                    "severity": "Mild to Moderate"
-                },
-                "plan": {
-                    "treatment": ["Continue physiotherapy"],
-                    "medications": ["OTC analgesics PRN"]
-                },
-                "metadata": {
-                    "generated_at": datetime.now().isoformat(),
-                    "confidence_score": 0.85
-                }
-            },
-            "quality_metrics": {
-                "entity_coverage": 0.75,
-                "summary_completeness": 0.90,
-                "soap_completeness": 0.85,
-                "overall_confidence": 0.85
-            }
-        }
+_shared_components: Dict[str, Any] = {}
+_shared_components_lock = threading.Lock()
+_PIPELINE_COMPONENTS = {"ner": "ner_extractor", "sentiment": "sentiment_analyzer", "soap": "soap_generator"}
+
+
+def shared_component(name: str):
+    """Model-backed pipeline component built once and shared by every request
+
+    "pipeline" is the full MedicalTranscriptionPipeline; the other names are
+    its components, so the endpoints and the pipeline share one copy of each model.
+    """
+    with _shared_components_lock:
+        if "pipeline" not in _shared_components:
+            _shared_components["pipeline"] = MedicalTranscriptionPipeline(lexicon=lexicon_registry)
+        shared = _shared_components["pipeline"]
+    return shared if name == "pipeline" else getattr(shared, _PIPELINE_COMPONENTS[name])
+
+
+class _SharedPipeline:
+    """Forwards to the shared pipeline, which is built on first use rather than at import"""
 
+    def __getattr__(self, name: str):
+        return getattr(shared_component("pipeline"), name)
+
+
+pipeline = _SharedPipeline()
+job_queue = JobQueue(pipeline)
+
+
+entity_batcher = create_micro_batcher(
+    lambda texts: shared_component("ner").extract_entities_batch(texts), "entities"
+)
+sentiment_batcher = create_micro_batcher(
+    lambda texts: shared_component("sentiment").analyze_batch(texts), "sentiment"
+)
 
-pipeline = MedicalTranscriptionPipeline()
+warmup = WarmupTracker()
+
+
+def _warmup_steps():
+    """Every component a request can reach, each exercised with the synthetic transcript"""
+    return {
+        "lexicon": (lexicon_registry.current, lambda bundle: bundle.find_keywords(
+            "medical_sentiments", SYNTHETIC_TRANSCRIPT.lower())),
+        "ner": (lambda: shared_component("ner"),
+                lambda extractor: extractor.extract_entities_batch(synthetic_utterances())),
+        "sentiment": (lambda: shared_component("sentiment"),
+                      lambda analyzer: analyzer.analyze_batch(synthetic_utterances("patient"))),
+        "soap": (lambda: shared_component("soap"),
+                 lambda generator: generator.generate_soap_note(SYNTHETIC_TRANSCRIPT)),
+        "pipeline": (lambda: shared_component("pipeline"),
+                     lambda p: p.process_conversation(SYNTHETIC_TRANSCRIPT))
+    }
 
 app = FastAPI()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 @app.get("/", tags=["Health"])
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check; see /ready for whether the worker should receive traffic"""
     return {
         "status": "healthy",
         "service": "Medical NLP Pipeline API",
@@ -212,6 +295,12 @@ async def health_check():
     }
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    """Readiness check: 200 once every component is loaded and warmed up, 503 until then or if warmup failed"""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.report())
+
+
 @app.post("/api/v1/analyze", response_model=AnalysisResponse, tags=["Analysis"])
 async def analyze_conversation(request: TranscriptionRequest):
     """
@@ -222,23 +311,44 @@ async def analyze_conversation(request: TranscriptionRequest):
     - Medical summarization
     - Sentiment analysis
     - SOAP note generation
+    
+    Re-uploading exactly the same transcript for the same patient returns
+    the stored analysis with `duplicate_of` set; pass
+    `settings={"reuse_duplicates": false}` to always reprocess. Edited
+    transcripts are always reprocessed, and stored encounters of the same
+    patient that are near-duplicates of them are listed in `near_duplicates`.
     """
     try:
         start_time = datetime.now()
+        request_id = str(uuid.uuid4())
         
-        results = pipeline.process_conversation(request.conversation_text)
+        duplicate_of = None
+        near_duplicates = []
+        reused = None
+        if (request.settings or {}).get("reuse_duplicates", True):
+            reused = await run_in_threadpool(_find_reusable_analysis, request)
+        if reused:
+            duplicate_of, results = reused
+        else:
+            near_duplicates = await run_in_threadpool(
+                similarity_index.near_duplicates, request.conversation_text, request.patient_id
+            )
+            results = await run_in_threadpool(pipeline.process_conversation, request.conversation_text)
+            await run_in_threadpool(_record_analysis, request_id, request.dict(), results)
         
         processing_time = (datetime.now() - start_time).total_seconds()
         
         response = AnalysisResponse(
-            request_id=str(uuid.uuid4()),
+            request_id=request_id,
             status="completed",
             entities=[EntityResponse(**entity) for entity in results["entities"]],
             summary=SummaryResponse(**results["summary"]),
             sentiment_analysis=results["sentiment_analysis"],
             soap_note=SOAPResponse(**results["soap_note"]),
             quality_metrics=results["quality_metrics"],
-            processing_time=processing_time
+            processing_time=processing_time,
+            duplicate_of=duplicate_of,
+            near_duplicates=near_duplicates
         )
         
         return response
@@ -248,95 +358,477 @@ async def analyze_conversation(request: TranscriptionRequest):
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
+def _record_analysis(encounter_id: str, request: Dict[str, Any], results: Dict[str, Any]):
+    """Index a finished analysis and persist it for the patient timeline.
+    
+    Indexing and storage errors are logged and never fail the analysis.
+    """
+    try:
+        entity_index.add(
+            encounter_id,
+            results.get("entities", []),
+            encounter_date=request.get("encounter_date"),
+            patient_id=request.get("patient_id")
+        )
+    except Exception as e:
+        logger.error(f"Failed to index encounter {encounter_id}: {str(e)}")
+    
+    try:
+        similarity_index.add(
+            encounter_id,
+            request.get("conversation_text", ""),
+            patient_id=request.get("patient_id"),
+            encounter_date=request.get("encounter_date")
+        )
+    except Exception as e:
+        logger.error(f"Failed to embed encounter {encounter_id}: {str(e)}")
+    
+    if not request.get("patient_id"):
+        return
+    try:
+        patient_store.save_encounter(
+            request["patient_id"],
+            results,
+            encounter_date=request.get("encounter_date"),
+            conversation_text=request.get("conversation_text"),
+            encounter_id=encounter_id
+        )
+    except Exception as e:
+        logger.error(f"Failed to store encounter {encounter_id}: {str(e)}")
+
+
+def _find_reusable_analysis(request: TranscriptionRequest):
+    """(encounter_id, results) of a stored encounter of the same patient with the identical transcript, if any"""
+    duplicate = similarity_index.find_duplicate(request.conversation_text, request.patient_id)
+    if duplicate is None:
+        return None
+    encounter = patient_store.get_encounter(duplicate["encounter_id"])
+    if encounter is None:
+        return None
+    stored_version = encounter["result"].get("soap_note", {}).get("metadata", {}).get("lexicon_version")
+    if stored_version and stored_version != lexicon_registry.version:
+        return None
+    logger.info(f"Reusing analysis of {duplicate['encounter_id']} (identical transcript)")
+    return duplicate["encounter_id"], encounter["result"]
+
+
+def _record_on_completion(job):
+    """Record a queued job's result once it completes"""
+    def on_change(changed_job):
+        if not changed_job.finished:
+            return
+        job_queue.remove_listener(changed_job.job_id, on_change)
+        if changed_job.status == ProcessingStatus.COMPLETED:
+            _record_analysis(changed_job.job_id, changed_job.request, changed_job.result)
+    
+    # add_listener refuses a finished job, so exactly one of these records it
+    if not job_queue.add_listener(job.job_id, on_change):
+        on_change(job)
+
+
+def _format_stream_event(event: str, data: Dict[str, Any], stream_format: str) -> str:
+    """Encode one stream event as SSE or NDJSON"""
+    encoded = jsonable_encoder(data)
+    if stream_format == "ndjson":
+        return json.dumps({"event": event, **encoded}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(encoded)}\n\n"
+
+
+@app.post("/api/v1/analyze/stream", tags=["Analysis"])
+async def analyze_conversation_stream(request: TranscriptionRequest, format: str = "sse"):
+    """
+    Analyze medical conversation, streaming each stage's result as soon as it is ready.
+    
+    Stages arrive in order: entities, sentiment_analysis, summary, soap_note,
+    quality_metrics. Use `format=sse` (default, `text/event-stream`) or
+    `format=ndjson` (one JSON object per line).
+    """
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    
+    request_id = str(uuid.uuid4())
+    
+    async def event_stream():
+        start_time = time.perf_counter()
+        yield _format_stream_event("start", {"request_id": request_id}, format)
+        try:
+            results = {}
+            stages = iterate_in_threadpool(pipeline.iter_stages(request.conversation_text))
+            async for stage, result in stages:
+                results[stage] = result
+                yield _format_stream_event("stage", {
+                    "stage": stage,
+                    "data": result,
+                    "elapsed": time.perf_counter() - start_time
+                }, format)
+            await run_in_threadpool(_record_analysis, request_id, request.dict(), results)
+            yield _format_stream_event("complete", {
+                "request_id": request_id,
+                "status": "completed",
+                "processing_time": time.perf_counter() - start_time
+            }, format)
+        except Exception as e:
+            logger.error(f"Streaming analysis failed: {str(e)}")
+            yield _format_stream_event("error", {"detail": f"Analysis failed: {str(e)}"}, format)
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/v1/analyze/incremental", tags=["Analysis"])
+async def analyze_conversation_incremental(request: IncrementalRequest):
+    """
+    Re-analyze a revised transcript, reprocessing only the utterances that changed.
+    
+    Send either the full revised `conversation_text` or `edits` against the
+    text of `previous_state`. The response includes a `state` to pass as
+    `previous_state` with the next revision; the first call may omit it.
+    """
+    previous_state = None
+    if request.previous_state:
+        # Reused records go straight into the results, so a malformed state is rejected up front
+        try:
+            previous_state = IncrementalState(**request.previous_state).dict()
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed previous_state: {e}")
+    
+    if request.edits:
+        if previous_state is None:
+            raise HTTPException(status_code=400, detail="edits require previous_state")
+        text = apply_text_edits(previous_state["text"], [edit.dict() for edit in request.edits])
+    elif request.conversation_text:
+        text = request.conversation_text
+    else:
+        raise HTTPException(status_code=400, detail="Provide conversation_text or edits")
+    
+    start_time = time.perf_counter()
+    try:
+        results, state = await run_in_threadpool(
+            pipeline.analyze_incremental, text, previous_state
+        )
+    except Exception as e:
+        logger.error(f"Incremental analysis failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    return {
+        "request_id": str(uuid.uuid4()),
+        "status": "completed",
+        "result": results,
+        "state": state,
+        "reused_utterances": state["reused"],
+        "reanalyzed_utterances": state["reanalyzed"],
+        "processing_time": time.perf_counter() - start_time
+    }
+
+
 @app.post("/api/v1/analyze/async", response_model=AsyncJobResponse, tags=["Analysis"])
-async def analyze_conversation_async(
-    request: TranscriptionRequest,
-    background_tasks: BackgroundTasks
-):
+async def analyze_conversation_async(request: TranscriptionRequest):
     """
     Submit medical conversation for asynchronous analysis.
     
     Use this endpoint for long conversations or when immediate response is not required.
+    Jobs run on a fixed worker pool; `priority="interactive"` jobs are always
+    picked up ahead of `priority="backfill"` jobs.
     """
-    job_id = str(uuid.uuid4())
-    
-    job_storage[job_id] = {
-        "status": ProcessingStatus.PENDING,
-        "request": request.dict(),
-        "result": None,
-        "error": None,
-        "created_at": datetime.now()
-    }
-    
-    background_tasks.add_task(process_async_job, job_id, request)
+    try:
+        job = job_queue.submit(
+            request.conversation_text,
+            priority=request.priority,
+            request=request.dict()
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    _record_on_completion(job)
     
     return AsyncJobResponse(
-        job_id=job_id,
-        status=ProcessingStatus.PENDING,
+        job_id=job.job_id,
+        status=job.status,
         message="Job submitted successfully",
-        result_url=f"/api/v1/jobs/{job_id}"
+        result_url=f"/api/v1/jobs/{job.job_id}"
     )
 
 
-async def process_async_job(job_id: str, request: TranscriptionRequest):
-    """Background task for processing async jobs"""
+def _job_status_payload(job) -> Dict[str, Any]:
+    """Serialize a queued job for the jobs endpoints"""
+    payload = {
+        "job_id": job.job_id,
+        "status": job.status,
+        "priority": job.priority,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "completed_at": job.completed_at,
+        "processing_time": job.processing_time,
+        "progress": job.progress()
+    }
+    if job.status == ProcessingStatus.COMPLETED:
+        # Return full results
+        payload["result"] = job.result
+    else:
+        # Return status only
+        payload["error"] = job.error
+    return payload
+
+
+@app.post("/api/v1/analyze/batch", response_model=BatchResponse, tags=["Analysis"])
+async def analyze_batch(request: BatchRequest):
+    """
+    Submit many conversations as one batch of async jobs.
+    
+    Batches default to the backfill lane so they never delay interactive
+    requests. Large corpora can be sent in chunks by passing the returned
+    `batch_id` back on later calls.
+    """
+    batch_id = request.batch_id or str(uuid.uuid4())
     try:
-        job_storage[job_id]["status"] = ProcessingStatus.PROCESSING
-        
-        await asyncio.sleep(2)  
-        
-        results = pipeline.process_conversation(request.conversation_text)
+        jobs = job_queue.submit_many(
+            [(document.conversation_text, document.dict()) for document in request.documents],
+            priority=request.priority,
+            batch_id=batch_id
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    for job in jobs:
+        _record_on_completion(job)
+    
+    return BatchResponse(
+        batch_id=batch_id,
+        job_ids=[job.job_id for job in jobs],
+        status_url=f"/api/v1/batches/{batch_id}"
+    )
+
+
+def _batch_job_summary(job) -> Dict[str, Any]:
+    return {
+        "job_id": job.job_id,
+        "document_id": job.request.get("document_id"),
+        "status": job.status,
+        "processing_time": job.processing_time
+    }
+
+
+@app.get("/api/v1/batches/{batch_id}", tags=["Jobs"])
+async def get_batch_status(batch_id: str, cursor: int = 0, include_jobs: bool = False):
+    """
+    Get per-status counts for a batch and the jobs that finished since `cursor`.
+    
+    Pass the returned `cursor` on the next call to receive only newly finished
+    jobs. Jobs that finished but were pruned after the retention window are
+    listed by id under `expired`. Set `include_jobs=true` to list every job in the batch.
+    """
+    jobs = job_queue.batch_jobs(batch_id)
+    if jobs is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    counts = {status.value: 0 for status in ProcessingStatus}
+    for job in jobs:
+        counts[job.status.value] += 1
+    finished, expired, next_cursor = job_queue.batch_finished_since(batch_id, cursor)
+    
+    response = {
+        "batch_id": batch_id,
+        "total": len(jobs),
+        "counts": counts,
+        "cursor": next_cursor,
+        "finished": [_batch_job_summary(job) for job in finished],
+        "expired": expired
+    }
+    if include_jobs:
+        response["jobs"] = [_batch_job_summary(job) for job in jobs]
+    return response
+
+
+MAX_JOB_WAIT_SECONDS = 60.0
+
+
+@app.get("/api/v1/jobs/{job_id}", tags=["Jobs"])
+async def get_job_status(job_id: str, wait: float = 0.0):
+    """
+    Get status, per-stage progress and results of an async analysis job.
+    
+    Pass `wait=<seconds>` (up to 60) to long-poll: the request returns as soon
+    as the job finishes, or with the current status when the wait expires.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if wait > 0 and not job.finished:
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
         
-        job_storage[job_id]["status"] = ProcessingStatus.COMPLETED
-        job_storage[job_id]["result"] = results
-        job_storage[job_id]["completed_at"] = datetime.now()
+        def on_change(changed_job):
+            if changed_job.finished:
+                loop.call_soon_threadsafe(finished.set)
         
-    except Exception as e:
-        job_storage[job_id]["status"] = ProcessingStatus.FAILED
-        job_storage[job_id]["error"] = str(e)
-        logger.error(f"Async job {job_id} failed: {str(e)}")
+        job_queue.add_listener(job_id, on_change)
+        try:
+            if not job.finished:
+                await asyncio.wait_for(finished.wait(), timeout=min(wait, MAX_JOB_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            job_queue.remove_listener(job_id, on_change)
+    
+    return _job_status_payload(job)
 
 
-@app.get("/api/v1/jobs/{job_id}", tags=["Jobs"])
-async def get_job_status(job_id: str):
-    """Get status and results of an async analysis job"""
-    if job_id not in job_storage:
+@app.get("/api/v1/jobs/{job_id}/events", tags=["Jobs"])
+async def stream_job_events(job_id: str):
+    """
+    Subscribe to an async job over Server-Sent Events.
+    
+    Emits a `status` event on every status or stage change and a final
+    `completed`, `failed` or `cancelled` event carrying the full job payload.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job = job_storage[job_id]
+    loop = asyncio.get_running_loop()
+    changes: asyncio.Queue = asyncio.Queue()
     
-    if job["status"] == ProcessingStatus.COMPLETED:
-        # Return full results
-        return {
-            "job_id": job_id,
-            "status": job["status"],
-            "created_at": job["created_at"],
-            "completed_at": job.get("completed_at"),
-            "result": job["result"]
-        }
-    else:
-        # Return status only
-        return {
-            "job_id": job_id,
-            "status": job["status"],
-            "created_at": job["created_at"],
-            "error": job.get("error")
-        }
+    def on_change(changed_job):
+        loop.call_soon_threadsafe(changes.put_nowait, changed_job.status)
+    
+    async def event_stream():
+        # Registered on first iteration: a client that disconnects before then never starts
+        # the generator, so its finally block (and the removal) would never run
+        job_queue.add_listener(job_id, on_change)
+        try:
+            while not job.finished:
+                yield _format_stream_event("status", {
+                    "job_id": job_id,
+                    "status": job.status,
+                    "progress": job.progress()
+                }, "sse")
+                await changes.get()
+            yield _format_stream_event(job.status.value, _job_status_payload(job), "sse")
+        finally:
+            job_queue.remove_listener(job_id, on_change)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/v1/jobs/{job_id}", tags=["Jobs"])
+async def cancel_job(job_id: str):
+    """Cancel a pending or running async analysis job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.value}")
+    
+    job = job_queue.cancel(job_id)
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "message": "Job cancelled" if job.finished else "Cancellation requested",
+        "progress": job.progress()
+    }
+
+
+@app.get("/api/v1/patients/{patient_id}/timeline", tags=["Patients"])
+async def get_patient_timeline(patient_id: str, start: Optional[datetime] = None,
+                               end: Optional[datetime] = None, label: Optional[str] = None):
+    """
+    Get a patient's stored encounters in date order, with entities grouped by label.
+    
+    Encounters are stored whenever an analysis request carries a `patient_id`;
+    this endpoint reads the index and never reruns the pipeline.
+    """
+    timeline = await run_in_threadpool(patient_store.timeline, patient_id, start, end, label)
+    if not timeline:
+        raise HTTPException(status_code=404, detail="No encounters stored for this patient")
+    return {"patient_id": patient_id, "encounters": timeline}
+
+
+@app.get("/api/v1/patients/{patient_id}/history", tags=["Patients"])
+async def get_patient_entity_history(patient_id: str, label: Optional[str] = None,
+                                     start: Optional[datetime] = None,
+                                     end: Optional[datetime] = None):
+    """Get first/last seen dates and mention counts of each symptom, treatment, etc. for a patient"""
+    history = await run_in_threadpool(patient_store.entity_history, patient_id, label, start, end)
+    return {"patient_id": patient_id, "label": label, "terms": history}
+
+
+@app.get("/api/v1/encounters/search", tags=["Patients"])
+async def search_encounters(q: str, patient_id: Optional[str] = None, limit: int = 20):
+    """Full-text search over stored transcripts, optionally restricted to one patient"""
+    if not patient_store.full_text_search:
+        raise HTTPException(status_code=501, detail="Full-text search is not available")
+    try:
+        results = await run_in_threadpool(patient_store.search, q, patient_id, min(limit, 100))
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {str(e)}")
+    return {"query": q, "results": results}
+
+
+@app.post("/api/v1/encounters/similar", tags=["Patients"])
+async def find_similar_encounters(request: TextRequest, k: int = 10, min_score: float = 0.0):
+    """Find past encounters whose transcripts are most similar to the given text"""
+    hits = await run_in_threadpool(
+        similarity_index.query, request.text, None, min(k, 100), min_score
+    )
+    return {"results": hits}
+
+
+@app.get("/api/v1/encounters/{encounter_id}/similar", tags=["Patients"])
+async def get_similar_encounters(encounter_id: str, k: int = 10):
+    """Find the past encounters most similar to an analyzed encounter"""
+    hits = await run_in_threadpool(similarity_index.similar_to, encounter_id, min(k, 100))
+    if hits is None:
+        raise HTTPException(status_code=404, detail="Encounter not found")
+    return {"encounter_id": encounter_id, "results": hits}
+
+
+@app.get("/api/v1/encounters/{encounter_id}", tags=["Patients"])
+async def get_encounter(encounter_id: str):
+    """Get the full stored analysis of one encounter"""
+    encounter = await run_in_threadpool(patient_store.get_encounter, encounter_id)
+    if encounter is None:
+        raise HTTPException(status_code=404, detail="Encounter not found")
+    return encounter
+
+
+@app.get("/api/v1/entities/search", tags=["Entities"])
+async def search_entities(q: str, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, limit: int = 100):
+    """
+    Find analyzed encounters by the entities they mention.
+    
+    Terms match normalized entity forms, optionally with a label prefix
+    (`BODY_PART:lumbar spine`), and combine with AND, OR, NOT, parentheses
+    and `NEAR/n` (within n characters). Results are newest first, with the
+    offsets of the matching entities.
+    """
+    try:
+        results = await run_in_threadpool(entity_index.search, q, since, until, min(limit, 1000))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, **results}
 
 
 @app.post("/api/v1/entities/extract", tags=["Entities"])
 async def extract_entities(request: TextRequest):
     """Extract medical entities from text"""
     try:
-        from medical_nlp_pipeline import MedicalNERExtractor
-        extractor = MedicalNERExtractor()
-        entities = extractor.extract_entities(request.text)
+        entities = await entity_batcher.submit(request.text)
         
         return {
             "entities": [
                 {
                     "text": e.text,
                     "label": e.label,
+                    "start": e.start,
+                    "end": e.end,
                     "confidence": e.confidence,
                     "normalized": e.normalized_form
                 }
@@ -351,9 +843,8 @@ async def extract_entities(request: TextRequest):
 async def generate_soap_note(request: TranscriptionRequest):
     """Generate SOAP note from medical conversation"""
     try:
-        from medical_nlp_pipeline import SOAPNoteGenerator
-        generator = SOAPNoteGenerator()
-        soap_note = generator.generate_soap_note(request.conversation_text)
+        generator = shared_component("soap")
+        soap_note = await run_in_threadpool(generator.generate_soap_note, request.conversation_text)
         
         return SOAPResponse(**soap_note.__dict__)
     except Exception as e:
@@ -370,9 +861,7 @@ async def analyze_sentiment(request: TextRequest):
     Analyze sentiment and intent of medical text
     """
     try:
-        from medical_nlp_pipeline import MedicalSentimentAnalyzer
-        analyzer = MedicalSentimentAnalyzer()
-        result = analyzer.analyze(request.text)
+        result = await sentiment_batcher.submit(request.text)
 
         return SentimentResponse(
             text=request.text,
@@ -386,10 +875,48 @@ async def analyze_sentiment(request: TextRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/v1/lexicon", tags=["Models"])
+async def get_lexicon():
+    """Version and table sizes of the live lexicon bundle"""
+    return lexicon_registry.current().summary()
+
+
+@app.post("/api/v1/lexicon/reload", tags=["Models"])
+async def reload_lexicon():
+    """Swap in the current lexicon bundle without restarting; in-flight requests keep the old one"""
+    previous_version = lexicon_registry.version
+    try:
+        bundle = await run_in_threadpool(lexicon_registry.reload)
+    except (LexiconError, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Lexicon reload failed, keeping {previous_version}: {e}")
+    return {
+        "previous_version": previous_version,
+        "changed": bundle.version != previous_version,
+        **bundle.summary()
+    }
+
+
+@app.get("/api/v1/metrics", tags=["Health"])
+async def get_metrics():
+    """Runtime counters (cache hit rates, queue depth, rate limits, WebSockets, batching) and thread sizing"""
+    # Metrics must not trigger a model load, so only a pipeline that already exists is read
+    shared = _shared_components.get("pipeline")
+    utterance_cache = shared.utterance_cache if shared is not None else None
+    return {
+        "utterance_cache": utterance_cache.stats() if utterance_cache is not None else None,
+        "job_queue": job_queue.stats(),
+        "rate_limits": rate_limiter.metrics(),
+        "websockets": stream_manager.stats(),
+        "batching": {"entities": entity_batcher.stats(), "sentiment": sentiment_batcher.stats()},
+        "concurrency": asdict(concurrency_plan)
+    }
+
+
 @app.get("/api/v1/models/info", tags=["Models"])
 async def get_model_info():
     """Get information about loaded models"""
     return {
+        "lexicon_version": lexicon_registry.version,
         "models": {
             "ner": {
                 "name": "Medical NER",
@@ -418,42 +945,20 @@ async def get_model_info():
             "max_text_length": 10000,
             "supported_languages": ["en"],
             "batch_processing": True,
-            "streaming": False
+            "streaming": True
         }
     }
 
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket
+
+stream_manager = StreamConnectionManager(lambda: shared_component("ner"))
+
 
 @app.websocket("/ws/transcribe-stream")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time transcription analysis"""
-    await websocket.accept()
-    try:
-        while True:
-            data = await websocket.receive_text()
-            
-            try:
-                from medical_nlp_pipeline import MedicalNERExtractor
-                extractor = MedicalNERExtractor()
-                entities = extractor.extract_entities(data)
-                
-                await websocket.send_json({
-                    "type": "entities",
-                    "data": [
-                        {"text": e.text, "label": e.label}
-                        for e in entities
-                    ]
-                })
-                
-            except Exception as e:
-                await websocket.send_json({
-                    "type": "error",
-                    "message": str(e)
-                })
-                
-    except WebSocketDisconnect:
-        logger.info("WebSocket client disconnected")
+    await stream_manager.serve(websocket)
 
 
 @app.exception_handler(ValueError)
@@ -481,6 +986,16 @@ async def general_exception_handler(request: Request, exc: Exception):
 async def startup_event():
     """Initialize models and resources on startup"""
     logger.info("Starting Medical NLP API...")
+    set_threadpool_size(concurrency_plan)
+    if os.environ.get("MEDICAL_NLP_WARMUP", "1") == "1":
+        # Runs in the background so liveness checks answer while models load; /ready reports 503 until done
+        app.state.warmup_task = asyncio.create_task(run_in_threadpool(warmup.run, _warmup_steps()))
+    else:
+        warmup.skip()
+    job_queue.start()
+    reload_interval = os.environ.get("MEDICAL_NLP_LEXICON_RELOAD_INTERVAL")
+    if reload_interval:
+        lexicon_registry.start_watching(float(reload_interval))
     logger.info("API started successfully")
 
 
@@ -488,6 +1003,9 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup resources on shutdown"""
     logger.info("Shutting down Medical NLP API...")
+    job_queue.stop()
+    lexicon_registry.stop_watching()
+    entity_index.close()
     logger.info("API shutdown complete")
 
 
@@ -509,6 +1027,12 @@ def custom_openapi():
         - **Sentiment Analysis**: Analyze patient emotions and concerns
         - **SOAP Note Generation**: Create clinical documentation
         
+        ## Patient Timelines
+        
+        Analyses submitted with a `patient_id` are stored and indexed. Use
+        `/api/v1/patients/{patient_id}/timeline` and `/history` to query them
+        without reprocessing transcripts.
+        
         ## Authentication
         
         Currently using API key authentication. Include your API key in the header:
@@ -518,9 +1042,17 @@ def custom_openapi():
         
         ## Rate Limits
         
-        - 100 requests per minute for standard endpoints
+        Limits are enforced per `X-API-Key` for keys listed in
+        `MEDICAL_NLP_API_KEYS`, and per client address otherwise:
+        
+        - 100 requests per minute for standard endpoints (token bucket)
+        - 10 concurrent requests
         - 10 concurrent WebSocket connections
         
+        Requests over a limit get `429` with a `Retry-After` header; WebSocket
+        connections over the cap are closed with code 1008. Responses carry
+        `X-RateLimit-Limit` and `X-RateLimit-Remaining`.
+        
         ## Examples
         
         See the `/docs` endpoint for interactive examples.
@@ -0,0 +1,223 @@
+
+import os
+import logging
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SENTIMENT_MODEL = "distilbert-base-uncased"
+DEFAULT_ONNX_PATH = os.path.join("models", "sentiment-onnx")
+
+
+def default_sentiment_model() -> str:
+    """MEDICAL_NLP_SENTIMENT_MODEL, e.g. a fine-tuned or exported checkpoint directory
+
+    The base DistilBERT model has no trained classification head; each load
+    initialises a new random one, so its predictions differ between processes.
+    """
+    return os.environ.get("MEDICAL_NLP_SENTIMENT_MODEL", DEFAULT_SENTIMENT_MODEL)
+
+
+class SentimentBackend:
+    """Base class for sentiment classifier inference backends"""
+
+    name = "base"
+
+    def __init__(self, model_name: Optional[str] = None, num_labels: int = 5,
+                 max_length: int = 128):
+        self.model_name = model_name or default_sentiment_model()
+        self.num_labels = num_labels
+        self.max_length = max_length
+        self.tokenizer = None
+
+    def _tokenize(self, texts: List[str], return_tensors: str) -> Dict:
+        return self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors=return_tensors
+        )
+
+    def predict_logits(self, texts: List[str]) -> np.ndarray:
+        """Return a (batch, num_labels) array of raw logits"""
+        raise NotImplementedError
+
+    def predict(self, texts: List[str]) -> List[Tuple[int, float]]:
+        """Return (label index, probability) for each text"""
+        if not texts:
+            return []
+        logits = self.predict_logits(texts)
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        labels = probs.argmax(axis=1)
+        return [(int(label), float(probs[i, label])) for i, label in enumerate(labels)]
+
+
+class TorchBackend(SentimentBackend):
+    """fp32 PyTorch inference"""
+
+    name = "torch"
+
+    def __init__(self, model_name: Optional[str] = None, num_labels: int = 5,
+                 max_length: int = 128):
+        super().__init__(model_name, num_labels, max_length)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            self.model_name, num_labels=num_labels
+        )
+        self.model.eval()
+
+    def predict_logits(self, texts: List[str]) -> np.ndarray:
+        inputs = self._tokenize(texts, "pt")
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        return outputs.logits.float().numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """Dynamic int8-quantized PyTorch inference for CPU-only nodes"""
+
+    name = "torch-int8"
+
+    def __init__(self, model_name: Optional[str] = None, num_labels: int = 5,
+                 max_length: int = 128):
+        super().__init__(model_name, num_labels, max_length)
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        self.model.eval()
+
+
+class ONNXBackend(SentimentBackend):
+    """ONNX Runtime inference over a model exported with export_sentiment_model.py"""
+
+    name = "onnx"
+
+    def __init__(self, model_name: Optional[str] = None, num_labels: int = 5,
+                 max_length: int = 128, onnx_path: Optional[str] = None,
+                 intra_op_threads: int = 0):
+        super().__init__(model_name, num_labels, max_length)
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "The 'onnx' sentiment backend requires onnxruntime (pip install onnxruntime)"
+            ) from e
+
+        onnx_path = onnx_path or os.environ.get("MEDICAL_NLP_ONNX_PATH", DEFAULT_ONNX_PATH)
+        model_file = onnx_path
+        if os.path.isdir(onnx_path):
+            model_file = _resolve_onnx_file(onnx_path)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_file}; run "
+                f"'python export_sentiment_model.py export --output {onnx_path}' first"
+            )
+
+        tokenizer_dir = os.path.dirname(model_file)
+        if os.path.exists(os.path.join(tokenizer_dir, "tokenizer_config.json")):
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+        else:
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        intra_op_threads = intra_op_threads or int(os.environ.get("MEDICAL_NLP_INTRA_OP_THREADS", 0))
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            model_file, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.model_file = model_file
+
+    def predict_logits(self, texts: List[str]) -> np.ndarray:
+        inputs = self._tokenize(texts, "np")
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def _resolve_onnx_file(directory: str) -> str:
+    """Prefer the int8 ONNX model when both variants were exported"""
+    for filename in ("model.int8.onnx", "model.onnx"):
+        candidate = os.path.join(directory, filename)
+        if os.path.exists(candidate):
+            return candidate
+    return os.path.join(directory, "model.onnx")
+
+
+SENTIMENT_BACKENDS: Dict[str, Type[SentimentBackend]] = {
+    TorchBackend.name: TorchBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    ONNXBackend.name: ONNXBackend,
+}
+
+
+def create_sentiment_backend(name: Optional[str] = None, **kwargs) -> SentimentBackend:
+    """Build the configured backend (MEDICAL_NLP_SENTIMENT_BACKEND, default 'torch')"""
+    name = name or os.environ.get("MEDICAL_NLP_SENTIMENT_BACKEND", TorchBackend.name)
+    if name not in SENTIMENT_BACKENDS:
+        raise ValueError(
+            f"Unknown sentiment backend '{name}'. Choose from: {', '.join(SENTIMENT_BACKENDS)}"
+        )
+    logger.info(f"Loading sentiment backend: {name}")
+    return SENTIMENT_BACKENDS[name](**kwargs)
+
+
+def export_onnx(output_dir: str, model_name: Optional[str] = None, num_labels: int = 5,
+                opset: int = 14, quantize: bool = True) -> List[str]:
+    """Export the fp32 classifier to ONNX, optionally with a dynamic int8 copy
+
+    The torch weights the graph was traced from are saved next to it, so
+    validation and the torch backends can load exactly the same classifier
+    (see exported_checkpoint()).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    source = TorchBackend(model_name=model_name, num_labels=num_labels)
+    source.tokenizer.save_pretrained(output_dir)
+    source.model.save_pretrained(output_dir)
+
+    dummy = source._tokenize(["The patient reports neck pain."], "pt")
+    model_file = os.path.join(output_dir, "model.onnx")
+    torch.onnx.export(
+        source.model,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        model_file,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"}
+        },
+        opset_version=opset
+    )
+    exported = [os.path.join(output_dir, "config.json"), model_file]
+    logger.info(f"Exported ONNX model to {model_file}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_file = os.path.join(output_dir, "model.int8.onnx")
+        quantize_dynamic(model_file, int8_file, weight_type=QuantType.QInt8)
+        exported.append(int8_file)
+        logger.info(f"Exported int8 ONNX model to {int8_file}")
+
+    return exported
+
+
+def exported_checkpoint(onnx_path: str) -> str:
+    """Directory of the torch weights an ONNX export was traced from"""
+    directory = onnx_path if os.path.isdir(onnx_path) else os.path.dirname(onnx_path)
+    if not os.path.exists(os.path.join(directory, "config.json")):
+        raise FileNotFoundError(
+            f"No torch checkpoint next to the ONNX model in {directory}; re-run "
+            f"'python export_sentiment_model.py export --output {directory}'"
+        )
+    return directory
@@ -0,0 +1,156 @@
+"""
+Dynamic micro-batching of concurrent API requests into shared model calls.
+
+A MicroBatcher collects the items submitted while it waits up to
+`max_wait_ms` after the first one (or until `max_batch_size` items arrive),
+runs them through one batched call such as nlp.pipe or a single transformer
+forward pass on the thread pool, and hands each caller its own result.
+While a batch runs the next one keeps filling, so batches grow with load
+and each request waits at most one window plus one batch. A batch that
+raises is split in halves and retried until the failing items are alone,
+so one bad input only fails its own request.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesces concurrent submit() calls into calls of `process_batch(items) -> results`"""
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, max_concurrent_batches: int = 1, name: str = "batch"):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self.name = name
+        self._pending: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = set()
+        self._stats = {"requests": 0, "batches": 0, "max_batch_size_seen": 0,
+                       "queue_wait_total": 0.0, "batch_time_total": 0.0, "errors": 0, "retried_batches": 0}
+
+    async def submit(self, item: Any) -> Any:
+        """Result for `item` once its batch has run, or the exception processing it alone raised"""
+        if self.max_batch_size <= 1:
+            return (await self._run_batch([item], [time.perf_counter()]))[0]
+
+        self._ensure_collector()
+        future = asyncio.get_running_loop().create_future()
+        await self._pending.put((item, future, time.perf_counter()))
+        return await future
+
+    def _ensure_collector(self):
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done() or self._loop is not loop:
+            self._loop = loop
+            self._pending = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+
+    async def _collect(self):
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            batch = [await self._pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._pending.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Requests keep queueing while every batch slot is busy, so the next batch is larger
+            await slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch, slots))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]], slots: asyncio.Semaphore):
+        try:
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            await self._resolve(items, futures, [submitted for _, _, submitted in batch])
+        finally:
+            slots.release()
+
+    async def _resolve(self, items: List[Any], futures: List[asyncio.Future], submitted: Optional[List[float]]):
+        """Settle `futures` from one batch call, bisecting the batch when it fails"""
+        try:
+            results = await self._run_batch(items, submitted)
+        except Exception as e:
+            if len(items) == 1:
+                if not futures[0].done():
+                    futures[0].set_exception(e)
+                return
+            middle = len(items) // 2
+            await self._resolve(items[:middle], futures[:middle], None)
+            await self._resolve(items[middle:], futures[middle:], None)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, items: List[Any], submitted: Optional[List[float]]) -> List[Any]:
+        """One call of process_batch; `submitted` is None for retries of part of a failed batch"""
+        started = time.perf_counter()
+        stats = self._stats
+        if submitted is None:
+            stats["retried_batches"] += 1
+        else:
+            stats["requests"] += len(items)
+            stats["batches"] += 1
+            stats["max_batch_size_seen"] = max(stats["max_batch_size_seen"], len(items))
+            stats["queue_wait_total"] += sum(started - t for t in submitted)
+        try:
+            results = await run_in_threadpool(self.process_batch, items)
+            if len(results) != len(items):
+                raise ValueError(f"{self.name} batch returned {len(results)} results for {len(items)} items")
+        except Exception:
+            stats["errors"] += 1
+            if len(items) == 1:
+                logger.exception(f"{self.name} item failed")
+            else:
+                logger.warning(f"{self.name} batch of {len(items)} failed; retrying in halves")
+            raise
+        finally:
+            stats["batch_time_total"] += time.perf_counter() - started
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Request and batch counts, mean batch size, mean queue wait and mean batch time"""
+        stats = self._stats
+        batches = stats["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": stats["requests"],
+            "batches": batches,
+            "errors": stats["errors"],
+            "retried_batches": stats["retried_batches"],
+            "mean_batch_size": round(stats["requests"] / batches, 2) if batches else 0.0,
+            "max_batch_size_seen": stats["max_batch_size_seen"],
+            "mean_queue_wait_ms": round(stats["queue_wait_total"] / stats["requests"] * 1000, 3)
+            if stats["requests"] else 0.0,
+            "mean_batch_ms": round(stats["batch_time_total"] / batches * 1000, 3) if batches else 0.0
+        }
+
+
+def create_micro_batcher(process_batch: Callable[[List[Any]], List[Any]], name: str) -> MicroBatcher:
+    """Batcher configured by MEDICAL_NLP_BATCH_MAX_SIZE (1 disables batching) and MEDICAL_NLP_BATCH_WAIT_MS"""
+    return MicroBatcher(
+        process_batch,
+        max_batch_size=int(os.environ.get("MEDICAL_NLP_BATCH_MAX_SIZE", 32)),
+        max_wait_ms=float(os.environ.get("MEDICAL_NLP_BATCH_WAIT_MS", 5)),
+        max_concurrent_batches=int(os.environ.get("MEDICAL_NLP_BATCH_CONCURRENCY", 1)),
+        name=name
+    )
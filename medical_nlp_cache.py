@@ -0,0 +1,114 @@
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 4096
+
+CacheKey = Tuple[str, str, str, str]
+
+
+def normalize_utterance(text: str) -> str:
+    """Cache key text: surrounding whitespace stripped and inner runs collapsed to one space"""
+    return " ".join(text.split())
+
+
+def normalized_positions(text: str) -> List[int]:
+    """For each character of normalize_utterance(text), the index in `text` it came from"""
+    positions: List[int] = []
+    pending_space = False
+    for i, char in enumerate(text):
+        if char.isspace():
+            pending_space = bool(positions)
+            continue
+        if pending_space:
+            positions.append(i - 1)
+            pending_space = False
+        positions.append(i)
+    return positions
+
+
+class UtteranceCache:
+    """Bounded LRU cache of per-utterance stage results shared across requests.
+
+    Keys combine the stage, the lexicon version, the normalized utterance
+    text and an optional variant (e.g. the speaker), so a lexicon reload
+    never serves results computed with the previous rules. With `max_cost`
+    set, entries are also evicted until the summed `cost(text, value)` fits,
+    which bounds memory when utterance lengths vary widely. Cached values
+    are shared and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_cost: Optional[int] = None,
+                 cost: Optional[Callable[[str, Any], int]] = None):
+        self.max_entries = max_entries
+        self.max_cost = max_cost
+        self.cost = cost or (lambda text, value: len(text))
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._total_cost = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, stage: str, lexicon_version: str, text: str,
+                       compute: Callable[[], Any], variant: str = "") -> Any:
+        key = (stage, lexicon_version, text, variant)
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"hits": 0, "misses": 0, "evictions": 0})
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                stats["hits"] += 1
+                return self._entries[key][0]
+            stats["misses"] += 1
+
+        # Computed outside the lock; concurrent misses on one key just store it twice
+        value = compute()
+        cost = self.cost(text, value)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, cost)
+                self._total_cost += cost
+                self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_cost is not None and self._total_cost > self.max_cost)
+        ):
+            (stage, _, _, _), (_, cost) = self._entries.popitem(last=False)
+            self._total_cost -= cost
+            self._stats[stage]["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_cost = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, total cost and per-stage hits, misses, evictions and hit rate"""
+        with self._lock:
+            stages = {
+                stage: {
+                    **counts,
+                    "hit_rate": round(counts["hits"] / (counts["hits"] + counts["misses"]), 4)
+                    if counts["hits"] + counts["misses"] else 0.0
+                }
+                for stage, counts in self._stats.items()
+            }
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "total_cost": self._total_cost,
+                "max_cost": self.max_cost,
+                "stages": stages
+            }
+
+
+def create_utterance_cache() -> Optional[UtteranceCache]:
+    """Cache sized from MEDICAL_NLP_UTTERANCE_CACHE_SIZE (0 disables it) and _MAX_CHARS"""
+    max_entries = int(os.environ.get("MEDICAL_NLP_UTTERANCE_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    if max_entries <= 0:
+        return None
+    max_chars = os.environ.get("MEDICAL_NLP_UTTERANCE_CACHE_MAX_CHARS")
+    return UtteranceCache(max_entries, max_cost=int(max_chars) if max_chars else None)
@@ -0,0 +1,330 @@
+"""
+Columnar (Parquet / Arrow IPC) export of analysis results.
+
+Each result is flattened into four tables joined by encounter_id:
+
+    summaries      one row per encounter: summary fields and quality metrics
+    entities       one row per extracted entity
+    sentiments     one row per analyzed patient utterance
+    soap_sections  one row per SOAP field (section, field, JSON-encoded value)
+
+Rows are buffered and written as row groups of `row_group_size`, so memory
+stays bounded however many results are written. Every writer (and every
+rotate()) starts new part files, laid out as <directory>/<table>/part-NNNNN.<ext>,
+so an existing export is never rewritten and each table directory can be
+scanned as one dataset. Closing a part writes a marker to
+<directory>/_sealed/ once the part's files for every table are complete; a
+document only counts as completed for resume if its part is sealed.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TABLES = ["summaries", "entities", "sentiments", "soap_sections"]
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+SOAP_SECTIONS = ["subjective", "objective", "assessment", "plan", "metadata"]
+QUALITY_METRICS = ["entity_coverage", "summary_completeness", "soap_completeness", "overall_confidence"]
+
+_PART_PATTERN = re.compile(r"part-(\d+)\.(parquet|arrow)$")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Columnar export requires pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def table_schemas():
+    """Arrow schema of each exported table"""
+    pa = _require_pyarrow()
+    strings = pa.list_(pa.string())
+    return {
+        "summaries": pa.schema(
+            [
+                ("encounter_id", pa.string()),
+                ("patient_name", pa.string()),
+                ("symptoms", strings),
+                ("diagnosis", strings),
+                ("treatment", strings),
+                ("current_status", pa.dictionary(pa.int32(), pa.string())),
+                ("prognosis", pa.string()),
+                ("timeline", pa.map_(pa.string(), pa.string())),
+                ("severity_score", pa.float32()),
+                ("lexicon_version", pa.string()),
+                ("generated_at", pa.string()),
+            ]
+            + [(metric, pa.float32()) for metric in QUALITY_METRICS]
+        ),
+        "entities": pa.schema([
+            ("encounter_id", pa.string()),
+            ("entity_index", pa.int32()),
+            ("text", pa.string()),
+            ("label", pa.dictionary(pa.int32(), pa.string())),
+            ("start", pa.int32()),
+            ("end", pa.int32()),
+            ("confidence", pa.float32()),
+            ("normalized_form", pa.string()),
+            ("umls_code", pa.string()),
+            # Byte offsets into the source corpus file, when it was read memory-mapped
+            ("file_start", pa.int64()),
+            ("file_end", pa.int64()),
+        ]),
+        "sentiments": pa.schema([
+            ("encounter_id", pa.string()),
+            ("utterance_index", pa.int32()),
+            ("text", pa.string()),
+            ("sentiment", pa.dictionary(pa.int32(), pa.string())),
+            ("confidence", pa.float32()),
+            ("intent", pa.dictionary(pa.int32(), pa.string())),
+            ("intent_confidence", pa.float32()),
+            ("emotional_indicators", strings),
+        ]),
+        "soap_sections": pa.schema([
+            ("encounter_id", pa.string()),
+            ("section", pa.dictionary(pa.int32(), pa.string())),
+            ("field", pa.string()),
+            ("value", pa.string()),
+        ]),
+    }
+
+
+def flatten_results(encounter_id: str, results: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Rows for each table from one process_conversation() result"""
+    summary = results.get("summary") or {}
+    soap_note = results.get("soap_note") or {}
+    metrics = results.get("quality_metrics") or {}
+    metadata = soap_note.get("metadata") or {}
+
+    summary_row = {
+        "encounter_id": encounter_id,
+        "patient_name": summary.get("patient_name"),
+        "symptoms": summary.get("symptoms") or [],
+        "diagnosis": summary.get("diagnosis") or [],
+        "treatment": summary.get("treatment") or [],
+        "current_status": summary.get("current_status"),
+        "prognosis": summary.get("prognosis"),
+        "timeline": list((summary.get("timeline") or {}).items()),
+        "severity_score": summary.get("severity_score"),
+        "lexicon_version": metadata.get("lexicon_version"),
+        "generated_at": metadata.get("generated_at"),
+        **{metric: metrics.get(metric) for metric in QUALITY_METRICS},
+    }
+
+    entities = [
+        {
+            "encounter_id": encounter_id,
+            "entity_index": i,
+            "text": entity.get("text"),
+            "label": entity.get("label"),
+            "start": entity.get("start"),
+            "end": entity.get("end"),
+            "confidence": entity.get("confidence"),
+            "normalized_form": entity.get("normalized_form"),
+            "umls_code": entity.get("umls_code"),
+            "file_start": entity.get("file_start"),
+            "file_end": entity.get("file_end"),
+        }
+        for i, entity in enumerate(results.get("entities") or [])
+    ]
+
+    sentiments = []
+    for i, entry in enumerate(results.get("sentiment_analysis") or []):
+        sentiment = entry.get("sentiment") or {}
+        sentiments.append({
+            "encounter_id": encounter_id,
+            "utterance_index": i,
+            "text": entry.get("text"),
+            "sentiment": sentiment.get("sentiment"),
+            "confidence": sentiment.get("confidence"),
+            "intent": sentiment.get("intent"),
+            "intent_confidence": sentiment.get("intent_confidence"),
+            "emotional_indicators": sentiment.get("emotional_indicators") or [],
+        })
+
+    soap_rows = [
+        {
+            "encounter_id": encounter_id,
+            "section": section,
+            "field": field,
+            "value": json.dumps(value, default=str),
+        }
+        for section in SOAP_SECTIONS
+        for field, value in (soap_note.get(section) or {}).items()
+    ]
+
+    return {"summaries": [summary_row], "entities": entities,
+            "sentiments": sentiments, "soap_sections": soap_rows}
+
+
+class ColumnarResultWriter:
+    """Incrementally writes flattened analysis results as Parquet or Arrow IPC tables.
+
+    Use as a context manager, or call close(); rows still buffered when the
+    writer is dropped without closing are lost and the open part files are
+    never sealed (read_completed_ids() discards those). Leaving the context
+    on an exception closes the files without sealing them.
+    """
+
+    def __init__(self, directory: str, format: str = "parquet", row_group_size: int = 10000,
+                 compression: str = "zstd"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown columnar format {format}; expected one of {', '.join(FORMATS)}")
+        self.pa = _require_pyarrow()
+        self.directory = directory
+        self.format = format
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schemas = table_schemas()
+        self.encounters_written = 0
+
+        for table in TABLES:
+            os.makedirs(os.path.join(directory, table), exist_ok=True)
+        self._part = _next_part_number(directory)
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {table: [] for table in TABLES}
+        self._writers: Dict[str, Any] = {}
+        self._paths: Dict[str, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_writers()
+
+    def write(self, encounter_id: str, results: Dict[str, Any]):
+        rows_by_table = flatten_results(encounter_id, results)
+        # Buffer every table's rows before flushing any, so a part never holds half a document
+        for table, rows in rows_by_table.items():
+            self._buffers[table].extend(rows)
+        for table in TABLES:
+            if len(self._buffers[table]) >= self.row_group_size:
+                self._flush_table(table)
+        self.encounters_written += 1
+
+    def flush(self):
+        for table in TABLES:
+            self._flush_table(table)
+
+    def rotate(self):
+        """Finish and seal the current part files so everything written so far is durable and readable"""
+        self.flush()
+        self._seal()
+        self._part += 1
+
+    def close(self):
+        self.flush()
+        self._seal()
+
+    def _seal(self):
+        """Close the part's files, fsync them, then write its marker"""
+        paths = self._paths
+        self._close_writers()
+        if not paths:
+            return
+        for path in paths.values():
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+        marker = _marker_path(self.directory, self._part, self.format)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker + ".tmp", "w") as f:
+            json.dump({"tables": sorted(paths)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marker + ".tmp", marker)
+
+    def _flush_table(self, table: str):
+        rows = self._buffers[table]
+        if not rows:
+            return
+        batch = self.pa.Table.from_pylist(rows, schema=self.schemas[table])
+        writer = self._writer(table)
+        if self.format == "parquet":
+            writer.write_table(batch, row_group_size=self.row_group_size)
+        else:
+            writer.write_table(batch, max_chunksize=self.row_group_size)
+        self._buffers[table] = []
+
+    def _writer(self, table: str):
+        if table not in self._writers:
+            path = _part_path(self.directory, table, self._part, self.format)
+            self._paths[table] = path
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writers[table] = pq.ParquetWriter(path, self.schemas[table], compression=self.compression)
+            else:
+                options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+                self._writers[table] = self.pa.ipc.new_file(path, self.schemas[table], options=options)
+        return self._writers[table]
+
+    def _close_writers(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        self._paths = {}
+
+
+def read_table(directory: str, table: str, columns: Optional[List[str]] = None, format: str = "parquet"):
+    """Read one exported table across all of its part files, only loading `columns`"""
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(os.path.join(directory, table), format="ipc" if format == "arrow" else format)
+    return dataset.to_table(columns=columns) if dataset.files else table_schemas()[table].empty_table()
+
+
+def read_completed_ids(directory: str) -> Set[str]:
+    """Encounter ids in sealed parts; unsealed parts, left by a crash, are removed from every table"""
+    completed: Set[str] = set()
+    parts = {
+        (int(match.group(1)), match.group(2))
+        for table in TABLES if os.path.isdir(os.path.join(directory, table))
+        for match in map(_PART_PATTERN.match, os.listdir(os.path.join(directory, table))) if match
+    }
+    if not parts:
+        return completed
+
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+    for part, format in sorted(parts):
+        if not os.path.exists(_marker_path(directory, part, format)):
+            logger.warning(f"Removing unsealed part {part} from {directory}")
+            for table in TABLES:
+                stale = _part_path(directory, table, part, format)
+                if os.path.exists(stale):
+                    os.remove(stale)
+            continue
+        path = _part_path(directory, "summaries", part, format)
+        if not os.path.exists(path):
+            continue
+        if format == "parquet":
+            ids = pq.read_table(path, columns=["encounter_id"]).column("encounter_id")
+        else:
+            with pa.memory_map(path) as source:
+                ids = pa.ipc.open_file(source).read_all().column("encounter_id")
+        completed.update(ids.to_pylist())
+    return completed
+
+
+def _part_path(directory: str, table: str, part: int, format: str) -> str:
+    return os.path.join(directory, table, f"part-{part:05d}{FORMATS[format]}")
+
+
+def _marker_path(directory: str, part: int, format: str) -> str:
+    return os.path.join(directory, "_sealed", f"part-{part:05d}{FORMATS[format]}")
+
+
+def _next_part_number(directory: str) -> int:
+    parts = [
+        int(match.group(1))
+        for table in TABLES if os.path.isdir(os.path.join(directory, table))
+        for match in map(_PART_PATTERN.match, os.listdir(os.path.join(directory, table))) if match
+    ]
+    return max(parts, default=-1) + 1
@@ -0,0 +1,160 @@
+"""
+Central thread and process configuration for API workers and batch jobs.
+
+Every API worker process runs torch / ONNX Runtime intra-op threads, BLAS
+threads, the stage scheduler, the job queue and the request thread pool.
+Left at their defaults each of those sizes itself to the whole machine, so
+several workers per node oversubscribe the cores and tail latency spikes.
+plan_concurrency() splits the cores available to this process (CPU
+affinity and cgroup quota) evenly between the workers on the node and sizes
+each pool from that per-worker budget; apply_concurrency() installs the
+plan. Explicit environment variables always override the derived values:
+
+    MEDICAL_NLP_API_WORKERS        worker processes per node (falls back to WEB_CONCURRENCY, then 1)
+    MEDICAL_NLP_INTRA_OP_THREADS   torch / ONNX Runtime intra-op threads
+    MEDICAL_NLP_INTER_OP_THREADS   torch inter-op threads
+    MEDICAL_NLP_BLAS_THREADS       OpenMP / MKL / OpenBLAS threads
+    MEDICAL_NLP_SPACY_PROCESSES    spaCy nlp.pipe n_process
+    MEDICAL_NLP_STAGE_WORKERS      pipeline stage scheduler threads
+    MEDICAL_NLP_JOB_WORKERS        background job queue workers
+    MEDICAL_NLP_THREADPOOL_SIZE    request thread pool (run_in_threadpool)
+
+Run `python benchmark_concurrency.py` to measure the best split for a box.
+"""
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_BLAS_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+@dataclass
+class ConcurrencyPlan:
+    cpus: int
+    api_workers: int
+    intra_op_threads: int
+    inter_op_threads: int
+    blas_threads: int
+    spacy_n_process: int
+    stage_workers: int
+    job_workers: int
+    threadpool_size: int
+
+    def as_env(self) -> Dict[str, str]:
+        """The plan as the environment variables the pipeline components read"""
+        env = {
+            "MEDICAL_NLP_API_WORKERS": self.api_workers,
+            "MEDICAL_NLP_INTRA_OP_THREADS": self.intra_op_threads,
+            "MEDICAL_NLP_INTER_OP_THREADS": self.inter_op_threads,
+            "MEDICAL_NLP_BLAS_THREADS": self.blas_threads,
+            "MEDICAL_NLP_SPACY_PROCESSES": self.spacy_n_process,
+            "MEDICAL_NLP_STAGE_WORKERS": self.stage_workers,
+            "MEDICAL_NLP_JOB_WORKERS": self.job_workers,
+            "MEDICAL_NLP_THREADPOOL_SIZE": self.threadpool_size,
+        }
+        return {name: str(value) for name, value in env.items()}
+
+
+def available_cpus() -> int:
+    """Cores this process may use: its CPU affinity, capped by a cgroup CPU quota if one is set"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return max(1, cpus)
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    # cgroup v2, then v1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def plan_concurrency(cpus: Optional[int] = None, api_workers: Optional[int] = None) -> ConcurrencyPlan:
+    """Split `cpus` (default: available_cpus()) between `api_workers` processes"""
+    cpus = cpus or available_cpus()
+    if api_workers is None:
+        api_workers = _env_int("MEDICAL_NLP_API_WORKERS", _env_int("WEB_CONCURRENCY", 1))
+    api_workers = max(1, api_workers)
+    budget = max(1, cpus // api_workers)
+    intra_op_threads = _env_int("MEDICAL_NLP_INTRA_OP_THREADS", budget)
+    return ConcurrencyPlan(
+        cpus=cpus,
+        api_workers=api_workers,
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=_env_int("MEDICAL_NLP_INTER_OP_THREADS", 1),
+        blas_threads=_env_int("MEDICAL_NLP_BLAS_THREADS", intra_op_threads),
+        # Workers are already separate processes; forking spaCy inside them only adds contention
+        spacy_n_process=_env_int("MEDICAL_NLP_SPACY_PROCESSES", 1),
+        stage_workers=_env_int("MEDICAL_NLP_STAGE_WORKERS", min(4, budget)),
+        job_workers=_env_int("MEDICAL_NLP_JOB_WORKERS", max(1, min(2, budget))),
+        threadpool_size=_env_int("MEDICAL_NLP_THREADPOOL_SIZE", max(4, 2 * budget)),
+    )
+
+
+def apply_concurrency(plan: ConcurrencyPlan) -> ConcurrencyPlan:
+    """Export the plan to the environment and resize the thread pools of libraries already loaded
+
+    Call it before pipeline components are built. BLAS libraries read their
+    thread count when first loaded, so pools that already exist are resized
+    through threadpoolctl when it is installed.
+    """
+    for name, value in plan.as_env().items():
+        os.environ[name] = value
+    for name in _BLAS_ENV_VARS:
+        os.environ.setdefault(name, str(plan.blas_threads))
+
+    try:
+        import torch
+        torch.set_num_threads(plan.intra_op_threads)
+        try:
+            torch.set_num_interop_threads(plan.inter_op_threads)
+        except RuntimeError:
+            # Only allowed before the first inter-op parallel work in the process
+            logger.debug("torch inter-op threads already fixed for this process")
+    except ImportError:
+        pass
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(plan.blas_threads)
+    except ImportError:
+        pass
+
+    logger.info(f"Concurrency plan for {plan.api_workers} worker(s) on {plan.cpus} cores: "
+                f"{plan.intra_op_threads} intra-op, {plan.blas_threads} BLAS, "
+                f"{plan.stage_workers} stage, {plan.threadpool_size} request threads")
+    return plan
+
+
+def set_threadpool_size(plan: ConcurrencyPlan):
+    """Size the thread pool behind run_in_threadpool; call from inside the running event loop"""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = plan.threadpool_size
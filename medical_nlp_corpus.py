@@ -0,0 +1,293 @@
+
+import json
+import logging
+import mmap
+import os
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CORPUS_EXTENSIONS = (".txt", ".json", ".jsonl")
+
+
+def parse_corpus_file(name: str, data: bytes) -> Iterator[Tuple[str, str]]:
+    """Yield (document_id, conversation_text) pairs from one .txt/.json/.jsonl file"""
+    lower = name.lower()
+    if lower.endswith(".txt"):
+        yield name, data.decode("utf-8")
+        return
+    if lower.endswith(".jsonl"):
+        records = [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+    elif lower.endswith(".json"):
+        payload = json.loads(data)
+        records = payload if isinstance(payload, list) else [payload]
+    else:
+        return
+
+    for i, record in enumerate(records):
+        yield _record_document(name, i, record)
+
+
+def iter_jsonl_documents(stream: IO[str], name: str = "stdin") -> Iterator[Tuple[str, str]]:
+    """Lazily yield documents from a JSONL stream, one record per line"""
+    i = 0
+    for line in stream:
+        if line.strip():
+            yield _record_document(name, i, json.loads(line))
+            i += 1
+
+
+def iter_path_documents(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield documents from a corpus file or every corpus file under a directory, in sorted order
+
+    Document ids of files found in a directory are relative to it, so they
+    stay stable when the directory is moved.
+    """
+    if not os.path.isdir(path):
+        if path.lower().endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                yield from iter_jsonl_documents(f, os.path.basename(path))
+        else:
+            with open(path, "rb") as f:
+                yield from parse_corpus_file(os.path.basename(path), f.read())
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.lower().endswith(CORPUS_EXTENSIONS):
+                continue
+            full_path = os.path.join(root, filename)
+            name = os.path.relpath(full_path, path)
+            if filename.lower().endswith(".jsonl"):
+                with open(full_path, encoding="utf-8") as f:
+                    yield from iter_jsonl_documents(f, name)
+            else:
+                with open(full_path, "rb") as f:
+                    yield from parse_corpus_file(name, f.read())
+
+
+def _record_document(name: str, index: int, record) -> Tuple[str, str]:
+    if isinstance(record, str):
+        return f"{name}#{index}", record
+    text = record.get("conversation_text") or record.get("text", "")
+    return str(record.get("document_id") or f"{name}#{index}"), text
+
+
+INDEX_DTYPE = np.dtype([("start", "<u8"), ("length", "<u4")])
+INDEX_VERSION = 1
+DEFAULT_TEXT_SEPARATOR = b"\f"
+
+
+@dataclass
+class CorpusDocument:
+    """One transcript as a zero-copy view of the mapped corpus file
+
+    `raw` is only valid while the MappedCorpus it came from is open.
+    """
+    index: int
+    document_id: str
+    start: int
+    raw: memoryview
+    decoded: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.raw)
+
+    @property
+    def text(self) -> str:
+        if self.decoded is None:
+            self.decoded = str(self.raw, "utf-8")
+        return self.decoded
+
+
+class MappedCorpus:
+    """Memory-mapped JSONL or separator-delimited text corpus with a persistent offset index.
+
+    Documents are located once by scanning the mapping for record
+    boundaries; their (start, length) byte spans are saved next to the
+    corpus as <path>.idx and reused while the corpus file is unchanged, so
+    later opens, len() and random access cost no scan. Text corpora hold
+    one transcript per record, split on `separator` (a form feed by default).
+    """
+
+    def __init__(self, path: str, format: Optional[str] = None, separator: bytes = DEFAULT_TEXT_SEPARATOR,
+                 index_path: Optional[str] = None):
+        self.path = path
+        self.format = format or ("jsonl" if path.lower().endswith(".jsonl") else "text")
+        if self.format not in ("jsonl", "text"):
+            raise ValueError(f"Unknown corpus format {self.format}")
+        self.separator = b"\n" if self.format == "jsonl" else separator
+        self.name = os.path.basename(path)
+        self.index_path = index_path or path + ".idx"
+
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._view = memoryview(self._mmap)
+        self.spans = self._load_or_build_index(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._mmap, mmap.mmap):
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Documents still hold views into the mapping; it is unmapped once they are freed
+                pass
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, index: int) -> CorpusDocument:
+        start, length = self.spans[index]
+        start, length = int(start), int(length)
+        raw = self._view[start:start + length]
+        if self.format == "text":
+            return CorpusDocument(index, f"{self.name}#{index}", start, raw)
+
+        document_id, text = _record_document(self.name, index, json.loads(bytes(raw)))
+        return CorpusDocument(index, document_id, start, raw, decoded=text)
+
+    def __iter__(self) -> Iterator[CorpusDocument]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_documents(self, start: int = 0) -> Iterator[Tuple[str, str]]:
+        """(document_id, text) pairs, like iter_jsonl_documents() and iter_path_documents()
+
+        process_batch() takes bare texts: pass it `(text for _, text in corpus.iter_documents())`.
+        """
+        for index in range(start, len(self)):
+            document = self[index]
+            yield document.document_id, document.text
+
+    def file_offsets(self, document: CorpusDocument, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copies of `entities` with file_start/file_end byte offsets into the corpus file
+
+        Offsets are None when the transcript's position inside a JSON record
+        cannot be determined.
+        """
+        char_to_byte = self._char_byte_offsets(document)
+        located = []
+        for entity in entities:
+            if char_to_byte is None or entity["end"] >= len(char_to_byte):
+                file_start = file_end = None
+            else:
+                file_start = document.start + char_to_byte[entity["start"]]
+                file_end = document.start + char_to_byte[entity["end"]]
+            located.append({**entity, "file_start": file_start, "file_end": file_end})
+        return located
+
+    def _char_byte_offsets(self, document: CorpusDocument) -> Optional[List[int]]:
+        """Byte offset within the record of every character of the transcript, plus its end"""
+        raw = bytes(document.raw)
+        if self.format == "text":
+            text = raw.decode("utf-8")
+            offsets, position = [], 0
+            for char in text:
+                offsets.append(position)
+                position += len(char.encode("utf-8"))
+            offsets.append(position)
+            return offsets
+
+        if raw.startswith(b'"'):
+            value_starts = [1]
+        else:
+            matches = (re.search(re.escape(key) + rb'\s*:\s*"', raw) for key in (b'"conversation_text"', b'"text"'))
+            value_starts = [match.end() for match in matches if match]
+        for value_start in value_starts:
+            offsets = _json_string_offsets(raw, value_start)
+            # Only trust a literal that decodes to exactly the transcript's length
+            if offsets is not None and len(offsets) == len(document.text) + 1:
+                return offsets
+        return None
+
+    def _load_or_build_index(self, size: int) -> np.ndarray:
+        mtime = os.path.getmtime(self.path)
+        header = {"version": INDEX_VERSION, "size": size, "mtime": mtime,
+                  "format": self.format, "separator": self.separator.hex()}
+        if os.path.exists(self.index_path):
+            try:
+                with np.load(self.index_path) as stored:
+                    if json.loads(str(stored["header"])) == header:
+                        return np.array(stored["spans"])
+            except (OSError, ValueError, KeyError):
+                pass
+            logger.info(f"Rebuilding stale offset index {self.index_path}")
+
+        spans = self._scan(size)
+        try:
+            with open(self.index_path, "wb") as f:
+                np.savez(f, header=np.array(json.dumps(header)), spans=spans)
+        except OSError as e:
+            logger.warning(f"Could not save offset index {self.index_path}: {str(e)}")
+        return spans
+
+    def _scan(self, size: int) -> np.ndarray:
+        """(start, length) of every non-blank record, found with mmap.find so nothing is copied"""
+        starts, lengths = array("Q"), array("I")
+        position = 0
+        while position < size:
+            boundary = self._mmap.find(self.separator, position)
+            end = size if boundary == -1 else boundary
+            start, stop = position, end
+            while start < stop and self._mmap[start:start + 1].isspace():
+                start += 1
+            while stop > start and self._mmap[stop - 1:stop].isspace():
+                stop -= 1
+            if stop > start:
+                starts.append(start)
+                lengths.append(stop - start)
+            position = end + len(self.separator)
+        spans = np.empty(len(starts), dtype=INDEX_DTYPE)
+        spans["start"] = np.frombuffer(starts, dtype=np.uint64) if starts else 0
+        spans["length"] = np.frombuffer(lengths, dtype=np.uint32) if lengths else 0
+        return spans
+
+
+_JSON_SIMPLE_ESCAPES = set(b'"\\/bfnrt')
+
+
+def _json_string_offsets(raw: bytes, position: int) -> Optional[List[int]]:
+    """Byte offset of each decoded character of the JSON string starting at `position`"""
+    offsets = []
+    while position < len(raw):
+        byte = raw[position]
+        if byte == ord('"'):
+            offsets.append(position)
+            return offsets
+        offsets.append(position)
+        if byte == ord("\\"):
+            escape = raw[position + 1]
+            if escape == ord("u"):
+                code = int(raw[position + 2:position + 6], 16)
+                position += 6
+                if 0xD800 <= code < 0xDC00 and raw[position:position + 2] == b"\\u":
+                    position += 6
+            elif escape in _JSON_SIMPLE_ESCAPES:
+                position += 2
+            else:
+                return None
+        elif byte < 0x80:
+            position += 1
+        elif byte >= 0xF0:
+            position += 4
+        elif byte >= 0xE0:
+            position += 3
+        else:
+            position += 2
+    return None
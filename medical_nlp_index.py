@@ -0,0 +1,607 @@
+
+import json
+import logging
+import mmap
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from medical_nlp_filelock import FileLock, file_stamp
+from medical_nlp_store import format_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join("index", "entities")
+
+# doc number -> [(start, end), ...]
+Postings = Dict[int, List[Tuple[int, int]]]
+
+
+def encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_postings(postings: Postings) -> bytes:
+    """Delta + varint encode a posting list: docs ascending, offsets ascending within a doc"""
+    out = bytearray()
+    encode_varint(len(postings), out)
+    previous_doc = 0
+    for doc in sorted(postings):
+        spans = sorted(postings[doc])
+        encode_varint(doc - previous_doc, out)
+        encode_varint(len(spans), out)
+        previous_start = 0
+        for start, end in spans:
+            encode_varint(start - previous_start, out)
+            encode_varint(end - start, out)
+            previous_start = start
+        previous_doc = doc
+    return bytes(out)
+
+
+def decode_postings(buf, pos: int = 0) -> Postings:
+    postings: Postings = {}
+    num_docs, pos = decode_varint(buf, pos)
+    doc = 0
+    for _ in range(num_docs):
+        delta, pos = decode_varint(buf, pos)
+        doc += delta
+        count, pos = decode_varint(buf, pos)
+        spans = []
+        start = 0
+        for _ in range(count):
+            start_delta, pos = decode_varint(buf, pos)
+            length, pos = decode_varint(buf, pos)
+            start += start_delta
+            spans.append((start, start + length))
+        postings[doc] = spans
+    return postings
+
+
+def normalize_term(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _index_key(label: str, term: str) -> str:
+    return f"{label.upper()}\x1f{term}"
+
+
+class _Segment:
+    """Immutable on-disk posting file, memory-mapped, plus its term dictionary"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.postings_path = os.path.join(directory, f"{name}.postings")
+        with open(os.path.join(directory, f"{name}.terms.json")) as f:
+            self.terms: Dict[str, int] = json.load(f)
+        self._file = open(self.postings_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def postings(self, key: str) -> Postings:
+        offset = self.terms.get(key)
+        if offset is None:
+            return {}
+        return decode_postings(self._mmap, offset)
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def write(directory: str, name: str, postings_by_key: Dict[str, Postings]) -> "_Segment":
+        data = bytearray()
+        terms = {}
+        for key in sorted(postings_by_key):
+            if not postings_by_key[key]:
+                continue
+            terms[key] = len(data)
+            data += encode_postings(postings_by_key[key])
+        _atomic_write(os.path.join(directory, f"{name}.postings"), bytes(data))
+        _atomic_write(os.path.join(directory, f"{name}.terms.json"), json.dumps(terms).encode())
+        return _Segment(directory, name)
+
+
+class EntityIndex:
+    """Inverted index from (entity label, normalized form) to encounter/offset postings.
+
+    Every add or removal is first appended (and fsynced) to a journal, so a
+    crash loses nothing. Journaled documents are held in an in-memory buffer
+    and folded into immutable, memory-mapped segments every `flush_every`
+    documents; segments are merged once there are more than `max_segments`.
+    Re-indexing an encounter tombstones its previous document.
+
+    Several processes can share one directory: writes hold an inter-process
+    lock, and every operation first catches up with the journal entries and
+    segments written by the others.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_every: int = 500,
+                 max_segments: int = 8):
+        self.directory = directory or os.environ.get("MEDICAL_NLP_INDEX_DIR", DEFAULT_INDEX_DIR)
+        self.flush_every = flush_every
+        self.max_segments = max_segments
+        os.makedirs(self.directory, exist_ok=True)
+        self._manifest_path = os.path.join(self.directory, "manifest.json")
+
+        self._lock = FileLock(os.path.join(self.directory, "index.lock"))
+        self._segments: List[_Segment] = []
+        with self._lock:
+            self._load()
+
+    def add(self, encounter_id: str, entities: Iterable[Dict[str, Any]],
+            encounter_date: Optional[datetime] = None, patient_id: Optional[str] = None) -> int:
+        """Index one analysis result's entities and return the internal doc number"""
+        encounter_date = format_date(encounter_date or datetime.now(timezone.utc))
+        postings = [
+            [entity["label"].upper(), normalize_term(entity.get("normalized_form") or entity["text"]),
+             entity["start"], entity["end"]]
+            for entity in entities
+        ]
+
+        with self._lock:
+            self._refresh()
+            record = {"doc": self._next_doc, "encounter_id": encounter_id,
+                      "encounter_date": encounter_date, "patient_id": patient_id, "entities": postings}
+            self._append_journal(record)
+            if self._buffered_docs >= self.flush_every:
+                self.flush()
+        return record["doc"]
+
+    def remove(self, encounter_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            doc = self._doc_by_encounter.get(encounter_id)
+            if doc is None:
+                return False
+            self._append_journal({"delete": doc})
+            return True
+
+    def flush(self):
+        """Write buffered postings as a new segment and record it in the manifest"""
+        with self._lock:
+            self._refresh()
+            self._flush_buffer()
+            if len(self._segments) > self.max_segments:
+                self.compact()
+
+    def compact(self):
+        """Merge all segments into one, snapshot the doc table and start a new journal"""
+        with self._lock:
+            self._refresh()
+            self._flush_buffer()
+            if len(self._segments) < 2 and not self._deleted:
+                return
+            merged: Dict[str, Postings] = {}
+            for segment in self._segments:
+                for key in segment.terms:
+                    target = merged.setdefault(key, {})
+                    for doc, spans in segment.postings(key).items():
+                        if doc not in self._deleted:
+                            target[doc] = spans
+            old_segments = self._segments
+            old_journal = self._journal_path()
+            self._segments = [_Segment.write(self.directory, self._next_segment_name(), merged)]
+
+            for doc in self._deleted:
+                self.docs.pop(doc, None)
+            self._deleted = set()
+            docs_data = "".join(json.dumps(self.docs[doc]) + "\n" for doc in sorted(self.docs))
+            _atomic_write(os.path.join(self.directory, "docs.jsonl"), docs_data.encode())
+            self._journal = f"journal-{self._generation:06d}.jsonl"
+            self._journal_offset = 0
+            self._journal_flushed = 0
+            self._write_manifest()
+
+            for segment in old_segments:
+                segment.close()
+                for suffix in (".postings", ".terms.json"):
+                    os.remove(os.path.join(self.directory, segment.name + suffix))
+            if os.path.exists(old_journal):
+                os.remove(old_journal)
+            logger.info(f"Compacted {len(old_segments)} index segments into {self._segments[0].name}")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+
+    def postings(self, term: str, label: Optional[str] = None) -> Postings:
+        """Live postings for a term, across every label unless one is given"""
+        term = normalize_term(term)
+        with self._lock:
+            self._refresh()
+            labels = [label.upper()] if label else sorted(self._labels_by_term.get(term, ()))
+            result: Postings = {}
+            for current_label in labels:
+                key = _index_key(current_label, term)
+                for segment in self._segments:
+                    _merge_postings(result, segment.postings(key))
+                _merge_postings(result, self._buffer.get(key, {}))
+            for doc in self._deleted.intersection(result):
+                del result[doc]
+            return result
+
+    def search(self, query: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, limit: int = 100) -> Dict[str, Any]:
+        """Evaluate a boolean/proximity query and return matching encounters, newest first"""
+        node = QueryParser(query).parse()
+        since_key = format_date(since) if since else None
+        until_key = format_date(until) if until else None
+
+        with self._lock:
+            self._refresh()
+            matches = node.evaluate(self)
+            hits = []
+            for doc, spans in matches.items():
+                meta = self.docs.get(doc)
+                if meta is None or doc in self._deleted:
+                    continue
+                if since_key and meta["encounter_date"] < since_key:
+                    continue
+                if until_key and meta["encounter_date"] > until_key:
+                    continue
+                hits.append({
+                    "encounter_id": meta["encounter_id"],
+                    "patient_id": meta.get("patient_id"),
+                    "encounter_date": meta["encounter_date"],
+                    "matches": [{"start": start, "end": end} for start, end in sorted(spans)]
+                })
+        hits.sort(key=lambda hit: hit["encounter_date"], reverse=True)
+        return {"total": len(hits), "results": hits[:limit]}
+
+    def live_docs(self) -> Set[int]:
+        return set(self.docs) - self._deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "documents": len(self.docs) - len(self._deleted),
+                "terms": sum(len(labels) for labels in self._labels_by_term.values()),
+                "segments": len(self._segments),
+                "buffered_documents": self._buffered_docs
+            }
+
+    def _append_journal(self, record: Dict[str, Any]):
+        """Durably append one record, then apply it; the caller holds the lock and has refreshed"""
+        path = self._journal_path()
+        with open(path, "ab") as f:
+            if f.tell() > self._journal_offset:
+                # Partial line left by a writer that crashed mid-append
+                f.truncate(self._journal_offset)
+            f.write((json.dumps(record) + "\n").encode())
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        self._apply(record, buffered=True)
+
+    def _apply(self, record: Dict[str, Any], buffered: bool):
+        """Apply one doc or delete record; postings of buffered docs go to the in-memory buffer"""
+        if "delete" in record:
+            doc = record["delete"]
+            self._deleted.add(doc)
+            meta = self.docs.get(doc)
+            if meta is not None and self._doc_by_encounter.get(meta["encounter_id"]) == doc:
+                del self._doc_by_encounter[meta["encounter_id"]]
+            return
+
+        doc = record["doc"]
+        previous = self._doc_by_encounter.get(record["encounter_id"])
+        if previous is not None and previous != doc:
+            self._deleted.add(previous)
+        self.docs[doc] = {key: record.get(key) for key in ("doc", "encounter_id", "encounter_date", "patient_id")}
+        self._doc_by_encounter[record["encounter_id"]] = doc
+        self._next_doc = max(self._next_doc, doc + 1)
+        if not buffered:
+            return
+        self._buffered_docs += 1
+        for label, term, start, end in record.get("entities", ()):
+            self._buffer.setdefault(_index_key(label, term), {}).setdefault(doc, []).append((start, end))
+            self._labels_by_term.setdefault(term, set()).add(label)
+
+    def _flush_buffer(self):
+        if self._journal_flushed == self._journal_offset:
+            return
+        if self._buffer:
+            self._segments.append(_Segment.write(self.directory, self._next_segment_name(), self._buffer))
+            self._buffer = {}
+        self._buffered_docs = 0
+        self._journal_flushed = self._journal_offset
+        self._write_manifest()
+
+    def _next_segment_name(self) -> str:
+        self._generation += 1
+        return f"segment-{self._generation:06d}"
+
+    def _journal_path(self) -> str:
+        return os.path.join(self.directory, self._journal)
+
+    def _refresh(self):
+        """Catch up with segments and journal entries written by other processes; caller holds the lock"""
+        if file_stamp(self._manifest_path) != self._manifest_stamp:
+            for segment in self._segments:
+                segment.close()
+            self._load()
+        else:
+            self._read_journal()
+
+    def _read_journal(self):
+        path = self._journal_path()
+        if not os.path.exists(path) or os.path.getsize(path) <= self._journal_offset:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        position = self._journal_offset
+        for line in complete.splitlines(keepends=True):
+            position += len(line)
+            if line.strip():
+                self._apply(json.loads(line), buffered=position > self._journal_flushed)
+        self._journal_offset = position
+
+    def _load(self):
+        self.docs: Dict[int, Dict[str, Any]] = {}
+        self._doc_by_encounter: Dict[str, int] = {}
+        self._deleted: Set[int] = set()
+        self._buffer: Dict[str, Postings] = {}
+        self._buffered_docs = 0
+        self._labels_by_term: Dict[str, Set[str]] = {}
+        self._next_doc = 0
+        self._generation = 0
+        self._journal = "journal.jsonl"
+        self._journal_offset = 0
+        self._journal_flushed = 0
+        self._segments = []
+        self._manifest_stamp = file_stamp(self._manifest_path)
+        if self._manifest_stamp is None:
+            return
+        with open(self._manifest_path) as f:
+            manifest = json.load(f)
+        self._generation = manifest.get("generation", 0)
+        self._journal = manifest.get("journal", self._journal)
+        self._journal_flushed = manifest.get("journal_flushed", 0)
+        self._segments = [_Segment(self.directory, name) for name in manifest["segments"]]
+        for segment in self._segments:
+            for key in segment.terms:
+                label, term = key.split("\x1f", 1)
+                self._labels_by_term.setdefault(term, set()).add(label)
+
+        # Doc table snapshot from the last compaction, then the journal since
+        docs_path = os.path.join(self.directory, "docs.jsonl")
+        if os.path.exists(docs_path):
+            with open(docs_path) as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line), buffered=False)
+        self._read_journal()
+        self._next_doc = max(self._next_doc, manifest.get("next_doc", 0))
+        logger.info(f"Loaded entity index with {len(self.live_docs())} documents "
+                    f"in {len(self._segments)} segments")
+
+    def _write_manifest(self):
+        self._generation += 1
+        manifest = {"segments": [segment.name for segment in self._segments],
+                    "next_doc": self._next_doc, "generation": self._generation,
+                    "journal": self._journal, "journal_flushed": self._journal_flushed}
+        _atomic_write(self._manifest_path, json.dumps(manifest).encode())
+        self._manifest_stamp = file_stamp(self._manifest_path)
+
+
+def _merge_postings(target: Postings, source: Postings):
+    for doc, spans in source.items():
+        if doc in target:
+            target[doc] = sorted(set(target[doc]) | set(spans))
+        else:
+            target[doc] = list(spans)
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class QueryNode:
+    def evaluate(self, index: EntityIndex) -> Postings:
+        raise NotImplementedError
+
+
+class TermNode(QueryNode):
+    def __init__(self, term: str, label: Optional[str] = None):
+        self.term = term
+        self.label = label
+
+    def evaluate(self, index: EntityIndex) -> Postings:
+        return index.postings(self.term, self.label)
+
+
+class AndNode(QueryNode):
+    def __init__(self, left: QueryNode, right: QueryNode):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, index: EntityIndex) -> Postings:
+        left = self.left.evaluate(index)
+        if not left:
+            return {}
+        right = self.right.evaluate(index)
+        return {doc: sorted(set(left[doc]) | set(right[doc])) for doc in left.keys() & right.keys()}
+
+
+class OrNode(QueryNode):
+    def __init__(self, left: QueryNode, right: QueryNode):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, index: EntityIndex) -> Postings:
+        result = dict(self.left.evaluate(index))
+        _merge_postings(result, self.right.evaluate(index))
+        return result
+
+
+class NotNode(QueryNode):
+    def __init__(self, operand: QueryNode):
+        self.operand = operand
+
+    def evaluate(self, index: EntityIndex) -> Postings:
+        excluded = self.operand.evaluate(index)
+        return {doc: [] for doc in index.live_docs() if doc not in excluded}
+
+
+class NearNode(QueryNode):
+    """Both operands match within `distance` characters of each other in the same encounter"""
+
+    def __init__(self, left: QueryNode, right: QueryNode, distance: int):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def evaluate(self, index: EntityIndex) -> Postings:
+        left = self.left.evaluate(index)
+        if not left:
+            return {}
+        right = self.right.evaluate(index)
+        result: Postings = {}
+        for doc in left.keys() & right.keys():
+            spans = self._near_spans(left[doc], right[doc])
+            if spans:
+                result[doc] = spans
+        return result
+
+    def _near_spans(self, left: List[Tuple[int, int]], right: List[Tuple[int, int]]):
+        # Both lists are sorted by start; sweep a window over `right` for each left span
+        matched = set()
+        j = 0
+        for span in left:
+            while j < len(right) and right[j][1] + self.distance < span[0]:
+                j += 1
+            k = j
+            while k < len(right) and right[k][0] <= span[1] + self.distance:
+                matched.add(span)
+                matched.add(right[k])
+                k += 1
+        return sorted(matched)
+
+
+class QueryParser:
+    """Parse queries such as `lumbar spine AND (physiotherapy OR "pain killers") AND NOT surgery`.
+
+    Terms are runs of bare words or quoted phrases and may carry a label
+    prefix (`SYMPTOM:back pain`). `a NEAR/50 b` requires matches within 50
+    characters. Precedence from loosest: OR, AND, NEAR, NOT.
+    """
+
+    TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|(NEAR/\d+)\b|(AND|OR|NOT)\b|([^\s()"]+))')
+
+    def __init__(self, query: str):
+        self.tokens = self._tokenize(query)
+        self.pos = 0
+
+    def parse(self) -> QueryNode:
+        if not self.tokens:
+            raise ValueError("Empty search query")
+        node = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos][1]}' in search query")
+        return node
+
+    def _tokenize(self, query: str) -> List[Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        query = query.rstrip()
+        while pos < len(query):
+            match = self.TOKEN_RE.match(query, pos)
+            if not match:
+                raise ValueError(f"Cannot parse search query near '{query[pos:]}'")
+            lparen, rparen, phrase, near, operator, word = match.groups()
+            if lparen:
+                tokens.append(("(", lparen))
+            elif rparen:
+                tokens.append((")", rparen))
+            elif phrase is not None:
+                tokens.append(("phrase", phrase))
+            elif near:
+                tokens.append(("near", near))
+            elif operator:
+                tokens.append((operator, operator))
+            else:
+                tokens.append(("word", word))
+            pos = match.end()
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _parse_or(self) -> QueryNode:
+        node = self._parse_and()
+        while self._peek() == "OR":
+            self.pos += 1
+            node = OrNode(node, self._parse_and())
+        return node
+
+    def _parse_and(self) -> QueryNode:
+        node = self._parse_near()
+        while self._peek() == "AND":
+            self.pos += 1
+            node = AndNode(node, self._parse_near())
+        return node
+
+    def _parse_near(self) -> QueryNode:
+        node = self._parse_unary()
+        while self._peek() == "near":
+            distance = int(self.tokens[self.pos][1].split("/", 1)[1])
+            self.pos += 1
+            node = NearNode(node, self._parse_unary(), distance)
+        return node
+
+    def _parse_unary(self) -> QueryNode:
+        kind = self._peek()
+        if kind == "NOT":
+            self.pos += 1
+            return NotNode(self._parse_unary())
+        if kind == "(":
+            self.pos += 1
+            node = self._parse_or()
+            if self._peek() != ")":
+                raise ValueError("Unbalanced parentheses in search query")
+            self.pos += 1
+            return node
+        if kind in ("word", "phrase"):
+            return self._parse_term()
+        raise ValueError("Expected a term in search query")
+
+    def _parse_term(self) -> TermNode:
+        words = []
+        while self._peek() in ("word", "phrase"):
+            words.append(self.tokens[self.pos][1])
+            self.pos += 1
+        text = " ".join(words)
+        label = None
+        prefix, sep, rest = text.partition(":")
+        if sep and rest and prefix.replace("_", "").isalpha() and prefix.isupper():
+            label, text = prefix, rest
+        return TermNode(text, label)
@@ -0,0 +1,346 @@
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from medical_nlp_pipeline import PIPELINE_STAGES
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingStatus(str, Enum):
+    """Processing status enum"""
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobPriority(str, Enum):
+    """Priority lanes for queued analysis jobs"""
+    INTERACTIVE = "interactive"
+    BACKFILL = "backfill"
+
+
+FINISHED_STATUSES = (ProcessingStatus.COMPLETED, ProcessingStatus.FAILED, ProcessingStatus.CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds max_pending jobs"""
+
+
+@dataclass
+class Job:
+    job_id: str
+    conversation_text: str
+    priority: JobPriority
+    request: Dict[str, Any] = field(default_factory=dict)
+    batch_id: Optional[str] = None
+    status: ProcessingStatus = ProcessingStatus.PENDING
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    completed_stages: List[str] = field(default_factory=list)
+    current_stage: Optional[str] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def processing_time(self) -> Optional[float]:
+        if self.started_at is None or self.completed_at is None:
+            return None
+        return (self.completed_at - self.started_at).total_seconds()
+
+    def progress(self) -> Dict[str, Any]:
+        """Per-stage progress of the job"""
+        return {
+            "completed_stages": list(self.completed_stages),
+            "current_stage": self.current_stage,
+            "total_stages": len(PIPELINE_STAGES),
+            "fraction": len(self.completed_stages) / len(PIPELINE_STAGES)
+        }
+
+
+class JobQueue:
+    """Local job queue with a fixed worker pool and interactive/backfill priority lanes.
+
+    Workers always drain the interactive lane first. The first
+    `interactive_workers` workers never pick up backfill jobs, so a burst
+    of backfill work can't occupy the whole pool.
+    """
+
+    def __init__(self, pipeline, num_workers: Optional[int] = None,
+                 interactive_workers: Optional[int] = None, max_pending: int = 1000,
+                 retention_seconds: float = 3600):
+        self.pipeline = pipeline
+        self.num_workers = num_workers or int(os.environ.get("MEDICAL_NLP_JOB_WORKERS", 2))
+        if interactive_workers is None:
+            interactive_workers = int(os.environ.get("MEDICAL_NLP_INTERACTIVE_WORKERS", 1))
+        self.interactive_workers = min(interactive_workers, self.num_workers - 1) if self.num_workers > 1 else 0
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+
+        self.jobs: Dict[str, Job] = {}
+        self._listeners: Dict[str, List[Callable[[Job], None]]] = {}
+        self.batches: Dict[str, List[str]] = {}
+        self._batch_finished: Dict[str, List[str]] = {}
+        self._lanes: Dict[JobPriority, Deque[Job]] = {priority: deque() for priority in JobPriority}
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._shutdown = False
+
+    def start(self):
+        """Start the worker pool"""
+        with self._cond:
+            if self._workers:
+                return
+            self._shutdown = False
+            for index in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop, args=(index,), name=f"job-worker-{index}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        logger.info(
+            f"Job queue started with {self.num_workers} workers "
+            f"({self.interactive_workers} reserved for interactive jobs)"
+        )
+
+    def stop(self, timeout: float = 5.0):
+        """Stop accepting work and wait for the workers to exit"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, conversation_text: str, priority: JobPriority = JobPriority.INTERACTIVE,
+               request: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue a conversation for analysis"""
+        return self.submit_many([(conversation_text, request)], priority)[0]
+
+    def submit_many(self, items: List[Tuple[str, Optional[Dict[str, Any]]]],
+                    priority: JobPriority = JobPriority.BACKFILL,
+                    batch_id: Optional[str] = None) -> List[Job]:
+        """Queue (conversation_text, request) pairs, all or nothing, optionally under one batch id"""
+        jobs = [
+            Job(
+                job_id=str(uuid.uuid4()),
+                conversation_text=conversation_text,
+                priority=priority,
+                request=request or {},
+                batch_id=batch_id
+            )
+            for conversation_text, request in items
+        ]
+        with self._cond:
+            if self.pending_count() + len(jobs) > self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            self._prune_finished()
+            for job in jobs:
+                self.jobs[job.job_id] = job
+                self._lanes[priority].append(job)
+                if batch_id is not None:
+                    self.batches.setdefault(batch_id, []).append(job.job_id)
+            self._cond.notify_all()
+        return jobs
+
+    def batch_finished_since(self, batch_id: str, cursor: int = 0) -> Tuple[List[Job], List[str], int]:
+        """Jobs of a batch that finished after `cursor`, ids of those already pruned, and the next cursor"""
+        with self._cond:
+            finished = self._batch_finished.get(batch_id, [])
+            jobs, expired = [], []
+            for job_id in finished[cursor:]:
+                if job_id in self.jobs:
+                    jobs.append(self.jobs[job_id])
+                else:
+                    expired.append(job_id)
+            return jobs, expired, len(finished)
+
+    def batch_jobs(self, batch_id: str) -> Optional[List[Job]]:
+        """Jobs submitted under a batch id, in submission order"""
+        with self._cond:
+            job_ids = self.batches.get(batch_id)
+            if job_ids is None:
+                return None
+            return [self.jobs[job_id] for job_id in job_ids if job_id in self.jobs]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a pending job immediately, or a running job at its next stage boundary"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_requested.set()
+            cancelled = job.status == ProcessingStatus.PENDING
+            if cancelled:
+                self._lanes[job.priority].remove(job)
+                self._mark_finished(job, ProcessingStatus.CANCELLED)
+        if cancelled:
+            self._notify(job)
+        return job
+
+    def add_listener(self, job_id: str, callback: Callable[[Job], None]) -> bool:
+        """Call `callback(job)` on every status or progress change.
+
+        Callbacks run on the thread that changed the job, after the queue lock
+        is released, so slow callbacks delay only that job. Returns False,
+        without registering, if the job has already finished; the check and
+        the registration are atomic, so a callback sees a job finish at most once.
+        """
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is not None and job.finished:
+                return False
+            self._listeners.setdefault(job_id, []).append(callback)
+            return True
+
+    def remove_listener(self, job_id: str, callback: Callable[[Job], None]):
+        with self._cond:
+            listeners = self._listeners.get(job_id, [])
+            if callback in listeners:
+                listeners.remove(callback)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Block until the job finishes or the timeout expires"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def pending_count(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "pending": {priority.value: len(lane) for priority, lane in self._lanes.items()},
+                "processing": sum(1 for job in self.jobs.values()
+                                  if job.status == ProcessingStatus.PROCESSING)
+            }
+
+    def _next_job(self, worker_index: int) -> Optional[Job]:
+        """Pop the next job this worker may run, blocking until one is available"""
+        lanes = [JobPriority.INTERACTIVE]
+        if worker_index >= self.interactive_workers:
+            lanes.append(JobPriority.BACKFILL)
+
+        job = None
+        with self._cond:
+            while job is None and not self._shutdown:
+                lane = next((self._lanes[priority] for priority in lanes if self._lanes[priority]), None)
+                if lane is None:
+                    self._cond.wait()
+                    continue
+                job = lane.popleft()
+                job.status = ProcessingStatus.PROCESSING
+                job.started_at = datetime.now()
+                job.current_stage = PIPELINE_STAGES[0]
+        if job is not None:
+            self._notify(job)
+        return job
+
+    def _worker_loop(self, worker_index: int):
+        while True:
+            job = self._next_job(worker_index)
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job: Job):
+        start_time = time.perf_counter()
+        result = {}
+        try:
+            if job.cancel_requested.is_set():
+                raise JobCancelled()
+            for stage, stage_result in self.pipeline.iter_stages(job.conversation_text):
+                if job.cancel_requested.is_set():
+                    raise JobCancelled()
+                result[stage] = stage_result
+                with self._cond:
+                    job.completed_stages.append(stage)
+                    job.current_stage = self._next_stage(job)
+                self._notify(job)
+            job.result = result
+            self._finish(job, ProcessingStatus.COMPLETED)
+            logger.info(f"Job {job.job_id} completed in {time.perf_counter() - start_time:.2f}s")
+        except JobCancelled:
+            self._finish(job, ProcessingStatus.CANCELLED)
+            logger.info(f"Job {job.job_id} cancelled after {len(job.completed_stages)} stages")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, ProcessingStatus.FAILED)
+            logger.error(f"Async job {job.job_id} failed: {str(e)}")
+
+    def _next_stage(self, job: Job) -> Optional[str]:
+        # Independent stages can finish out of order, so report the first one still outstanding
+        return next((stage for stage in PIPELINE_STAGES if stage not in job.completed_stages), None)
+
+    def _finish(self, job: Job, status: ProcessingStatus):
+        with self._cond:
+            self._mark_finished(job, status)
+        self._notify(job)
+
+    def _mark_finished(self, job: Job, status: ProcessingStatus):
+        """Record the final status; the caller holds the lock and notifies listeners after releasing it"""
+        job.status = status
+        job.current_stage = None
+        job.completed_at = datetime.now()
+        job.done.set()
+        if job.batch_id is not None:
+            self._batch_finished.setdefault(job.batch_id, []).append(job.job_id)
+        self._cond.notify_all()
+
+    def _notify(self, job: Job):
+        """Run the job's listeners; never called with the lock held, so they can't stall the queue"""
+        with self._cond:
+            callbacks = list(self._listeners.get(job.job_id, []))
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"Job listener for {job.job_id} failed: {str(e)}")
+
+    def _prune_finished(self):
+        """Drop finished jobs older than the retention window"""
+        now = datetime.now()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and (now - job.completed_at).total_seconds() > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+            self._listeners.pop(job_id, None)
+        if expired:
+            for batch_id, job_ids in list(self.batches.items()):
+                remaining = [job_id for job_id in job_ids if job_id in self.jobs]
+                if remaining:
+                    self.batches[batch_id] = remaining
+                else:
+                    del self.batches[batch_id]
+                    self._batch_finished.pop(batch_id, None)
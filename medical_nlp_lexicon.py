@@ -0,0 +1,345 @@
+"""
+Rule tables (NER patterns, abbreviations, sentiment/intent keywords, SOAP
+section keywords) loaded from the JSON files in lexicons/ and packaged into a
+versioned, checksummed bundle.
+
+The bundle validates and versions the sources: it holds the tables as JSON
+plus the keyword matchers' trie-shaped patterns, so loading it skips the
+trie construction but still runs re.compile for every pattern (compiled
+regexes cannot be serialized). A load compiles each pattern once per process.
+
+    python medical_nlp_lexicon.py build      # lexicons/*.json -> lexicons/lexicon.bundle
+    python medical_nlp_lexicon.py show       # print the version and table sizes
+
+Running processes pick up a rebuilt bundle through LexiconRegistry.reload(),
+which swaps the loaded bundle atomically; requests that already hold the
+previous bundle finish with it.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Pattern, Set
+
+logger = logging.getLogger(__name__)
+
+LEXICON_DIR = os.environ.get(
+    "MEDICAL_NLP_LEXICON_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+)
+DEFAULT_BUNDLE_PATH = os.path.join(LEXICON_DIR, "lexicon.bundle")
+
+BUNDLE_MAGIC = b"MNLPLEX1"
+BUNDLE_FORMAT = 1
+
+SOURCE_TABLES = [
+    "medical_patterns",
+    "abbreviations",
+    "medical_sentiments",
+    "sentiment_rules",
+    "intent_patterns",
+    "soap_sections",
+]
+
+
+class LexiconError(Exception):
+    """Raised when lexicon sources or a bundle fail validation"""
+
+
+class KeywordMatcher:
+    """Finds which of a set of keywords occur as substrings of a text in one regex pass.
+
+    Keywords are compiled into a trie-shaped alternation inside a lookahead, so
+    the scan reports the longest keyword starting at each position; every
+    shorter keyword that is a prefix of it is added from a table built once.
+    """
+
+    def __init__(self, pattern: str, prefixes: Dict[str, List[str]]):
+        self.pattern = pattern
+        self.prefixes = prefixes
+        self._regex = re.compile(pattern) if pattern else None
+
+    @classmethod
+    def build(cls, keywords: List[str]) -> "KeywordMatcher":
+        words = sorted({keyword.lower() for keyword in keywords if keyword})
+        prefixes = {word: [other for other in words if word.startswith(other)] for word in words}
+        pattern = f"(?=({_trie_regex(words)}))" if words else ""
+        return cls(pattern, prefixes)
+
+    def find(self, text_lower: str) -> Set[str]:
+        """Keywords present in an already lower-cased text"""
+        if self._regex is None:
+            return set()
+        found = set()
+        for longest in {match.group(1) for match in self._regex.finditer(text_lower)}:
+            found.update(self.prefixes[longest])
+        return found
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"pattern": self.pattern, "prefixes": self.prefixes}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KeywordMatcher":
+        return cls(data["pattern"], data["prefixes"])
+
+
+def _trie_regex(words: List[str]) -> str:
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return f"(?:{body})?"
+        return body
+
+    return emit(trie)
+
+
+class LexiconBundle:
+    """Immutable view of one version of the rule tables, with its patterns compiled in memory"""
+
+    def __init__(self, tables: Dict[str, Any], version: str, built_at: str,
+                 matchers: Optional[Dict[str, KeywordMatcher]] = None):
+        self.tables = tables
+        self.version = version
+        self.built_at = built_at
+
+        self.abbreviations: Dict[str, str] = {key.upper(): value for key, value in tables["abbreviations"].items()}
+        # Keywords are matched against lower-cased text, so they are lower-cased too
+        self.medical_sentiments = _lowercase_table(tables["medical_sentiments"])
+        self.sentiment_rules: List[Dict[str, Any]] = [
+            {**rule, "keywords": [keyword.lower() for keyword in rule["keywords"]]}
+            for rule in tables["sentiment_rules"]["rules"]
+        ]
+        self.default_sentiment: Dict[str, Any] = tables["sentiment_rules"]["default"]
+        self.intent_patterns = _lowercase_table(tables["intent_patterns"])
+        self.section_keywords = _lowercase_table(tables["soap_sections"])
+
+        try:
+            self.medical_patterns: Dict[str, List[Pattern]] = {
+                label: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+                for label, patterns in tables["medical_patterns"].items()
+            }
+        except re.error as e:
+            raise LexiconError(f"Invalid pattern in medical_patterns: {e}") from e
+
+        self.matchers = matchers or {
+            "medical_sentiments": KeywordMatcher.build(_flatten(self.medical_sentiments)),
+            "sentiment_rules": KeywordMatcher.build(
+                [keyword for rule in self.sentiment_rules for keyword in rule["keywords"]]
+            ),
+            "intent_patterns": KeywordMatcher.build(_flatten(self.intent_patterns)),
+            "soap_sections": KeywordMatcher.build(_flatten(self.section_keywords)),
+        }
+
+    @classmethod
+    def from_sources(cls, source_dir: str = LEXICON_DIR) -> "LexiconBundle":
+        tables = load_source_tables(source_dir)
+        return cls(tables, _tables_version(tables), datetime.now().isoformat(timespec="seconds"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LexiconBundle":
+        """Verify and decode a bundle; its patterns are compiled here, on every load"""
+        if not data.startswith(BUNDLE_MAGIC):
+            raise LexiconError("Not a lexicon bundle")
+        checksum, payload = data[len(BUNDLE_MAGIC):len(BUNDLE_MAGIC) + 32], data[len(BUNDLE_MAGIC) + 32:]
+        if hashlib.sha256(payload).digest() != checksum:
+            raise LexiconError("Lexicon bundle checksum mismatch")
+        content = json.loads(zlib.decompress(payload))
+        if content["format"] != BUNDLE_FORMAT:
+            raise LexiconError(f"Unsupported lexicon bundle format {content['format']}")
+        matchers = {name: KeywordMatcher.from_dict(data) for name, data in content["matchers"].items()}
+        return cls(content["tables"], content["version"], content["built_at"], matchers)
+
+    @classmethod
+    def load(cls, path: str) -> "LexiconBundle":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def to_bytes(self) -> bytes:
+        payload = zlib.compress(json.dumps({
+            "format": BUNDLE_FORMAT,
+            "version": self.version,
+            "built_at": self.built_at,
+            "tables": self.tables,
+            "matchers": {name: matcher.to_dict() for name, matcher in self.matchers.items()},
+        }, sort_keys=True).encode(), 9)
+        return BUNDLE_MAGIC + hashlib.sha256(payload).digest() + payload
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    def find_keywords(self, table: str, text_lower: str) -> Set[str]:
+        return self.matchers[table].find(text_lower)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "tables": {name: len(self.tables[name]) for name in SOURCE_TABLES if name != "sentiment_rules"},
+        }
+
+
+def _lowercase_table(table: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    return {key: [keyword.lower() for keyword in keywords] for key, keywords in table.items()}
+
+
+def _flatten(table: Dict[str, List[str]]) -> List[str]:
+    return [keyword for keywords in table.values() for keyword in keywords]
+
+
+def _tables_version(tables: Dict[str, Any]) -> str:
+    canonical = json.dumps(tables, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(canonical).hexdigest()[:12]
+
+
+def load_source_tables(source_dir: str = LEXICON_DIR) -> Dict[str, Any]:
+    """Read and validate the JSON rule tables"""
+    tables = {}
+    for name in SOURCE_TABLES:
+        path = os.path.join(source_dir, f"{name}.json")
+        if not os.path.exists(path):
+            raise LexiconError(f"Missing lexicon table {path}")
+        with open(path) as f:
+            tables[name] = json.load(f)
+    for name in ("medical_patterns", "medical_sentiments", "intent_patterns", "soap_sections"):
+        for key, values in tables[name].items():
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise LexiconError(f"{name}.{key} must be a list of strings")
+    if "rules" not in tables["sentiment_rules"] or "default" not in tables["sentiment_rules"]:
+        raise LexiconError("sentiment_rules needs 'rules' and 'default'")
+    return tables
+
+
+def build_bundle(source_dir: str = LEXICON_DIR, output_path: str = DEFAULT_BUNDLE_PATH) -> LexiconBundle:
+    """Validate the source tables (every pattern must compile) and write the bundle atomically"""
+    bundle = LexiconBundle.from_sources(source_dir)
+    bundle.save(output_path)
+    logger.info(f"Built lexicon bundle {bundle.version} at {output_path}")
+    return bundle
+
+
+class LexiconRegistry:
+    """Holds the live lexicon bundle and swaps in new versions without a restart.
+
+    Readers call current() once per request and keep that bundle for the
+    whole request. reload() builds the replacement completely before
+    publishing it with a single reference assignment, so readers never see a
+    half-loaded bundle and a failed reload leaves the old one in place.
+    """
+
+    def __init__(self, bundle_path: Optional[str] = None, source_dir: Optional[str] = None):
+        self.bundle_path = bundle_path or os.environ.get("MEDICAL_NLP_LEXICON_BUNDLE", DEFAULT_BUNDLE_PATH)
+        self.source_dir = source_dir or LEXICON_DIR
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+        self._loaded_mtime: Optional[float] = None
+        self._bundle = self._load()
+
+    def current(self) -> LexiconBundle:
+        return self._bundle
+
+    @property
+    def version(self) -> str:
+        return self._bundle.version
+
+    def reload(self) -> LexiconBundle:
+        """Load the bundle file (or the JSON sources if there is none) and publish it"""
+        with self._reload_lock:
+            bundle = self._load()
+            previous = self._bundle
+            self._bundle = bundle
+        if bundle.version != previous.version:
+            logger.info(f"Lexicon swapped from {previous.version} to {bundle.version}")
+        return bundle
+
+    def start_watching(self, interval: float = 5.0):
+        """Poll the bundle file and reload when it changes"""
+        if self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="lexicon-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        while not self._stop_watching.wait(interval):
+            try:
+                mtime = os.path.getmtime(self.bundle_path) if os.path.exists(self.bundle_path) else None
+                if mtime is not None and mtime != self._loaded_mtime:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Lexicon reload failed, keeping {self.version}: {str(e)}")
+
+    def _load(self) -> LexiconBundle:
+        if os.path.exists(self.bundle_path):
+            mtime = os.path.getmtime(self.bundle_path)
+            bundle = LexiconBundle.load(self.bundle_path)
+            self._loaded_mtime = mtime
+            return bundle
+        return LexiconBundle.from_sources(self.source_dir)
+
+
+_default_registry: Optional[LexiconRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry() -> LexiconRegistry:
+    """Process-wide registry shared by every pipeline component"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = LexiconRegistry()
+    return _default_registry
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Build and inspect lexicon bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Validate lexicons/*.json and package them into a bundle")
+    build.add_argument("--source", default=LEXICON_DIR)
+    build.add_argument("--output", default=DEFAULT_BUNDLE_PATH)
+
+    show = sub.add_parser("show", help="Print a bundle's version and table sizes")
+    show.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args()
+    try:
+        if args.command == "build":
+            bundle = build_bundle(args.source, args.output)
+        else:
+            bundle = LexiconBundle.load(args.bundle)
+    except (LexiconError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(json.dumps(bundle.summary(), indent=2))
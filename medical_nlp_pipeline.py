@@ -1,10 +1,13 @@
 
+import hashlib
 import json
 import re
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import logging
+import os
+import threading
 from datetime import datetime
 import spacy
 import torch
@@ -15,10 +18,47 @@ from transformers import ( AutoTokenizer,
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import pandas as pd
+from medical_nlp_backends import SentimentBackend, create_sentiment_backend
+from medical_nlp_lexicon import LexiconBundle, LexiconRegistry, default_registry
+from medical_nlp_scheduler import StageGraph, StageScheduler
+from medical_nlp_cache import UtteranceCache, create_utterance_cache, normalize_utterance, normalized_positions
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PIPELINE_STAGES = ["entities", "sentiment_analysis", "summary", "soap_note", "quality_metrics"]
+INCREMENTAL_STATE_VERSION = 1
+
+# Free-text captures are bounded windows that stop at sentence punctuation, so
+# every pattern does a constant amount of work per starting position and total
+# matching time stays linear in the transcript length (see benchmark_patterns.py).
+# The NER patterns in lexicons/medical_patterns.json follow the same rule.
+MAX_PHRASE_CHARS = 120
+_PHRASE = rf"([^.,!?\n]{{1,{MAX_PHRASE_CHARS}}}?)"
+
+DIAGNOSIS_PATTERNS = [
+    rf"diagnosed with {_PHRASE}(?:\.|,|and)",
+    rf"it was a {_PHRASE}(?:\.|,|and)",
+    rf"said it was {_PHRASE}(?:\.|,|and)"
+]
+
+PROGNOSIS_PATTERNS = [
+    rf"expect(?:ed)? (?:to|you) {_PHRASE}(?:\.|,)",
+    rf"recovery {_PHRASE}(?:\.|,)",
+    rf"prognosis is {_PHRASE}(?:\.|,)"
+]
+
+PAIN_SCALE_PATTERN = r"(\d+)\s{0,3}(?:out of|/)?\s{0,3}10"
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+DATE_PATTERN = rf"(?:{'|'.join(MONTHS)})\s+\d{{1,2}}"
+PATIENT_NAME_PATTERN = r"(Mr\.|Ms\.|Mrs\.)\s+(\w+)"
+
+# Keywords whose presence drives the summary fields, matched as substrings of the lower-cased transcript
+SEVERITY_CUES = ["severe", "extreme", "mild", "slight", "surgery", "physiotherapy"]
+STATUS_CUES = ["occasional", "pain", "better", "improving", "no pain", "fully recovered"]
+
 @dataclass
 class MedicalEntity:
     text: str
@@ -62,44 +102,30 @@ class SOAPNote:
 class MedicalNERExtractor:
     """Advanced Named Entity Recognition for medical texts"""
     
-    def __init__(self):
+    def __init__(self, lexicon: Optional[LexiconRegistry] = None):
         self.nlp = spacy.load("en_core_web_sm")  
+        self.lexicon = lexicon or default_registry()
+        self.n_process = int(os.environ.get("MEDICAL_NLP_SPACY_PROCESSES", 1))
         
-        self.medical_patterns = {
-            "SYMPTOM": [
-                r"\b(pain|ache|discomfort|stiffness|tenderness)\b",
-                r"\b(swelling|inflammation|bruising)\b",
-                r"\b(difficulty|trouble|unable to)\b.*\b(sleep|move|walk)\b"
-            ],
-            "BODY_PART": [
-                r"\b(neck|back|spine|head|shoulder|knee|ankle)\b",
-                r"\b(cervical|lumbar|thoracic)\s+\b(spine|region)\b"
-            ],
-            "TREATMENT": [
-                r"\b(physiotherapy|physical therapy|PT)\b",
-                r"\b(medication|painkillers|analgesics)\b",
-                r"\b(surgery|operation|procedure)\b"
-            ],
-            "TEMPORAL": [
-                r"\b(\d+)\s+(weeks?|months?|days?|years?)\b",
-                r"\b(immediately|right away|gradually|slowly)\b"
-            ]
-        }
-        
-        self.abbreviations = {
-            "PT": "physiotherapy",
-            "ROM": "range of motion",
-            "A&E": "accident and emergency",
-            "MVA": "motor vehicle accident"
-        }
-        
-    def extract_entities(self, text: str) -> List[MedicalEntity]:
+    def extract_entities(self, text: str, lexicon: Optional[LexiconBundle] = None) -> List[MedicalEntity]:
         """Extract medical entities using hybrid approach"""
+        return self.extract_entities_batch([text], lexicon)[0]
+    
+    def extract_entities_batch(self, texts: List[str], lexicon: Optional[LexiconBundle] = None,
+                               batch_size: int = 64) -> List[List[MedicalEntity]]:
+        """Entities of each text, with one nlp.pipe pass over all of them"""
+        lexicon = lexicon or self.lexicon.current()
+        return [
+            self._doc_entities(text, doc, lexicon)
+            for text, doc in zip(texts, self.nlp.pipe(texts, batch_size=batch_size, n_process=self.n_process))
+        ]
+    
+    def _doc_entities(self, text: str, doc, lexicon: LexiconBundle) -> List[MedicalEntity]:
         entities = []
         
-        for entity_type, patterns in self.medical_patterns.items():
+        for entity_type, patterns in lexicon.medical_patterns.items():
             for pattern in patterns:
-                for match in re.finditer(pattern, text, re.IGNORECASE):
+                for match in pattern.finditer(text):
                     entities.append(MedicalEntity(
                         text=match.group(),
                         label=entity_type,
@@ -108,7 +134,6 @@ class MedicalNERExtractor:
                         confidence=0.9  
                     ))
         
-        doc = self.nlp(text)
         for ent in doc.ents:
             if ent.label_ in ["PERSON", "DATE", "TIME", "ORG"]:
                 entities.append(MedicalEntity(
@@ -119,16 +144,17 @@ class MedicalNERExtractor:
                     confidence=0.8
                 ))
         
-        entities = self._normalize_entities(entities)
+        entities = self._normalize_entities(entities, lexicon)
         entities = self._resolve_overlaps(entities)
         
         return entities
     
-    def _normalize_entities(self, entities: List[MedicalEntity]) -> List[MedicalEntity]:
+    def _normalize_entities(self, entities: List[MedicalEntity],
+                            lexicon: LexiconBundle) -> List[MedicalEntity]:
         """Normalize medical terms and add UMLS codes"""
         for entity in entities:
-            if entity.text.upper() in self.abbreviations:
-                entity.normalized_form = self.abbreviations[entity.text.upper()]
+            if entity.text.upper() in lexicon.abbreviations:
+                entity.normalized_form = lexicon.abbreviations[entity.text.upper()]
             
             if entity.label == "SYMPTOM":
                 entity.umls_code = f"C{hash(entity.text) % 1000000:07d}"
@@ -156,280 +182,299 @@ class MedicalNERExtractor:
 class MedicalSentimentAnalyzer:
     """Advanced sentiment and intent analysis for medical conversations"""
     
-    def __init__(self):
-        self.tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased")
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            "distilbert-base-uncased", num_labels=5
-        )
-        
-        self.medical_sentiments = {
-            "anxious": ["worried", "concerned", "nervous", "afraid", "scared"],
-            "hopeful": ["better", "improving", "relief", "encouraging", "positive"],
-            "frustrated": ["difficult", "struggling", "hard", "trouble", "unable"],
-            "neutral": ["okay", "fine", "normal", "stable", "unchanged"]
-        }
-        
-        self.intent_patterns = {
-            "seeking_diagnosis": ["what is", "could it be", "do I have"],
-            "reporting_symptoms": ["I feel", "I have", "experiencing", "suffering from"],
-            "seeking_reassurance": ["will I", "am I going to", "should I worry"],
-            "expressing_concern": ["worried about", "concerned that", "afraid of"],
-            "requesting_treatment": ["can you prescribe", "what can I take", "treatment options"]
-        }
+    sentiment_labels = ["anxious", "neutral", "reassured", "concerned", "hopeful"]
+    
+    def __init__(self, backend: Optional[str] = None, use_model: Optional[bool] = None,
+                 lexicon: Optional[LexiconRegistry] = None):
+        self.backend_name = backend
+        self._backend: Optional[SentimentBackend] = None
+        self._backend_lock = threading.Lock()
+        if use_model is None:
+            use_model = os.environ.get("MEDICAL_NLP_SENTIMENT_USE_MODEL", "0") == "1"
+        self.use_model = use_model
+        self.lexicon = lexicon or default_registry()
     
-    def analyze(self, text: str, speaker: str = "patient") -> SentimentResult:
+    @property
+    def backend(self) -> SentimentBackend:
+        """The model backend, built on first use so rule-only analysis never loads a model"""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_sentiment_backend(
+                        self.backend_name, num_labels=len(self.sentiment_labels)
+                    )
+        return self._backend
+    
+    @property
+    def tokenizer(self):
+        return self.backend.tokenizer
+    
+    def analyze(self, text: str, speaker: str = "patient",
+                lexicon: Optional[LexiconBundle] = None) -> SentimentResult:
         """Analyze sentiment and intent of medical text"""
-        
-        emotional_indicators = self._extract_emotional_indicators(text)
-        
-        sentiment, confidence = self._predict_sentiment(text)
-        
-        intent, intent_conf = self._detect_intent(text)
-        
-        return SentimentResult(
-            sentiment=sentiment,
-            confidence=confidence,
-            intent=intent,
-            intent_confidence=intent_conf,
-            emotional_indicators=emotional_indicators
-        )
+        return self.analyze_batch([text], speaker, lexicon)[0]
     
-    def _extract_emotional_indicators(self, text: str) -> List[str]:
+    def analyze_batch(self, texts: List[str], speaker: str = "patient",
+                      lexicon: Optional[LexiconBundle] = None) -> List[SentimentResult]:
+        """Analyze several texts, with a single model forward pass when the model is used"""
+        lexicon = lexicon or self.lexicon.current()
+        predictions = self.backend.predict(texts) if self.use_model else [None] * len(texts)
+        results = []
+        
+        for text, prediction in zip(texts, predictions):
+            text_lower = text.lower()
+            
+            emotional_indicators = self._extract_emotional_indicators(text_lower, lexicon)
+            
+            sentiment, confidence = self._predict_sentiment(text_lower, lexicon, prediction)
+            
+            intent, intent_conf = self._detect_intent(text_lower, lexicon)
+            
+            results.append(SentimentResult(
+                sentiment=sentiment,
+                confidence=confidence,
+                intent=intent,
+                intent_confidence=intent_conf,
+                emotional_indicators=emotional_indicators
+            ))
+        return results
+    
+    def _extract_emotional_indicators(self, text_lower: str, lexicon: LexiconBundle) -> List[str]:
         """Extract emotional indicator words"""
-        indicators = []
-        text_lower = text.lower()
-        
-        for category, words in self.medical_sentiments.items():
-            for word in words:
-                if word in text_lower:
-                    indicators.append(f"{category}:{word}")
-        
-        return indicators
+        found = lexicon.find_keywords("medical_sentiments", text_lower)
+        if not found:
+            return []
+        
+        return [
+            f"{category}:{word}"
+            for category, words in lexicon.medical_sentiments.items()
+            for word in words if word in found
+        ]
     
-    def _predict_sentiment(self, text: str) -> Tuple[str, float]:
-        """Predict sentiment using transformer model"""
-        sentiments = ["anxious", "neutral", "reassured", "concerned", "hopeful"]
-        
-        if any(word in text.lower() for word in ["worried", "concerned", "afraid"]):
-            return "anxious", 0.85
-        elif any(word in text.lower() for word in ["better", "relief", "good"]):
-            return "reassured", 0.80
-        else:
-            return "neutral", 0.75
+    def _predict_sentiment(self, text_lower: str, lexicon: LexiconBundle,
+                           prediction: Optional[Tuple[int, float]] = None) -> Tuple[str, float]:
+        """Sentiment from the transformer model's prediction, or from the lexicon rules without one"""
+        if prediction is not None:
+            label, confidence = prediction
+            return self.sentiment_labels[label], confidence
+        
+        found = lexicon.find_keywords("sentiment_rules", text_lower)
+        for rule in lexicon.sentiment_rules:
+            if any(keyword in found for keyword in rule["keywords"]):
+                return rule["sentiment"], rule["confidence"]
+        return lexicon.default_sentiment["sentiment"], lexicon.default_sentiment["confidence"]
     
-    def _detect_intent(self, text: str) -> Tuple[str, float]:
+    def _detect_intent(self, text_lower: str, lexicon: LexiconBundle) -> Tuple[str, float]:
         """Detect speaker intent"""
-        text_lower = text.lower()
+        found = lexicon.find_keywords("intent_patterns", text_lower)
         
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if pattern in text_lower:
-                    return intent, 0.85
+        for intent, patterns in lexicon.intent_patterns.items():
+            if any(pattern in found for pattern in patterns):
+                return intent, 0.85
         
         return "reporting_symptoms", 0.70
 
 
-class MedicalSummarizer:
-    """Generate structured medical summaries from conversations"""
+@dataclass
+class SummaryFeatures:
+    """Every summarizer signal of one transcript; summary fields are computed from this alone"""
+    cues: Set[str]
+    entity_groups: Dict[str, List[str]]
+    diagnoses: List[str]
+    prognosis: Optional[str]
+    timeline: Dict[str, str]
+    patient_name: str
+
+
+class SummaryFeatureExtractor:
+    """Collects every summarizer signal of a transcript into a SummaryFeatures record.
+
+    The transcript is lower-cased once. Cue words are substring checks on
+    that copy, and each diagnosis and prognosis pattern is one scan of it,
+    compiled without IGNORECASE so its literal prefix lets the regex engine
+    skip straight to candidate positions; captures are sliced from the
+    original text. Offsets only line up when lower-casing keeps every
+    character in place, which holds for ASCII transcripts; others are
+    matched case-insensitively on the original. Dates and titles are
+    case-sensitive searches of the original. A single combined alternation
+    walked once measures several times slower (`python benchmark_patterns.py
+    summary-scan`).
+    """
     
     def __init__(self):
-        self.ner_extractor = MedicalNERExtractor()
-        self.key_sections = ["symptoms", "diagnosis", "treatment", "prognosis"]
-        
-    def summarize(self, conversation: str) -> MedicalSummary:
-        """Generate comprehensive medical summary"""
-        
-        entities = self.ner_extractor.extract_entities(conversation)
-        
-        entity_groups = self._group_entities(entities)
-        
-        timeline = self._extract_timeline(conversation, entities)
-        
-        severity = self._calculate_severity(conversation, entity_groups)
-        
-        summary = MedicalSummary(
-            patient_name=self._extract_patient_name(conversation, entities),
-            symptoms=entity_groups.get("SYMPTOM", []),
-            diagnosis=self._extract_diagnosis(conversation),
-            treatment=entity_groups.get("TREATMENT", []),
-            current_status=self._extract_current_status(conversation),
-            prognosis=self._extract_prognosis(conversation),
-            timeline=timeline,
-            severity_score=severity
-        )
-        
-        return summary
+        self.diagnosis_patterns = [re.compile(pattern) for pattern in DIAGNOSIS_PATTERNS]
+        self.prognosis_patterns = [re.compile(pattern) for pattern in PROGNOSIS_PATTERNS]
+        self.diagnosis_patterns_ci = [re.compile(pattern, re.IGNORECASE) for pattern in DIAGNOSIS_PATTERNS]
+        self.prognosis_patterns_ci = [re.compile(pattern, re.IGNORECASE) for pattern in PROGNOSIS_PATTERNS]
+        self.date_pattern = re.compile(DATE_PATTERN)
+        self.name_pattern = re.compile(PATIENT_NAME_PATTERN)
+        self.cue_words = SEVERITY_CUES + STATUS_CUES
     
-    def _group_entities(self, entities: List[MedicalEntity]) -> Dict[str, List[str]]:
-        """Group entities by type"""
-        groups = {}
-        for entity in entities:
-            if entity.label not in groups:
-                groups[entity.label] = []
-            
-            text = entity.normalized_form or entity.text
-            if text not in groups[entity.label]:
-                groups[entity.label].append(text)
+    def extract(self, text: str, entities: List[MedicalEntity]) -> SummaryFeatures:
+        text_lower = text.lower()
+        if text.isascii():
+            scanned, diagnosis_patterns, prognosis_patterns = text_lower, self.diagnosis_patterns, self.prognosis_patterns
+        else:
+            scanned, diagnosis_patterns, prognosis_patterns = text, self.diagnosis_patterns_ci, self.prognosis_patterns_ci
         
-        return groups
-    
-    def _extract_timeline(self, text: str, entities: List[MedicalEntity]) -> Dict[str, str]:
-        """Extract temporal information"""
-        timeline = {}
+        diagnoses = [
+            text[match.start(1):match.end(1)].strip()
+            for pattern in diagnosis_patterns for match in pattern.finditer(scanned)
+        ]
+        prognosis = None
+        for pattern in prognosis_patterns:
+            match = pattern.search(scanned)
+            if match:
+                prognosis = text[match.start(1):match.end(1)].strip()
+                break
         
-        date_match = re.search(r"(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}", text)
+        groups: Dict[str, Dict[str, None]] = {}
+        timeline = {}
+        date_match = self.date_pattern.search(text)
         if date_match:
             timeline["accident_date"] = date_match.group()
-        
-        temporal_entities = [e for e in entities if e.label == "TEMPORAL"]
-        for entity in temporal_entities:
-            if "week" in entity.text:
-                timeline["recovery_duration"] = entity.text
-            elif "session" in entity.text:
-                timeline["treatment_duration"] = entity.text
-        
-        return timeline
+        person_name = None
+        for entity in entities:
+            groups.setdefault(entity.label, {})[entity.normalized_form or entity.text] = None
+            if entity.label == "TEMPORAL":
+                if "week" in entity.text:
+                    timeline["recovery_duration"] = entity.text
+                elif "session" in entity.text:
+                    timeline["treatment_duration"] = entity.text
+            elif entity.label == "PERSON" and person_name is None:
+                person_name = entity.text
+        
+        name_match = self.name_pattern.search(text)
+        return SummaryFeatures(
+            cues={word for word in self.cue_words if word in text_lower},
+            entity_groups={label: list(texts) for label, texts in groups.items()},
+            diagnoses=list(dict.fromkeys(diagnoses)),
+            prognosis=prognosis,
+            timeline=timeline,
+            patient_name=name_match.group(2) if name_match else person_name or "Unknown"
+        )
+
+
+def severity_scores(features: List[SummaryFeatures]) -> np.ndarray:
+    """Severity of each transcript from its symptom count and cue words, computed across the batch at once"""
+    def cue(word: str) -> np.ndarray:
+        return np.array([word in f.cues for f in features], dtype=bool)
     
-    def _calculate_severity(self, text: str, entity_groups: Dict[str, List[str]]) -> float:
-        """Calculate severity score based on symptoms and treatment"""
-        score = 0.3 
-        
-        symptom_count = len(entity_groups.get("SYMPTOM", []))
-        score += min(symptom_count * 0.1, 0.3)
-        
-        if "severe" in text.lower() or "extreme" in text.lower():
-            score += 0.2
-        elif "mild" in text.lower() or "slight" in text.lower():
-            score -= 0.1
-        
-        if "surgery" in text.lower():
-            score += 0.3
-        elif "physiotherapy" in text.lower():
-            score += 0.1
-        
-        return max(0.0, min(1.0, score))
+    symptom_counts = np.array([len(f.entity_groups.get("SYMPTOM", [])) for f in features], dtype=np.float64)
+    scores = 0.3 + np.minimum(symptom_counts * 0.1, 0.3)
+    scores = scores + np.where(cue("severe") | cue("extreme"), 0.2,
+                               np.where(cue("mild") | cue("slight"), -0.1, 0.0))
+    scores = scores + np.where(cue("surgery"), 0.3, np.where(cue("physiotherapy"), 0.1, 0.0))
+    return np.clip(scores, 0.0, 1.0)
+
+
+class MedicalSummarizer:
+    """Generate structured medical summaries from conversations"""
     
-    def _extract_patient_name(self, text: str, entities: List[MedicalEntity]) -> str:
-        """Extract patient name from conversation"""
-        person_pattern = r"(Mr\.|Ms\.|Mrs\.)\s+(\w+)"
-        match = re.search(person_pattern, text)
-        if match:
-            return match.group(2)
-        
-        person_entities = [e for e in entities if e.label == "PERSON"]
-        if person_entities:
-            return person_entities[0].text
+    def __init__(self, lexicon: Optional[LexiconRegistry] = None):
+        self.ner_extractor = MedicalNERExtractor(lexicon)
+        self.feature_extractor = SummaryFeatureExtractor()
+        self.key_sections = ["symptoms", "diagnosis", "treatment", "prognosis"]
         
-        return "Unknown"
+    def summarize(self, conversation: str, entities: Optional[List[MedicalEntity]] = None,
+                  lexicon: Optional[LexiconBundle] = None) -> MedicalSummary:
+        """Generate comprehensive medical summary, reusing already extracted entities if given"""
+        return self.summarize_batch([conversation], None if entities is None else [entities], lexicon)[0]
     
-    def _extract_diagnosis(self, text: str) -> List[str]:
-        """Extract diagnosis information"""
-        diagnoses = []
-        
-        diagnosis_patterns = [
-            r"diagnosed with (.+?)(?:\.|,|and)",
-            r"it was a (.+?)(?:\.|,|and)",
-            r"said it was (.+?)(?:\.|,|and)"
-        ]
-        
-        for pattern in diagnosis_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            diagnoses.extend(matches)
-        
-        diagnoses = [d.strip() for d in diagnoses]
-        return list(set(diagnoses))
+    def summarize_batch(self, conversations: List[str], entities: Optional[List[List[MedicalEntity]]] = None,
+                        lexicon: Optional[LexiconBundle] = None) -> List[MedicalSummary]:
+        """Summaries of several conversations, extracting missing entities with one nlp.pipe pass"""
+        if entities is None:
+            entities = self.ner_extractor.extract_entities_batch(conversations, lexicon)
+        
+        features = [self.feature_extractor.extract(conversation, conversation_entities)
+                    for conversation, conversation_entities in zip(conversations, entities)]
+        severities = severity_scores(features)
+        return [self._summary_from_features(f, float(severity)) for f, severity in zip(features, severities)]
+    
+    def _summary_from_features(self, features: SummaryFeatures, severity: float) -> MedicalSummary:
+        return MedicalSummary(
+            patient_name=features.patient_name,
+            symptoms=features.entity_groups.get("SYMPTOM", []),
+            diagnosis=features.diagnoses,
+            treatment=features.entity_groups.get("TREATMENT", []),
+            current_status=self._current_status(features.cues),
+            prognosis=features.prognosis or "Good recovery expected",
+            timeline=features.timeline,
+            severity_score=severity
+        )
     
-    def _extract_current_status(self, text: str) -> str:
-        """Extract current patient status"""
-        if "occasional" in text.lower() and "pain" in text.lower():
+    def _current_status(self, cues: Set[str]) -> str:
+        """Current patient status"""
+        if "occasional" in cues and "pain" in cues:
             return "Occasional discomfort"
-        elif "better" in text.lower() or "improving" in text.lower():
+        elif "better" in cues or "improving" in cues:
             return "Improving"
-        elif "no pain" in text.lower() or "fully recovered" in text.lower():
+        elif "no pain" in cues or "fully recovered" in cues:
             return "Fully recovered"
         else:
             return "Stable"
-    
-    def _extract_prognosis(self, text: str) -> str:
-        """Extract prognosis information"""
-        prognosis_patterns = [
-            r"expect(?:ed)? (?:to|you) (.+?)(?:\.|,)",
-            r"recovery (.+?)(?:\.|,)",
-            r"prognosis is (.+?)(?:\.|,)"
-        ]
-        
-        for pattern in prognosis_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        return "Good recovery expected"
 
 
 class SOAPNoteGenerator:
     """Generate structured SOAP notes from medical conversations"""
     
-    def __init__(self):
-        self.summarizer = MedicalSummarizer()
-        self.section_classifier = self._build_section_classifier()
+    def __init__(self, lexicon: Optional[LexiconRegistry] = None):
+        self.summarizer = MedicalSummarizer(lexicon)
+        self.lexicon = lexicon or default_registry()
         
-    def generate_soap_note(self, conversation: str) -> SOAPNote:
-        """Generate complete SOAP note from conversation"""
+    def generate_soap_note(self, conversation: str, summary: Optional[MedicalSummary] = None,
+                           utterances: Optional[List[Dict[str, Any]]] = None,
+                           sections: Optional[List[str]] = None,
+                           lexicon: Optional[LexiconBundle] = None) -> SOAPNote:
+        """Generate complete SOAP note from conversation
         
-        summary = self.summarizer.summarize(conversation)
+        A precomputed summary, split utterances and per-utterance sections
+        are reused instead of being derived again.
+        """
         
-        utterances = self._split_conversation(conversation)
+        lexicon = lexicon or self.lexicon.current()
         
-        classified_utterances = self._classify_utterances(utterances)
+        if summary is None:
+            summary = self.summarizer.summarize(conversation, lexicon=lexicon)
+        
+        if utterances is None:
+            utterances = self._split_conversation(conversation)
+        
+        classified_utterances = self._classify_utterances(utterances, sections, lexicon)
         
         soap_note = SOAPNote(
             subjective=self._build_subjective(classified_utterances, summary),
             objective=self._build_objective(classified_utterances, summary),
             assessment=self._build_assessment(classified_utterances, summary),
             plan=self._build_plan(classified_utterances, summary),
-            metadata=self._build_metadata(conversation)
+            metadata=self._build_metadata(conversation, lexicon)
         )
         
         return soap_note
     
-    def _build_section_classifier(self) -> Dict[str, List[str]]:
-        """Build rules for classifying utterances into SOAP sections"""
-        return {
-            "subjective": [
-                "I feel", "I have", "pain", "discomfort", "started", 
-                "experiencing", "symptoms", "bothers me"
-            ],
-            "objective": [
-                "examination", "test", "range of motion", "tenderness",
-                "observe", "measure", "vital signs", "physical"
-            ],
-            "assessment": [
-                "diagnosis", "appears to be", "consistent with", 
-                "indicates", "suggests", "conclusion"
-            ],
-            "plan": [
-                "recommend", "prescribe", "follow-up", "treatment",
-                "continue", "avoid", "return if", "therapy"
-            ]
-        }
-    
-    def _split_conversation(self, conversation: str) -> List[Dict[str, str]]:
-        """Split conversation into speaker-tagged utterances"""
+    def _split_conversation(self, conversation: str) -> List[Dict[str, Any]]:
+        """Split conversation into speaker-tagged utterances with their character spans"""
         utterances = []
         
         speaker_pattern = r"(Physician|Doctor|Patient):\s*(.+?)(?=(?:Physician|Doctor|Patient):|$)"
-        matches = re.findall(speaker_pattern, conversation, re.DOTALL)
-        
-        for speaker, text in matches:
+        for match in re.finditer(speaker_pattern, conversation, re.DOTALL):
+            raw_text = match.group(2)
+            text = raw_text.strip()
+            start = match.start(2) + len(raw_text) - len(raw_text.lstrip())
             utterances.append({
-                "speaker": speaker,
-                "text": text.strip()
+                "speaker": match.group(1),
+                "text": text,
+                "start": start,
+                "end": start + len(text)
             })
         
         return utterances
     
-    def _classify_utterances(self, utterances: List[Dict[str, str]]) -> Dict[str, List[Dict[str, str]]]:
-        """Classify utterances into SOAP sections"""
+    def _classify_utterances(self, utterances: List[Dict[str, Any]],
+                             sections: Optional[List[str]] = None,
+                             lexicon: Optional[LexiconBundle] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Classify utterances into SOAP sections, or group them by precomputed sections"""
         classified = {
             "subjective": [],
             "objective": [],
@@ -437,25 +482,30 @@ class SOAPNoteGenerator:
             "plan": []
         }
         
-        for utterance in utterances:
-            text_lower = utterance["text"].lower()
-            
-            section_scores = {}
-            for section, keywords in self.section_classifier.items():
-                score = sum(1 for keyword in keywords if keyword in text_lower)
-                section_scores[section] = score
-            
-            if max(section_scores.values()) > 0:
-                best_section = max(section_scores, key=section_scores.get)
-                classified[best_section].append(utterance)
-            else:
-                if utterance["speaker"] == "Patient":
-                    classified["subjective"].append(utterance)
-                else:
-                    classified["objective"].append(utterance)
+        if sections is None:
+            lexicon = lexicon or self.lexicon.current()
+            sections = [self._classify_utterance(utterance, lexicon) for utterance in utterances]
+        for utterance, section in zip(utterances, sections):
+            classified[section].append(utterance)
         
         return classified
     
+    def _classify_utterance(self, utterance: Dict[str, Any],
+                            lexicon: Optional[LexiconBundle] = None) -> str:
+        """SOAP section for a single utterance"""
+        lexicon = lexicon or self.lexicon.current()
+        found = lexicon.find_keywords("soap_sections", utterance["text"].lower())
+        
+        section_scores = {}
+        for section, keywords in lexicon.section_keywords.items():
+            section_scores[section] = sum(1 for keyword in keywords if keyword in found)
+        
+        if max(section_scores.values()) > 0:
+            return max(section_scores, key=section_scores.get)
+        if utterance["speaker"] == "Patient":
+            return "subjective"
+        return "objective"
+    
     def _build_subjective(self, classified: Dict, summary: MedicalSummary) -> Dict[str, Any]:
         """Build subjective section of SOAP note"""
         subjective_data = classified.get("subjective", [])
@@ -533,11 +583,12 @@ class SOAPNoteGenerator:
             "precautions": ["Return if symptoms worsen", "Avoid heavy lifting for 2 weeks"]
         }
     
-    def _build_metadata(self, conversation: str) -> Dict[str, Any]:
+    def _build_metadata(self, conversation: str, lexicon: LexiconBundle) -> Dict[str, Any]:
         """Build metadata for SOAP note"""
         return {
             "generated_at": datetime.now().isoformat(),
             "conversation_length": len(conversation),
+            "lexicon_version": lexicon.version,
             "confidence_score": 0.85,
             "requires_review": False,
             "icd10_codes": ["S13.4", "M54.2"], 
@@ -554,7 +605,7 @@ class SOAPNoteGenerator:
     def _extract_pain_scale(self, utterances: List[Dict]) -> Optional[int]:
         """Extract pain scale if mentioned"""
         for utterance in utterances:
-            match = re.search(r"(\d+)\s*(?:out of|/)?\s*10", utterance["text"])
+            match = re.search(PAIN_SCALE_PATTERN, utterance["text"])
             if match:
                 return int(match.group(1))
         return None
@@ -602,11 +653,15 @@ class SOAPNoteGenerator:
 class MedicalTranscriptionPipeline:
     """Main pipeline orchestrating all components"""
     
-    def __init__(self):
-        self.ner_extractor = MedicalNERExtractor()
-        self.sentiment_analyzer = MedicalSentimentAnalyzer()
-        self.summarizer = MedicalSummarizer()
-        self.soap_generator = SOAPNoteGenerator()
+    def __init__(self, lexicon: Optional[LexiconRegistry] = None, stage_workers: Optional[int] = None,
+                 utterance_cache: Optional[UtteranceCache] = None):
+        self.lexicon = lexicon or default_registry()
+        self.ner_extractor = MedicalNERExtractor(self.lexicon)
+        self.sentiment_analyzer = MedicalSentimentAnalyzer(lexicon=self.lexicon)
+        self.summarizer = MedicalSummarizer(self.lexicon)
+        self.soap_generator = SOAPNoteGenerator(self.lexicon)
+        self.scheduler = StageScheduler(stage_workers)
+        self.utterance_cache = utterance_cache if utterance_cache is not None else create_utterance_cache()
         
         logger.info("Medical Transcription Pipeline initialized")
     
@@ -615,42 +670,240 @@ class MedicalTranscriptionPipeline:
         
         logger.info("Processing medical conversation...")
         
-        entities = self.ner_extractor.extract_entities(conversation)
-        logger.info(f"Extracted {len(entities)} medical entities")
-        
-        patient_sentiments = self._analyze_patient_sentiment(conversation)
+        results = dict(self.iter_stages(conversation))
+        return {stage: results[stage] for stage in PIPELINE_STAGES}
+    
+    def process_batch(self, conversations: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Lazily process conversations one at a time, yielding results in input order"""
+        for conversation in conversations:
+            yield self.process_conversation(conversation)
+    
+    def iter_stages(self, conversation: str,
+                    report: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Any]]:
+        """Yield (stage, result) pairs as soon as each pipeline stage finishes
+        
+        Stages that do not depend on each other run concurrently, so results
+        arrive in completion order. Pass a dict as `report` to receive the
+        stage timings and critical path.
+        """
+        # Every stage uses the same lexicon even if a reload lands mid-conversation
+        lexicon = self.lexicon.current()
+        
+        for stage, result in self.scheduler.run(self._stage_graph(conversation, lexicon), report):
+            if stage == "entities":
+                logger.info(f"Extracted {len(result)} medical entities")
+                yield stage, [asdict(e) for e in result]
+            elif stage in ("summary", "soap_note"):
+                logger.info(f"Generated {stage.replace('_', ' ')}")
+                yield stage, asdict(result)
+            else:
+                yield stage, result
+    
+    def _stage_graph(self, conversation: str, lexicon: LexiconBundle) -> StageGraph:
+        """Pipeline stages and their data dependencies for one conversation
+        
+        Sentiment and SOAP section classification only need the split
+        utterances, so they run alongside NER and summarization.
+        """
+        graph = StageGraph()
+        graph.add("utterances", lambda: self.soap_generator._split_conversation(conversation), emit=False)
+        graph.add(
+            "entities",
+            lambda utterances: self._conversation_entities(conversation, utterances, lexicon),
+            depends_on=["utterances"]
+        )
+        graph.add(
+            "sentiment_analysis",
+            lambda utterances: self._analyze_patient_sentiment(conversation, utterances, lexicon),
+            depends_on=["utterances"]
+        )
+        graph.add(
+            "sections",
+            lambda utterances: [self._utterance_section(u, lexicon) for u in utterances],
+            depends_on=["utterances"], emit=False
+        )
+        graph.add(
+            "summary",
+            lambda entities: self.summarizer.summarize(conversation, entities=entities, lexicon=lexicon),
+            depends_on=["entities"]
+        )
+        graph.add(
+            "soap_note",
+            lambda summary, utterances, sections: self.soap_generator.generate_soap_note(
+                conversation, summary=summary, utterances=utterances, sections=sections, lexicon=lexicon
+            ),
+            depends_on=["summary", "utterances", "sections"]
+        )
+        graph.add(
+            "quality_metrics",
+            lambda entities, summary, soap_note: self._calculate_quality_metrics(entities, summary, soap_note),
+            depends_on=["entities", "summary", "soap_note"]
+        )
+        return graph
+    
+    def analyze_incremental(self, conversation: str,
+                            previous_state: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Re-analyze a revised conversation, reusing per-utterance results from `previous_state`
+        
+        NER, sentiment and SOAP classification run only for utterances whose
+        speaker or text changed; the rest are reused with shifted offsets. The
+        summary and SOAP note are rebuilt from the merged per-utterance results.
+        Returns (results, state); pass the state back with the next revision.
+        Text outside speaker-tagged utterances is not analyzed in this mode,
+        and nothing is reused if the lexicon changed since `previous_state`.
+        """
+        lexicon = self.lexicon.current()
+        previous: Dict[str, List[Dict[str, Any]]] = {}
+        if (previous_state and previous_state.get("version") == INCREMENTAL_STATE_VERSION
+                and previous_state.get("lexicon_version") == lexicon.version):
+            for record in previous_state.get("utterances", []):
+                previous.setdefault(record["key"], []).append(record)
         
-        summary = self.summarizer.summarize(conversation)
-        logger.info("Generated medical summary")
+        utterances = self.soap_generator._split_conversation(conversation)
+        records = []
+        reused = 0
+        for utterance in utterances:
+            key = _utterance_key(utterance)
+            if previous.get(key):
+                records.append(previous[key].pop(0))
+                reused += 1
+            else:
+                records.append(self._analyze_utterance(utterance, key, lexicon))
         
-        soap_note = self.soap_generator.generate_soap_note(conversation)
-        logger.info("Generated SOAP note")
+        entities = [
+            MedicalEntity(**{**entity, "start": entity["start"] + utterance["start"],
+                             "end": entity["end"] + utterance["start"]})
+            for utterance, record in zip(utterances, records)
+            for entity in record["entities"]
+        ]
+        sentiments = [
+            self._sentiment_entry(utterance["text"], record["sentiment"])
+            for utterance, record in zip(utterances, records)
+            if record["sentiment"] is not None
+        ]
+        summary = self.summarizer.summarize(conversation, entities=entities, lexicon=lexicon)
+        soap_note = self.soap_generator.generate_soap_note(
+            conversation, summary=summary, utterances=utterances,
+            sections=[record["section"] for record in records], lexicon=lexicon
+        )
+        logger.info(f"Incremental analysis reused {reused} of {len(records)} utterances")
         
         results = {
             "entities": [asdict(e) for e in entities],
+            "sentiment_analysis": sentiments,
             "summary": asdict(summary),
-            "sentiment_analysis": patient_sentiments,
             "soap_note": asdict(soap_note),
             "quality_metrics": self._calculate_quality_metrics(entities, summary, soap_note)
         }
+        state = {
+            "version": INCREMENTAL_STATE_VERSION,
+            "lexicon_version": lexicon.version,
+            "text": conversation,
+            "utterances": records,
+            "reused": reused,
+            "reanalyzed": len(records) - reused
+        }
+        return results, state
+    
+    def _analyze_utterance(self, utterance: Dict[str, Any], key: str,
+                           lexicon: LexiconBundle) -> Dict[str, Any]:
+        """Per-utterance NER, sentiment and SOAP section, offsets relative to the utterance"""
+        sentiment = None
+        if utterance["speaker"] == "Patient":
+            sentiment = self._utterance_sentiment(utterance, lexicon)
+        return {
+            "key": key,
+            "entities": [asdict(e) for e in self._utterance_entities(utterance, lexicon)],
+            "sentiment": sentiment,
+            "section": self._utterance_section(utterance, lexicon)
+        }
+    
+    def _conversation_entities(self, conversation: str, utterances: List[Dict[str, Any]],
+                               lexicon: LexiconBundle) -> List[MedicalEntity]:
+        """Per-utterance NER merged back into conversation offsets
+
+        NER always runs per utterance, with or without the utterance cache, so
+        enabling the cache never changes the entities: spaCy sees the same
+        text either way.
+        """
+        preamble = conversation[:utterances[0]["start"]] if utterances else conversation
+        preamble = re.sub(r"(?:Physician|Doctor|Patient):\s*$", "", preamble)
+        entities = self.ner_extractor.extract_entities(preamble, lexicon) if preamble.strip() else []
+        for utterance in utterances:
+            for entity in self._utterance_entities(utterance, lexicon):
+                entity.start += utterance["start"]
+                entity.end += utterance["start"]
+                entities.append(entity)
+        return entities
+    
+    def _utterance_entities(self, utterance: Dict[str, Any], lexicon: LexiconBundle) -> List[MedicalEntity]:
+        """Entities of one utterance with offsets relative to its text
+        
+        NER runs on the whitespace-normalized text whether or not it is
+        cached, so cache hits and misses give identical results.
+        """
+        text = utterance["text"]
+        normalized = normalize_utterance(text)
+        cached = self._memoized(
+            "entities", lexicon, normalized,
+            lambda: [asdict(e) for e in self.ner_extractor.extract_entities(normalized, lexicon)]
+        )
+        if normalized == text:
+            return [MedicalEntity(**entity) for entity in cached]
         
-        return results
+        # Cached offsets index the normalized text; map them back onto this utterance's spacing
+        positions = normalized_positions(text)
+        entities = []
+        for entity in cached:
+            start, end = positions[entity["start"]], positions[entity["end"] - 1] + 1
+            entities.append(MedicalEntity(**{**entity, "text": text[start:end], "start": start, "end": end}))
+        return entities
+    
+    def _utterance_sentiment(self, utterance: Dict[str, Any], lexicon: LexiconBundle) -> Dict[str, Any]:
+        normalized = normalize_utterance(utterance["text"])
+        cached = self._memoized(
+            "sentiment", lexicon, normalized,
+            lambda: asdict(self.sentiment_analyzer.analyze(normalized, lexicon=lexicon))
+        )
+        return {**cached, "emotional_indicators": list(cached["emotional_indicators"])}
+    
+    def _utterance_section(self, utterance: Dict[str, Any], lexicon: LexiconBundle) -> str:
+        normalized = normalize_utterance(utterance["text"])
+        return self._memoized(
+            "section", lexicon, normalized,
+            lambda: self.soap_generator._classify_utterance({**utterance, "text": normalized}, lexicon),
+            variant=utterance["speaker"]
+        )
     
-    def _analyze_patient_sentiment(self, conversation: str) -> List[Dict[str, Any]]:
+    def _memoized(self, stage: str, lexicon: LexiconBundle, normalized: str,
+                  compute: Callable[[], Any], variant: str = "") -> Any:
+        """compute() through the utterance cache, or directly when caching is disabled"""
+        if self.utterance_cache is None:
+            return compute()
+        return self.utterance_cache.get_or_compute(stage, lexicon.version, normalized, compute, variant=variant)
+    
+    def _analyze_patient_sentiment(self, conversation: str,
+                                   utterances: Optional[List[Dict[str, Any]]] = None,
+                                   lexicon: Optional[LexiconBundle] = None) -> List[Dict[str, Any]]:
         """Analyze sentiment for each patient utterance"""
-        utterances = self.soap_generator._split_conversation(conversation)
+        if utterances is None:
+            utterances = self.soap_generator._split_conversation(conversation)
         patient_utterances = [u for u in utterances if u["speaker"] == "Patient"]
         
+        lexicon = lexicon or self.lexicon.current()
         sentiments = []
         for utterance in patient_utterances:
-            sentiment_result = self.sentiment_analyzer.analyze(utterance["text"])
-            sentiments.append({
-                "text": utterance["text"][:100] + "..." if len(utterance["text"]) > 100 else utterance["text"],
-                "sentiment": asdict(sentiment_result)
-            })
+            sentiment_result = self._utterance_sentiment(utterance, lexicon)
+            sentiments.append(self._sentiment_entry(utterance["text"], sentiment_result))
         
         return sentiments
     
+    def _sentiment_entry(self, text: str, sentiment: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "text": text[:100] + "..." if len(text) > 100 else text,
+            "sentiment": sentiment
+        }
+    
     def _calculate_quality_metrics(self, entities: List, summary: MedicalSummary, soap_note: SOAPNote) -> Dict[str, float]:
         """Calculate quality metrics for the extraction"""
         metrics = {
@@ -707,6 +960,22 @@ class MedicalTranscriptionPipeline:
         return score
 
 
+def _utterance_key(utterance: Dict[str, Any]) -> str:
+    return hashlib.sha1(f"{utterance['speaker']}\x00{utterance['text']}".encode()).hexdigest()
+
+
+def apply_text_edits(text: str, edits: List[Dict[str, Any]]) -> str:
+    """Apply non-overlapping {start, end, text} replacements given against the original text"""
+    ordered = sorted(edits, key=lambda edit: edit["start"], reverse=True)
+    limit = len(text)
+    for edit in ordered:
+        if not 0 <= edit["start"] <= edit["end"] <= limit:
+            raise ValueError(f"Edit {edit['start']}-{edit['end']} is out of range or overlaps another edit")
+        text = text[:edit["start"]] + edit.get("text", "") + text[edit["end"]:]
+        limit = edit["start"]
+    return text
+
+
 def demonstrate_pipeline():
     """Demonstrate the medical NLP pipeline with the provided conversation"""
     
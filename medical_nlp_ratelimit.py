@@ -0,0 +1,354 @@
+"""
+Per-client rate limiting for the API.
+
+Clients are identified by a hash of their X-API-Key header when the key is
+one of MEDICAL_NLP_API_KEYS (comma-separated), and by their address
+otherwise, so made-up keys cannot be used to dodge the limits. Each gets a token bucket refilled at MEDICAL_NLP_RATE_LIMIT_PER_MINUTE
+with MEDICAL_NLP_RATE_LIMIT_BURST capacity, plus caps on concurrent requests
+(MEDICAL_NLP_MAX_CONCURRENT_REQUESTS) and WebSocket connections
+(MEDICAL_NLP_MAX_WEBSOCKETS). State is kept in process memory, or in the
+SQLite file named by MEDICAL_NLP_RATE_LIMIT_STORE so several uvicorn workers
+on one host share the same limits; its blocking calls run on a dedicated
+thread, off the event loop. Buckets that have refilled to capacity are
+evicted, since a missing bucket starts full anyway.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+EXEMPT_PATHS = {"/", "/ready", "/docs", "/redoc", "/openapi.json", "/api/v1/metrics"}
+BUCKET_SWEEP_SECONDS = 60.0
+MAX_TRACKED_CLIENTS = 1000
+
+
+@dataclass
+class RateLimitConfig:
+    requests_per_minute: float = 100
+    burst: int = 100
+    max_concurrent_requests: int = 10
+    max_websockets: int = 10
+    # sha256 hex digests of the API keys that identify a client
+    api_key_hashes: FrozenSet[str] = field(default_factory=frozenset)
+
+    def __post_init__(self):
+        # Retry-After divides by the refill rate, and a bucket smaller than one token never admits anything
+        if self.requests_per_minute <= 0:
+            raise ValueError(f"MEDICAL_NLP_RATE_LIMIT_PER_MINUTE must be positive, got {self.requests_per_minute}")
+        if self.burst < 1:
+            raise ValueError(f"MEDICAL_NLP_RATE_LIMIT_BURST must be at least 1, got {self.burst}")
+
+    @classmethod
+    def from_env(cls) -> "RateLimitConfig":
+        per_minute = float(os.environ.get("MEDICAL_NLP_RATE_LIMIT_PER_MINUTE", 100))
+        keys = [key.strip() for key in os.environ.get("MEDICAL_NLP_API_KEYS", "").split(",") if key.strip()]
+        return cls(
+            requests_per_minute=per_minute,
+            burst=int(os.environ.get("MEDICAL_NLP_RATE_LIMIT_BURST", per_minute)),
+            max_concurrent_requests=int(os.environ.get("MEDICAL_NLP_MAX_CONCURRENT_REQUESTS", 10)),
+            max_websockets=int(os.environ.get("MEDICAL_NLP_MAX_WEBSOCKETS", 10)),
+            api_key_hashes=frozenset(_key_hash(key) for key in keys),
+        )
+
+
+class MemoryLimiterBackend:
+    """Token buckets and slot counts for a single API process"""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def take_token(self, key: str, rate: float, capacity: int, now: float) -> Tuple[bool, float, float]:
+        """(allowed, tokens left, seconds until the next token)"""
+        with self._lock:
+            if now - self._last_sweep >= BUCKET_SWEEP_SECONDS:
+                self._sweep(rate, capacity, now)
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def _sweep(self, rate: float, capacity: int, now: float):
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * rate < capacity
+        }
+        self._last_sweep = now
+
+    def acquire_slot(self, key: str, kind: str, limit: int) -> Optional[str]:
+        with self._lock:
+            held = self._slots.get((key, kind), 0)
+            if held >= limit:
+                return None
+            self._slots[(key, kind)] = held + 1
+        return kind
+
+    def release_slot(self, key: str, kind: str, token: str):
+        with self._lock:
+            held = self._slots.get((key, kind), 0) - 1
+            if held > 0:
+                self._slots[(key, kind)] = held
+            else:
+                self._slots.pop((key, kind), None)
+
+
+class SqliteLimiterBackend:
+    """Limiter state in a local SQLite file shared by every worker process on the host.
+
+    Slots record the owning pid, so slots held by a worker that died are
+    reclaimed the next time the key is at its limit. Every call may wait
+    on the file lock, so callers on an event loop must not run it inline
+    (`blocking` is set).
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = time.time()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL);
+                CREATE TABLE IF NOT EXISTS slots (token TEXT PRIMARY KEY, key TEXT, kind TEXT, pid INTEGER);
+                CREATE INDEX IF NOT EXISTS idx_slots_key ON slots (key, kind);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take_token(self, key: str, rate: float, capacity: int, now: float) -> Tuple[bool, float, float]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+            if now - self._last_sweep >= BUCKET_SWEEP_SECONDS:
+                conn.execute("DELETE FROM buckets WHERE tokens + (? - updated) * ? >= ?", (now, rate, capacity))
+                self._last_sweep = now
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def acquire_slot(self, key: str, kind: str, limit: int) -> Optional[str]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            held = conn.execute("SELECT token, pid FROM slots WHERE key = ? AND kind = ?", (key, kind)).fetchall()
+            if len(held) >= limit:
+                stale = [token for token, pid in held if not _pid_alive(pid)]
+                conn.executemany("DELETE FROM slots WHERE token = ?", [(token,) for token in stale])
+                if len(held) - len(stale) >= limit:
+                    conn.execute("COMMIT")
+                    return None
+            token = uuid.uuid4().hex
+            conn.execute("INSERT INTO slots VALUES (?, ?, ?, ?)", (token, key, kind, os.getpid()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return token
+
+    def release_slot(self, key: str, kind: str, token: str):
+        self._connect().execute("DELETE FROM slots WHERE token = ?", (token,))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RateLimiter:
+    """Per-client token-bucket rate limits plus concurrent request and WebSocket caps"""
+
+    def __init__(self, config: Optional[RateLimitConfig] = None, backend=None):
+        self.config = config or RateLimitConfig.from_env()
+        self.backend = backend or MemoryLimiterBackend()
+        self._counters: Dict[str, int] = {"allowed": 0, "rate_limited": 0,
+                                          "concurrency_limited": 0, "websocket_limited": 0}
+        self._client_hits: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check_rate(self, client: str) -> Tuple[bool, float, float]:
+        allowed, remaining, retry_after = self.backend.take_token(
+            client, self.config.requests_per_minute / 60, self.config.burst, time.time()
+        )
+        if not allowed:
+            self._record_hit("rate_limited", client)
+        return allowed, remaining, retry_after
+
+    def acquire(self, client: str, kind: str) -> Optional[str]:
+        limit = self.config.max_websockets if kind == "websocket" else self.config.max_concurrent_requests
+        token = self.backend.acquire_slot(client, kind, limit)
+        if token is None:
+            self._record_hit("websocket_limited" if kind == "websocket" else "concurrency_limited", client)
+        else:
+            with self._lock:
+                self._counters["allowed"] += 1
+        return token
+
+    def release(self, client: str, kind: str, token: str):
+        self.backend.release_slot(client, kind, token)
+
+    def _record_hit(self, counter: str, client: str):
+        with self._lock:
+            self._counters[counter] += 1
+            fingerprint = _client_fingerprint(client)
+            self._client_hits[fingerprint] = self._client_hits.get(fingerprint, 0) + 1
+            if len(self._client_hits) > MAX_TRACKED_CLIENTS:
+                # Keep the most limited half so the table stays bounded
+                top = sorted(self._client_hits.items(), key=lambda item: item[1], reverse=True)
+                self._client_hits = dict(top[:MAX_TRACKED_CLIENTS // 2])
+
+    def metrics(self) -> Dict[str, Any]:
+        """Limit hit counters for this process, with the most limited clients by key fingerprint"""
+        with self._lock:
+            top_clients = sorted(self._client_hits.items(), key=lambda item: item[1], reverse=True)[:10]
+            return {
+                **self._counters,
+                "limits": {
+                    "requests_per_minute": self.config.requests_per_minute,
+                    "burst": self.config.burst,
+                    "max_concurrent_requests": self.config.max_concurrent_requests,
+                    "max_websockets": self.config.max_websockets
+                },
+                "top_limited_clients": dict(top_clients)
+            }
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _client_fingerprint(client: str) -> str:
+    """Stable identifier for metrics that does not expose the API key itself"""
+    return hashlib.sha256(client.encode()).hexdigest()[:12]
+
+
+def create_rate_limiter() -> RateLimiter:
+    """In-memory limiter, or one shared through MEDICAL_NLP_RATE_LIMIT_STORE for multi-worker setups"""
+    store_path = os.environ.get("MEDICAL_NLP_RATE_LIMIT_STORE")
+    backend = SqliteLimiterBackend(store_path) if store_path else MemoryLimiterBackend()
+    return RateLimiter(RateLimitConfig.from_env(), backend)
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing a RateLimiter per known X-API-Key (client address otherwise).
+
+    Written against raw ASGI rather than BaseHTTPMiddleware so streaming
+    responses and WebSockets keep their concurrency slot until they finish.
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+        # One thread keeps blocking backends off the event loop and their connections few
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="ratelimit") \
+            if getattr(limiter.backend, "blocking", False) else None
+
+    async def _call(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        client = _client_id(scope, self.limiter.config.api_key_hashes)
+        kind = "websocket" if scope["type"] == "websocket" else "request"
+        allowed, remaining, retry_after = await self._call(self.limiter.check_rate, client)
+        if not allowed:
+            await self._reject(scope, receive, send, "Rate limit exceeded", "rate_limited", retry_after)
+            return
+
+        token = await self._call(self.limiter.acquire, client, kind)
+        if token is None:
+            detail = "Too many concurrent WebSocket connections" if kind == "websocket" \
+                else "Too many concurrent requests"
+            await self._reject(scope, receive, send, detail, "concurrency_limited", 1.0)
+            return
+
+        try:
+            await self.app(scope, receive, self._with_headers(send, remaining))
+        finally:
+            if self._executor is None:
+                self.limiter.release(client, kind, token)
+            else:
+                # Not awaited, so a cancelled request still releases its slot
+                self._executor.submit(self.limiter.release, client, kind, token)
+
+    def _with_headers(self, send, remaining: float):
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-ratelimit-limit", str(int(self.limiter.config.requests_per_minute)).encode()))
+                headers.append((b"x-ratelimit-remaining", str(int(remaining)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        return send_with_headers
+
+    async def _reject(self, scope, receive, send, detail: str, error_type: str, retry_after: float):
+        logger.debug(f"Rejected {scope['type']} {scope['path']}: {detail}")
+        if scope["type"] == "websocket":
+            # 1008: policy violation, sent before the handshake is accepted
+            await send({"type": "websocket.close", "code": 1008, "reason": detail})
+            return
+        response = JSONResponse(
+            status_code=429,
+            content={"detail": detail, "type": error_type},
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+        await response(scope, receive, send)
+
+
+def _client_id(scope, api_key_hashes: FrozenSet[str]) -> str:
+    """The API key's hash if it is a configured one, otherwise the client address
+
+    Only the hash is used, so bucket keys (and the SQLite store) never hold a raw key.
+    """
+    for name, value in scope.get("headers", []):
+        if name == b"x-api-key" and value:
+            key_hash = _key_hash(value.decode("latin-1"))
+            if key_hash in api_key_hashes:
+                return "key:" + key_hash
+            break
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
@@ -0,0 +1,166 @@
+"""
+Dependency-graph execution of pipeline stages on a shared thread pool.
+
+MedicalTranscriptionPipeline.iter_stages builds one StageGraph per
+conversation. Each stage names the stages whose results it consumes:
+
+    entities -> summary -> soap_note -> quality_metrics
+    utterances -> sentiment_analysis
+    utterances -> sections -> soap_note
+
+StageScheduler starts every stage as soon as its dependencies have finished
+and yields results in completion order. MEDICAL_NLP_STAGE_WORKERS sizes the
+pool (default min(4, cpu_count)); 1 runs the stages one after another. Each
+run logs its wall time, the summed stage time and the critical path, the
+longest chain of dependent stages, which bounds how fast the run can get
+however many workers there are. Pass a dict as `report` to receive the
+same numbers.
+"""
+
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    depends_on: List[str] = field(default_factory=list)
+    emit: bool = True
+
+
+class StageGraph:
+    """Pipeline stages and the stages whose results each one consumes.
+
+    A stage's function is called with its dependencies' results as keyword
+    arguments. Stages with emit=False are intermediate results that are
+    passed to other stages but not yielded by the scheduler.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[..., Any], depends_on: Optional[List[str]] = None,
+            emit: bool = True) -> "StageGraph":
+        depends_on = list(depends_on or [])
+        unknown = [dep for dep in depends_on if dep not in self.stages]
+        if unknown:
+            # Requiring dependencies to be added first keeps the graph acyclic
+            raise ValueError(f"Stage {name} depends on unknown stages: {', '.join(unknown)}")
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage {name}")
+        self.stages[name] = Stage(name, func, depends_on, emit)
+        return self
+
+
+class StageScheduler:
+    """Runs a StageGraph, starting every stage as soon as its dependencies finish.
+
+    Independent stages run concurrently on a shared thread pool; the calling
+    thread only dispatches and collects, so nested or concurrent runs cannot
+    deadlock the pool. With a single worker stages run inline in the order
+    they were added.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.environ.get("MEDICAL_NLP_STAGE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        if self.max_workers > 1:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pipeline-stage")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def run(self, graph: StageGraph, report: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Any]]:
+        """Yield (stage, result) for emitted stages in completion order
+
+        If `report` is given it is filled with per-stage timings and the
+        critical path once every stage has finished.
+        """
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Tuple[float, float]] = {}
+        started = time.perf_counter()
+
+        if self._executor is None:
+            for stage in graph.stages.values():
+                value, start, end = _run_timed(stage, results)
+                results[stage.name] = value
+                timings[stage.name] = (start, end)
+                if stage.emit:
+                    yield stage.name, value
+        else:
+            pending = dict(graph.stages)
+            running: Dict[Future, Stage] = {}
+            try:
+                while pending or running:
+                    ready = [stage for stage in pending.values()
+                             if all(dep in results for dep in stage.depends_on)]
+                    for stage in ready:
+                        del pending[stage.name]
+                        running[self._executor.submit(_run_timed, stage, results)] = stage
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage = running.pop(future)
+                        value, start, end = future.result()
+                        results[stage.name] = value
+                        timings[stage.name] = (start, end)
+                        if stage.emit:
+                            yield stage.name, value
+            finally:
+                for future in running:
+                    future.cancel()
+
+        schedule = _schedule_report(graph, timings, started, time.perf_counter(), self.max_workers)
+        logger.info(
+            f"Stages finished in {schedule['wall_time']:.3f}s "
+            f"(critical path {schedule['critical_path_time']:.3f}s: {' -> '.join(schedule['critical_path'])}, "
+            f"serial {schedule['serial_time']:.3f}s)"
+        )
+        if report is not None:
+            report.update(schedule)
+
+
+def _run_timed(stage: Stage, results: Dict[str, Any]) -> Tuple[Any, float, float]:
+    start = time.perf_counter()
+    value = stage.func(**{dep: results[dep] for dep in stage.depends_on})
+    return value, start, time.perf_counter()
+
+
+def _schedule_report(graph: StageGraph, timings: Dict[str, Tuple[float, float]],
+                     started: float, finished: float, workers: int) -> Dict[str, Any]:
+    """Wall time, summed stage time and the longest dependency chain by stage duration"""
+    durations = {name: end - start for name, (start, end) in timings.items()}
+    path_time: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for name, stage in graph.stages.items():
+        slowest = max(stage.depends_on, key=lambda dep: path_time[dep], default=None)
+        previous[name] = slowest
+        path_time[name] = durations[name] + (path_time[slowest] if slowest else 0.0)
+
+    last = max(path_time, key=path_time.get) if path_time else None
+    critical_path = []
+    while last is not None:
+        critical_path.append(last)
+        last = previous[last]
+
+    return {
+        "workers": workers,
+        "wall_time": finished - started,
+        "serial_time": sum(durations.values()),
+        "critical_path_time": path_time[critical_path[0]] if critical_path else 0.0,
+        "critical_path": critical_path[::-1],
+        "stages": {
+            name: {"start": start - started, "duration": durations[name]}
+            for name, (start, _) in timings.items()
+        }
+    }
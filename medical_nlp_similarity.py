@@ -0,0 +1,397 @@
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from medical_nlp_filelock import FileLock
+from medical_nlp_store import format_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMILARITY_DIR = os.path.join("index", "similarity")
+DEFAULT_DUPLICATE_THRESHOLD = 0.97
+DUPLICATE_CANDIDATES = 10
+
+
+def text_fingerprint(text: str) -> str:
+    """Hash of a transcript that only ignores trailing whitespace, so equal fingerprints mean equal entity offsets"""
+    return hashlib.sha256(text.rstrip().encode("utf-8")).hexdigest()
+
+
+class TextEncoder:
+    """Base class for transcript embedding encoders"""
+
+    name = "base"
+    dim = 0
+
+    def encode(self, text: str) -> np.ndarray:
+        """Return an L2-normalized float32 vector of length `dim`"""
+        raise NotImplementedError
+
+
+class HashedBagOfTermsEncoder(TextEncoder):
+    """Signed feature hashing of unigrams and bigrams with sublinear term frequency"""
+
+    name = "hashed"
+    TOKEN_RE = re.compile(r"[a-z][a-z']+|\d+")
+    STOPWORDS = frozenset(["doctor", "patient", "physician", "the", "and", "to", "of", "a", "i", "it"])
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def encode(self, text: str) -> np.ndarray:
+        tokens = [token for token in self.TOKEN_RE.findall(text.lower()) if token not in self.STOPWORDS]
+        features = Counter(tokens)
+        features.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in features.items():
+            digest = zlib.crc32(feature.encode())
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class TransformerEncoder(TextEncoder):
+    """Mean-pooled transformer embeddings; heavier, but robust to paraphrase"""
+
+    name = "transformer"
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", max_length: int = 512):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+        self.max_length = max_length
+        self.dim = self.model.config.hidden_size
+
+    def encode(self, text: str) -> np.ndarray:
+        inputs = self.tokenizer(text, truncation=True, max_length=self.max_length, return_tensors="pt")
+        with self._torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).float()
+        vector = ((hidden * mask).sum(dim=1) / mask.sum(dim=1))[0].numpy().astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+TEXT_ENCODERS: Dict[str, Type[TextEncoder]] = {
+    HashedBagOfTermsEncoder.name: HashedBagOfTermsEncoder,
+    TransformerEncoder.name: TransformerEncoder,
+}
+
+
+def create_text_encoder(name: Optional[str] = None, **kwargs) -> TextEncoder:
+    """Build the configured encoder (MEDICAL_NLP_EMBEDDING_ENCODER, default 'hashed')"""
+    name = name or os.environ.get("MEDICAL_NLP_EMBEDDING_ENCODER", HashedBagOfTermsEncoder.name)
+    if name not in TEXT_ENCODERS:
+        raise ValueError(f"Unknown text encoder '{name}'. Choose from: {', '.join(TEXT_ENCODERS)}")
+    return TEXT_ENCODERS[name](**kwargs)
+
+
+class SimilarityIndex:
+    """On-disk approximate nearest-neighbour index of transcript embeddings.
+
+    Vectors (float16) and random-hyperplane LSH signatures are appended to flat
+    files and memory-mapped. Each of `num_tables` tables buckets documents by a
+    `bits_per_table`-bit signature; lookups gather candidates from the matching
+    buckets and rerank them by exact cosine similarity. Documents added since
+    the last rebuild live in in-memory buckets until `rebuild_every` is reached.
+
+    Several processes can share one directory: appends hold an inter-process
+    lock, and every operation first picks up documents the others appended.
+    """
+
+    def __init__(self, directory: Optional[str] = None, encoder: Optional[TextEncoder] = None,
+                 num_tables: int = 16, bits_per_table: int = 12, rebuild_every: int = 5000,
+                 seed: int = 13):
+        if bits_per_table > 16:
+            raise ValueError("bits_per_table must be at most 16")
+        self.directory = directory or os.environ.get("MEDICAL_NLP_SIMILARITY_DIR", DEFAULT_SIMILARITY_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.encoder = encoder or create_text_encoder()
+        self.rebuild_every = rebuild_every
+
+        self._lock = FileLock(os.path.join(self.directory, "index.lock"))
+        with self._lock:
+            manifest = self._read_manifest()
+            if manifest:
+                if manifest["encoder"] != self.encoder.name or manifest["dim"] != self.encoder.dim:
+                    raise ValueError(
+                        f"Similarity index at {self.directory} was built with "
+                        f"{manifest['encoder']}/{manifest['dim']}, not {self.encoder.name}/{self.encoder.dim}"
+                    )
+                num_tables, bits_per_table, seed = manifest["num_tables"], manifest["bits_per_table"], manifest["seed"]
+            self.num_tables = num_tables
+            self.bits_per_table = bits_per_table
+            self.seed = seed
+            if not manifest:
+                self._write_manifest()
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((num_tables * bits_per_table, self.encoder.dim)).astype(np.float32)
+        self._bit_weights = (1 << np.arange(bits_per_table)).astype(np.uint16)
+        self._vector_bytes = self.encoder.dim * 2
+        self._signature_bytes = num_tables * 2
+
+        self._vectors_path = os.path.join(self.directory, "vectors.f16")
+        self._signatures_path = os.path.join(self.directory, "signatures.u16")
+        self._docs_path = os.path.join(self.directory, "docs.jsonl")
+        self.docs: List[Dict[str, Any]] = []
+        self._doc_by_encounter: Dict[str, int] = {}
+        self._docs_offset = 0
+        with self._lock:
+            self._load_docs()
+            self._rebuild()
+
+    def add(self, encounter_id: str, text: str, patient_id: Optional[str] = None,
+            encounter_date: Optional[datetime] = None) -> int:
+        return self.add_vector(encounter_id, self.encoder.encode(text), patient_id, encounter_date,
+                               text_hash=text_fingerprint(text))
+
+    def add_vector(self, encounter_id: str, vector: np.ndarray, patient_id: Optional[str] = None,
+                   encounter_date: Optional[datetime] = None, text_hash: Optional[str] = None) -> int:
+        """Append one embedding; re-adding an encounter id supersedes its older vector"""
+        if encounter_date is not None:
+            encounter_date = format_date(encounter_date)
+        signature = self._signatures(vector[np.newaxis, :])[0]
+
+        with self._lock:
+            self._refresh()
+            doc = len(self.docs)
+            meta = {"encounter_id": encounter_id, "patient_id": patient_id, "encounter_date": encounter_date,
+                    "text_hash": text_hash}
+            # The docs.jsonl line commits the document, so it is written last; anything a
+            # crashed writer left past the committed documents is cut off first
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(doc * self._vector_bytes)
+                f.write(vector.astype(np.float16).tobytes())
+            with open(self._signatures_path, "ab") as f:
+                f.truncate(doc * self._signature_bytes)
+                f.write(signature.tobytes())
+            with open(self._docs_path, "ab") as f:
+                f.truncate(self._docs_offset)
+                f.write((json.dumps(meta) + "\n").encode())
+                self._docs_offset = f.tell()
+
+            self._append_tail(meta, vector.astype(np.float32), signature)
+            if len(self._tail_vectors) >= self.rebuild_every:
+                self._rebuild()
+        return doc
+
+    def query(self, text: Optional[str] = None, vector: Optional[np.ndarray] = None, k: int = 10,
+              min_score: float = 0.0, exclude: Optional[str] = None,
+              patient_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k most similar encounters to a text or embedding, best first, optionally of one patient only"""
+        return [
+            {key: value for key, value in hit.items() if key != "text_hash"}
+            for hit in self._hits(text, vector, k, min_score, exclude, patient_id)
+        ]
+
+    def _hits(self, text: Optional[str], vector: Optional[np.ndarray], k: int, min_score: float,
+              exclude: Optional[str], patient_id: Optional[str]) -> List[Dict[str, Any]]:
+        if vector is None:
+            vector = self.encoder.encode(text or "")
+        signature = self._signatures(vector[np.newaxis, :])[0]
+
+        with self._lock:
+            self._refresh()
+            candidates = self._candidates(signature)
+            if not candidates:
+                return []
+            docs = np.fromiter(candidates, dtype=np.int64)
+            scores = cosine_similarity(vector[np.newaxis, :], self._gather(docs))[0]
+
+            order = np.argsort(-scores)
+            hits = []
+            for position in order:
+                score = float(scores[position])
+                if score < min_score or len(hits) >= k:
+                    break
+                doc = int(docs[position])
+                meta = self.docs[doc]
+                if meta["encounter_id"] == exclude or self._doc_by_encounter.get(meta["encounter_id"]) != doc:
+                    continue
+                if patient_id is not None and meta["patient_id"] != patient_id:
+                    continue
+                hits.append({**meta, "score": round(score, 4)})
+            return hits
+
+    def similar_to(self, encounter_id: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Nearest neighbours of an already indexed encounter"""
+        with self._lock:
+            self._refresh()
+            doc = self._doc_by_encounter.get(encounter_id)
+            if doc is None:
+                return None
+            vector = self._gather(np.array([doc]))[0]
+        return self.query(vector=vector, k=k, exclude=encounter_id)
+
+    def find_duplicate(self, text: str, patient_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """An indexed encounter of the same patient with exactly this transcript, if any
+
+        Near-duplicates are never returned: a one-word edit can change the
+        diagnosis while keeping cosine similarity above 0.99.
+        """
+        text_hash = text_fingerprint(text)
+        for hit in self._hits(text, None, DUPLICATE_CANDIDATES, 0.0, None, patient_id):
+            if hit["patient_id"] == patient_id and hit.get("text_hash") == text_hash:
+                return {key: value for key, value in hit.items() if key != "text_hash"}
+        return None
+
+    def near_duplicates(self, text: str, patient_id: Optional[str] = None, k: int = 5) -> List[Dict[str, Any]]:
+        """Encounters of the same patient whose transcripts are at least `duplicate_threshold()` similar"""
+        return self.query(text, k=k, min_score=self.duplicate_threshold(), patient_id=patient_id)
+
+    @staticmethod
+    def duplicate_threshold() -> float:
+        return float(os.environ.get("MEDICAL_NLP_DUPLICATE_THRESHOLD", DEFAULT_DUPLICATE_THRESHOLD))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "documents": len(self._doc_by_encounter),
+                "encoder": self.encoder.name,
+                "dim": self.encoder.dim,
+                "tables": self.num_tables,
+                "bits_per_table": self.bits_per_table,
+                "unindexed_tail": len(self._tail_vectors)
+            }
+
+    def _signatures(self, vectors: np.ndarray) -> np.ndarray:
+        bits = (vectors @ self._planes.T > 0).reshape(len(vectors), self.num_tables, self.bits_per_table)
+        return (bits * self._bit_weights).sum(axis=2).astype(np.uint16)
+
+    def _candidates(self, signature: np.ndarray) -> set:
+        candidates = set()
+        for table, value in enumerate(signature):
+            sorted_values = self._sorted_signatures[table]
+            if len(sorted_values):
+                lo = np.searchsorted(sorted_values, value, side="left")
+                hi = np.searchsorted(sorted_values, value, side="right")
+                candidates.update(self._sorted_docs[table][lo:hi].tolist())
+            candidates.update(self._tail_buckets[table].get(int(value), ()))
+        return candidates
+
+    def _gather(self, docs: np.ndarray) -> np.ndarray:
+        indexed = docs < self._indexed_count
+        vectors = np.empty((len(docs), self.encoder.dim), dtype=np.float32)
+        if indexed.any():
+            vectors[indexed] = self._vectors[docs[indexed]]
+        for i in np.flatnonzero(~indexed):
+            vectors[i] = self._tail_vectors[docs[i] - self._indexed_count]
+        return vectors
+
+    def _rebuild(self):
+        """Re-map the vector file and re-sort every table's signatures"""
+        with self._lock:
+            count = len(self.docs)
+            if count:
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode="r",
+                                          shape=(count, self.encoder.dim))
+                signatures = np.memmap(self._signatures_path, dtype=np.uint16, mode="r",
+                                       shape=(count, self.num_tables))
+                self._sorted_docs = [np.argsort(signatures[:, table], kind="stable")
+                                     for table in range(self.num_tables)]
+                self._sorted_signatures = [np.asarray(signatures[order, table])
+                                           for table, order in enumerate(self._sorted_docs)]
+            else:
+                self._vectors = np.zeros((0, self.encoder.dim), dtype=np.float16)
+                self._sorted_docs = [np.zeros(0, dtype=np.int64)] * self.num_tables
+                self._sorted_signatures = [np.zeros(0, dtype=np.uint16)] * self.num_tables
+            self._indexed_count = count
+            self._tail_vectors: List[np.ndarray] = []
+            self._tail_buckets: List[Dict[int, List[int]]] = [{} for _ in range(self.num_tables)]
+
+    def _append_tail(self, meta: Dict[str, Any], vector: np.ndarray, signature: np.ndarray):
+        doc = len(self.docs)
+        self.docs.append(meta)
+        self._doc_by_encounter[meta["encounter_id"]] = doc
+        self._tail_vectors.append(vector)
+        for table, value in enumerate(signature):
+            self._tail_buckets[table].setdefault(int(value), []).append(doc)
+
+    def _read_new_docs(self) -> List[Dict[str, Any]]:
+        """Complete docs.jsonl lines past the ones already read"""
+        if _file_size(self._docs_path) <= self._docs_offset:
+            return []
+        with open(self._docs_path, "rb") as f:
+            f.seek(self._docs_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        self._docs_offset += len(complete)
+        return [json.loads(line) for line in complete.splitlines() if line.strip()]
+
+    def _refresh(self):
+        """Add documents appended by other processes to the tail; caller holds the lock"""
+        new_docs = self._read_new_docs()
+        if not new_docs:
+            return
+        first = len(self.docs)
+        vectors = np.fromfile(self._vectors_path, dtype=np.float16, count=len(new_docs) * self.encoder.dim,
+                              offset=first * self._vector_bytes).reshape(len(new_docs), self.encoder.dim)
+        signatures = np.fromfile(self._signatures_path, dtype=np.uint16, count=len(new_docs) * self.num_tables,
+                                 offset=first * self._signature_bytes).reshape(len(new_docs), self.num_tables)
+        for meta, vector, signature in zip(new_docs, vectors, signatures):
+            self._append_tail(meta, vector.astype(np.float32), signature)
+        if len(self._tail_vectors) >= self.rebuild_every:
+            self._rebuild()
+
+    def _load_docs(self):
+        self.docs = self._read_new_docs()
+        # A crash between appends can leave the files with different lengths
+        vectors_size = _file_size(self._vectors_path)
+        signatures_size = _file_size(self._signatures_path)
+        count = min(len(self.docs), vectors_size // self._vector_bytes, signatures_size // self._signature_bytes)
+        if (count < len(self.docs) or vectors_size != count * self._vector_bytes
+                or signatures_size != count * self._signature_bytes):
+            logger.warning(f"Truncating similarity index to {count} consistent documents")
+            self.docs = self.docs[:count]
+            for path, size in ((self._vectors_path, self._vector_bytes),
+                               (self._signatures_path, self._signature_bytes)):
+                with open(path, "a+b") as f:
+                    f.truncate(count * size)
+            data = "".join(json.dumps(meta) + "\n" for meta in self.docs).encode()
+            with open(self._docs_path, "wb") as f:
+                f.write(data)
+            self._docs_offset = len(data)
+        self._doc_by_encounter = {meta["encounter_id"]: doc for doc, meta in enumerate(self.docs)}
+        logger.info(f"Loaded similarity index with {len(self._doc_by_encounter)} encounters")
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({
+                "encoder": self.encoder.name,
+                "dim": self.encoder.dim,
+                "num_tables": self.num_tables,
+                "bits_per_table": self.bits_per_table,
+                "seed": self.seed
+            }, f)
+        os.replace(path + ".tmp", path)
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
@@ -0,0 +1,253 @@
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = "medical_nlp_store.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS encounters (
+    encounter_id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    encounter_date TEXT NOT NULL,
+    stored_at TEXT NOT NULL,
+    patient_name TEXT,
+    current_status TEXT,
+    prognosis TEXT,
+    severity_score REAL,
+    result_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_encounters_patient_date ON encounters (patient_id, encounter_date);
+
+CREATE TABLE IF NOT EXISTS encounter_entities (
+    encounter_id TEXT NOT NULL REFERENCES encounters (encounter_id) ON DELETE CASCADE,
+    patient_id TEXT NOT NULL,
+    encounter_date TEXT NOT NULL,
+    label TEXT NOT NULL,
+    term TEXT NOT NULL,
+    start INTEGER,
+    "end" INTEGER,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS idx_entities_patient_label_date
+    ON encounter_entities (patient_id, label, encounter_date);
+CREATE INDEX IF NOT EXISTS idx_entities_label_term ON encounter_entities (label, term);
+CREATE INDEX IF NOT EXISTS idx_entities_encounter ON encounter_entities (encounter_id);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS encounters_fts USING fts5 (
+    encounter_id UNINDEXED,
+    patient_id UNINDEXED,
+    conversation_text,
+    tokenize = 'porter'
+);
+"""
+
+
+class PatientStore:
+    """SQLite store of analysis results indexed by patient, encounter date and entity label.
+
+    Every analyzed encounter is written once; timeline and history queries
+    are answered from the indexes without rerunning the pipeline.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("MEDICAL_NLP_STORE_PATH", DEFAULT_STORE_PATH)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self.full_text_search = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite was built without FTS5; transcript search is disabled")
+            self.full_text_search = False
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def save_encounter(self, patient_id: str, results: Dict[str, Any],
+                       encounter_date: Optional[datetime] = None,
+                       conversation_text: Optional[str] = None,
+                       encounter_id: Optional[str] = None) -> str:
+        """Persist one process_conversation() result and return its encounter id"""
+        encounter_id = encounter_id or str(uuid.uuid4())
+        encounter_date = format_date(encounter_date or datetime.now(timezone.utc))
+        summary = results.get("summary") or {}
+
+        entity_rows = [
+            (
+                encounter_id, patient_id, encounter_date,
+                entity["label"], _normalize_term(entity),
+                entity.get("start"), entity.get("end"), entity.get("confidence")
+            )
+            for entity in results.get("entities", [])
+        ]
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM encounters WHERE encounter_id = ?", (encounter_id,))
+            self._conn.execute(
+                "INSERT INTO encounters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    encounter_id, patient_id, encounter_date, datetime.now().isoformat(),
+                    summary.get("patient_name"), summary.get("current_status"),
+                    summary.get("prognosis"), summary.get("severity_score"),
+                    json.dumps(results, default=str)
+                )
+            )
+            self._conn.executemany(
+                "INSERT INTO encounter_entities VALUES (?, ?, ?, ?, ?, ?, ?, ?)", entity_rows
+            )
+            if self.full_text_search and conversation_text:
+                self._conn.execute("DELETE FROM encounters_fts WHERE encounter_id = ?", (encounter_id,))
+                self._conn.execute(
+                    "INSERT INTO encounters_fts VALUES (?, ?, ?)",
+                    (encounter_id, patient_id, conversation_text)
+                )
+        logger.info(f"Stored encounter {encounter_id} for patient {patient_id}")
+        return encounter_id
+
+    def get_encounter(self, encounter_id: str) -> Optional[Dict[str, Any]]:
+        """Full stored analysis result for one encounter"""
+        row = self._query_one("SELECT * FROM encounters WHERE encounter_id = ?", (encounter_id,))
+        if row is None:
+            return None
+        encounter = self._encounter_summary(row)
+        encounter["result"] = json.loads(row["result_json"])
+        return encounter
+
+    def timeline(self, patient_id: str, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, label: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A patient's encounters in date order with their entity terms grouped by label"""
+        clauses, params = self._date_range(patient_id, start, end)
+        encounters = self._query(
+            f"SELECT encounter_id, patient_id, encounter_date, patient_name, current_status, "
+            f"prognosis, severity_score FROM encounters WHERE {clauses} ORDER BY encounter_date",
+            params
+        )
+        timeline = {row["encounter_id"]: {**self._encounter_summary(row), "entities": {}}
+                    for row in encounters}
+        if not timeline:
+            return []
+
+        entity_sql = (
+            f"SELECT DISTINCT encounter_id, label, term FROM encounter_entities WHERE {clauses}"
+        )
+        if label:
+            entity_sql += " AND label = ?"
+            params = params + [label]
+        for row in self._query(entity_sql + " ORDER BY encounter_id, label, term", params):
+            timeline[row["encounter_id"]]["entities"].setdefault(row["label"], []).append(row["term"])
+        return list(timeline.values())
+
+    def entity_history(self, patient_id: str, label: Optional[str] = None,
+                       start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Per-term mention counts with first and last encounter dates for a patient"""
+        clauses, params = self._date_range(patient_id, start, end)
+        if label:
+            clauses += " AND label = ?"
+            params.append(label)
+        rows = self._query(
+            f"SELECT label, term, COUNT(DISTINCT encounter_id) AS encounters, COUNT(*) AS mentions, "
+            f"MIN(encounter_date) AS first_seen, MAX(encounter_date) AS last_seen "
+            f"FROM encounter_entities WHERE {clauses} "
+            f"GROUP BY label, term ORDER BY label, first_seen, term",
+            params
+        )
+        return [dict(row) for row in rows]
+
+    def search(self, query: str, patient_id: Optional[str] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over stored transcripts, best matches first"""
+        if not self.full_text_search:
+            raise RuntimeError("Full-text search needs SQLite built with FTS5")
+        sql = (
+            "SELECT e.encounter_id, e.patient_id, e.encounter_date, e.patient_name, "
+            "e.current_status, e.prognosis, e.severity_score, "
+            "snippet(encounters_fts, 2, '[', ']', '...', 12) AS snippet "
+            "FROM encounters_fts JOIN encounters e USING (encounter_id) "
+            "WHERE encounters_fts MATCH ?"
+        )
+        params: List[Any] = [query]
+        if patient_id:
+            sql += " AND e.patient_id = ?"
+            params.append(patient_id)
+        sql += " ORDER BY bm25(encounters_fts) LIMIT ?"
+        params.append(limit)
+        return [{**self._encounter_summary(row), "snippet": row["snippet"]}
+                for row in self._query(sql, params)]
+
+    def patient_count(self, patient_id: str) -> int:
+        row = self._query_one("SELECT COUNT(*) FROM encounters WHERE patient_id = ?", (patient_id,))
+        return row[0]
+
+    def _date_range(self, patient_id: str, start: Optional[datetime],
+                    end: Optional[datetime]):
+        clauses = "patient_id = ?"
+        params: List[Any] = [patient_id]
+        if start:
+            clauses += " AND encounter_date >= ?"
+            params.append(format_date(start))
+        if end:
+            clauses += " AND encounter_date <= ?"
+            params.append(format_date(end))
+        return clauses, params
+
+    def _encounter_summary(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "encounter_id": row["encounter_id"],
+            "patient_id": row["patient_id"],
+            "encounter_date": row["encounter_date"],
+            "patient_name": row["patient_name"],
+            "current_status": row["current_status"],
+            "prognosis": row["prognosis"],
+            "severity_score": row["severity_score"]
+        }
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_one(self, sql: str, params=()) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+
+def format_date(value) -> str:
+    """ISO-8601 text so lexical order matches chronological order in the indexes
+
+    Timezone-aware values, including ISO strings with an offset, are
+    converted to naive UTC so encounters from different offsets sort
+    correctly. Naive values are taken as UTC, which is also what encounters
+    without a date are stamped with.
+    """
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        if parsed.tzinfo is None:
+            return value
+        value = parsed
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="seconds")
+
+
+def _normalize_term(entity: Dict[str, Any]) -> str:
+    return (entity.get("normalized_form") or entity["text"]).strip().lower()
@@ -0,0 +1,284 @@
+"""
+Connection manager for the streaming transcription WebSocket.
+
+Every live socket gets a bounded inbound queue (text waiting for entity
+extraction) and a bounded outbound queue (results waiting to be sent), so a
+fast sender cannot pile up unbounded work and a slow reader never blocks
+extraction. When a queue is full its policy decides what gives:
+
+    inbound  coalesce     append the new text to the newest queued message,
+                          so nothing is lost but fewer extractions run
+             drop_oldest  discard the oldest queued message
+             reject       answer the new message with an "overloaded" error
+    outbound drop_oldest  discard the oldest unsent result
+             close        disconnect the slow reader with code 1013
+
+Messages longer than `max_message_chars` are answered with an error and not
+processed. All connections share one lazily built extractor, and at most
+`max_concurrent_extractions` extractions run at once across them.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+INBOUND_POLICIES = ("coalesce", "drop_oldest", "reject")
+OUTBOUND_POLICIES = ("drop_oldest", "close")
+
+# 1013: try again later
+CLOSE_OVERLOADED = 1013
+
+
+@dataclass
+class StreamLimits:
+    max_connections: int = 100
+    inbound_queue_size: int = 32
+    outbound_queue_size: int = 32
+    inbound_policy: str = "coalesce"
+    outbound_policy: str = "drop_oldest"
+    max_concurrent_extractions: int = 4
+    max_message_chars: int = 10000
+
+    def __post_init__(self):
+        if self.inbound_policy not in INBOUND_POLICIES:
+            raise ValueError(f"Unknown inbound policy {self.inbound_policy}; expected one of {', '.join(INBOUND_POLICIES)}")
+        if self.outbound_policy not in OUTBOUND_POLICIES:
+            raise ValueError(f"Unknown outbound policy {self.outbound_policy}; expected one of {', '.join(OUTBOUND_POLICIES)}")
+
+    @classmethod
+    def from_env(cls) -> "StreamLimits":
+        return cls(
+            max_connections=int(os.environ.get("MEDICAL_NLP_WS_MAX_CONNECTIONS", 100)),
+            inbound_queue_size=int(os.environ.get("MEDICAL_NLP_WS_INBOUND_QUEUE", 32)),
+            outbound_queue_size=int(os.environ.get("MEDICAL_NLP_WS_OUTBOUND_QUEUE", 32)),
+            inbound_policy=os.environ.get("MEDICAL_NLP_WS_INBOUND_POLICY", "coalesce"),
+            outbound_policy=os.environ.get("MEDICAL_NLP_WS_OUTBOUND_POLICY", "drop_oldest"),
+            max_concurrent_extractions=int(os.environ.get("MEDICAL_NLP_WS_MAX_EXTRACTIONS", 4)),
+            max_message_chars=int(os.environ.get("MEDICAL_NLP_WS_MAX_MESSAGE_CHARS", 10000)),
+        )
+
+
+class _MessageQueue:
+    """Bounded FIFO for a single consumer on the event loop; producers apply the full-queue policy"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.items: Deque[Any] = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def full(self) -> bool:
+        return len(self.items) >= self.maxsize
+
+    def put(self, item: Any):
+        self.items.append(item)
+        self._ready.set()
+
+    async def get(self) -> Any:
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.items.popleft()
+
+
+class StreamConnection:
+    """One live socket with its queues and counters"""
+
+    def __init__(self, connection_id: int, websocket: WebSocket, limits: StreamLimits):
+        self.id = connection_id
+        self.websocket = websocket
+        self.connected_at = time.time()
+        self.inbound = _MessageQueue(limits.inbound_queue_size)
+        self.outbound = _MessageQueue(limits.outbound_queue_size)
+        self.received = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.results_dropped = 0
+        # Inbound messages shed since the last result, reported with the next one
+        self.pending_dropped = 0
+        self.overloaded = asyncio.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "age": round(time.time() - self.connected_at, 1),
+            "inbound_depth": len(self.inbound),
+            "outbound_depth": len(self.outbound),
+            "received": self.received,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "results_dropped": self.results_dropped
+        }
+
+
+class StreamConnectionManager:
+    """Holds every live streaming socket and the extractor they share"""
+
+    def __init__(self, extractor_factory: Callable[[], Any], limits: Optional[StreamLimits] = None):
+        self.extractor_factory = extractor_factory
+        self.limits = limits or StreamLimits.from_env()
+        self.connections: Dict[int, StreamConnection] = {}
+        self._extractor = None
+        self._extractor_lock = asyncio.Lock()
+        self._extraction_slots: Optional[asyncio.Semaphore] = None
+        self._ids = itertools.count(1)
+        self._totals = {"accepted": 0, "rejected_connections": 0, "closed_slow_readers": 0}
+        # Counters of closed connections, so totals survive disconnects
+        self._closed = {"received": 0, "processed": 0, "coalesced": 0, "dropped": 0,
+                        "rejected": 0, "results_dropped": 0}
+
+    async def serve(self, websocket: WebSocket):
+        """Run one socket until the client disconnects or is closed for being too slow"""
+        if len(self.connections) >= self.limits.max_connections:
+            self._totals["rejected_connections"] += 1
+            logger.warning(f"Rejecting WebSocket: {len(self.connections)} connections open")
+            await websocket.close(code=CLOSE_OVERLOADED)
+            return
+
+        connection = StreamConnection(next(self._ids), websocket, self.limits)
+        # Registered before the handshake is awaited, so concurrent handshakes count against the cap
+        self.connections[connection.id] = connection
+        tasks = []
+        try:
+            await websocket.accept()
+            self._totals["accepted"] += 1
+            tasks = [
+                asyncio.create_task(self._receive(connection)),
+                asyncio.create_task(self._process(connection)),
+                asyncio.create_task(self._send(connection)),
+            ]
+            overloaded = asyncio.create_task(connection.overloaded.wait())
+            tasks.append(overloaded)
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if overloaded in done:
+                self._totals["closed_slow_readers"] += 1
+                logger.warning(f"Closing slow WebSocket reader {connection.id}")
+                await websocket.close(code=CLOSE_OVERLOADED)
+            for task in done:
+                error = None if task is overloaded else task.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    logger.error(f"WebSocket connection {connection.id} failed: {str(error)}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Released before awaiting, so a serve() that is itself cancelled still frees its slot
+            del self.connections[connection.id]
+            for key in self._closed:
+                self._closed[key] += getattr(connection, key)
+            logger.info("WebSocket client disconnected")
+            if tasks:
+                # wait() rather than gather(): if serve() is being cancelled this re-raises
+                # that cancellation, not one of the cancelled tasks'
+                await asyncio.wait(tasks)
+
+    async def _receive(self, connection: StreamConnection):
+        while True:
+            text = await connection.websocket.receive_text()
+            connection.received += 1
+            if len(text) > self.limits.max_message_chars:
+                connection.rejected += 1
+                self._send_result(connection, {
+                    "type": "error",
+                    "message": f"Message longer than {self.limits.max_message_chars} characters, not processed"
+                })
+                continue
+            self._enqueue(connection, text)
+
+    def _enqueue(self, connection: StreamConnection, text: str):
+        queue = connection.inbound
+        if not queue.full():
+            queue.put(text)
+            return
+
+        policy = self.limits.inbound_policy
+        if policy == "coalesce" and len(queue.items[-1]) + len(text) < self.limits.max_message_chars:
+            queue.items[-1] = queue.items[-1] + "\n" + text
+            connection.coalesced += 1
+        elif policy == "reject":
+            connection.rejected += 1
+            self._send_result(connection, {"type": "error", "message": "Server overloaded, message not processed"})
+        else:
+            # drop_oldest, or a coalesced message that would grow past max_message_chars
+            queue.items.popleft()
+            queue.put(text)
+            connection.dropped += 1
+            connection.pending_dropped += 1
+
+    async def _process(self, connection: StreamConnection):
+        extractor = await self.extractor()
+        while True:
+            text = await connection.inbound.get()
+            try:
+                async with self._extraction_slots:
+                    entities = await run_in_threadpool(extractor.extract_entities, text)
+                message = {
+                    "type": "entities",
+                    "data": [{"text": e.text, "label": e.label} for e in entities]
+                }
+                if connection.pending_dropped:
+                    message["dropped"] = connection.pending_dropped
+                    connection.pending_dropped = 0
+            except Exception as e:
+                message = {"type": "error", "message": str(e)}
+            connection.processed += 1
+            self._send_result(connection, message)
+
+    def _send_result(self, connection: StreamConnection, message: Dict[str, Any]):
+        queue = connection.outbound
+        if queue.full():
+            if self.limits.outbound_policy == "close":
+                connection.overloaded.set()
+                return
+            queue.items.popleft()
+            connection.results_dropped += 1
+        queue.put(message)
+
+    async def _send(self, connection: StreamConnection):
+        while True:
+            message = await connection.outbound.get()
+            await connection.websocket.send_json(message)
+
+    async def extractor(self):
+        """The shared extractor, built on first use off the event loop"""
+        if self._extractor is None:
+            async with self._extractor_lock:
+                if self._extractor is None:
+                    self._extraction_slots = asyncio.Semaphore(self.limits.max_concurrent_extractions)
+                    self._extractor = await run_in_threadpool(self.extractor_factory)
+        return self._extractor
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection totals, queue policies and per-connection queue depths and counters"""
+        live = [connection.stats() for connection in self.connections.values()]
+        messages = {key: total + sum(entry[key] for entry in live) for key, total in self._closed.items()}
+        return {
+            "active": len(live),
+            **self._totals,
+            "messages": messages,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "inbound_queue_size": self.limits.inbound_queue_size,
+                "outbound_queue_size": self.limits.outbound_queue_size,
+                "inbound_policy": self.limits.inbound_policy,
+                "outbound_policy": self.limits.outbound_policy,
+                "max_concurrent_extractions": self.limits.max_concurrent_extractions,
+                "max_message_chars": self.limits.max_message_chars
+            },
+            "connections": live
+        }